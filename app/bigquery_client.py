@@ -1,45 +1,326 @@
 from google.cloud import bigquery
 from google.oauth2 import service_account
+from google.auth.transport.requests import AuthorizedSession, Request
+from requests.adapters import HTTPAdapter
+import datetime
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
+from app.configuration.config import (
+    BQ_HTTP_POOL_SIZE, BQ_TOKEN_REFRESH_MARGIN_SECONDS, BQ_STREAM_PAGE_SIZE, BQ_USE_STORAGE_API,
+    BQ_MAX_CONCURRENT_JOBS,
+)
+from app.execution.result_format import (
+    arrow_available, arrow_table_to_columnar, arrow_table_to_ipc, columnar_result, error_result,
+)
+from app.execution.pagination import with_next_page
+from app.monitoring.metrics import record_bigquery_job
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 KEY_FILE = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "bigquery-key.json")
 PROJECT_ID = os.getenv("BIGQUERY_PROJECT_ID", "")
+SCOPES = ["https://www.googleapis.com/auth/bigquery"]
+DATASET = "bigquery-public-data.thelook_ecommerce"
+
+# Bounds concurrent query jobs (BigQuery rate-limits concurrent interactive queries per project)
+_job_slots = threading.BoundedSemaphore(BQ_MAX_CONCURRENT_JOBS)
+# Job ids cancelled before their query was submitted (e.g. still waiting for a slot):
+# job id -> time the mark expires. Marks for jobs that never run expire or are
+# pushed out by newer ones.
+_cancelled_job_ids = OrderedDict()
+_cancelled_lock = threading.Lock()
+_CANCELLED_TTL_SECONDS = 3600
+_CANCELLED_MAX = 10000
+
+
+class BigQueryClientManager:
+    """
+    Process-wide BigQuery client.
+    Credentials are loaded once, the authorized HTTP session keeps a pool of
+    connections alive across queries, and the access token is refreshed in the
+    background shortly before it expires. Safe to share between threads.
+    """
+
+    def __init__(self, key_file: str, project_id: str, pool_size: int, refresh_margin: float):
+        self.key_file = key_file
+        self.project_id = project_id
+        self.pool_size = pool_size
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()     # one token request at a time, never held with _lock
+        self._credentials = None
+        self._client = None
+        self._refresh_timer = None
+        self._created_at = None
+        self._credential_loads = 0
+        self._token_refreshes = 0
+        self._acquisitions = 0
+
+    def get_client(self) -> bigquery.Client:
+        """Return the shared client, building it on first use."""
+        with self._lock:
+            if self._client is None:
+                self._build()
+            client, credentials = self._client, self._credentials
+            self._acquisitions += 1
+        if not credentials.valid:
+            # Background refresh missed (e.g. process was suspended) — refresh inline
+            self._refresh(credentials, only_if_invalid=True)
+        return client
+
+    def _build(self):
+        self._credentials = service_account.Credentials.from_service_account_file(
+            self.key_file, scopes=SCOPES
+        )
+        self._credential_loads += 1
+
+        session = AuthorizedSession(self._credentials)
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+
+        self._client = bigquery.Client(
+            credentials=self._credentials, project=self.project_id, _http=session
+        )
+        self._created_at = time.time()
+        # First use only: nothing can run a query before this token exists
+        self._credentials.refresh(Request())
+        self._token_refreshes += 1
+        self._schedule_refresh()
+
+    def _refresh(self, credentials, only_if_invalid: bool = False):
+        """
+        Fetch a new access token and schedule the next refresh. The token request
+        runs on a copy of the credentials without the manager lock, so
+        get_client() never waits for the round trip; the new token is swapped
+        into the shared credentials (and so the client's session) under the lock.
+        """
+        with self._refresh_lock:
+            if only_if_invalid and credentials.valid:
+                return          # another thread refreshed it meanwhile
+            fresh = credentials.with_scopes(SCOPES)
+            fresh.refresh(Request())
+            with self._lock:
+                if self._credentials is not credentials:
+                    return      # closed or rebuilt meanwhile
+                credentials.token, credentials.expiry = fresh.token, fresh.expiry
+                self._token_refreshes += 1
+                self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        """Caller holds the lock."""
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+        expiry = self._credentials.expiry
+        if expiry is None:
+            return
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        delay = max((expiry - now).total_seconds() - self.refresh_margin, 1.0)
+        self._refresh_timer = threading.Timer(delay, self._background_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _background_refresh(self):
+        with self._lock:
+            credentials = self._credentials
+        if credentials is None:
+            return
+        try:
+            self._refresh(credentials)
+        except Exception as e:
+            # Leave the old token; get_client() retries inline once it is invalid
+            logger.warning("BigQuery token refresh failed: %s", e)
+            with self._lock:
+                if self._credentials is credentials:
+                    self._refresh_timer = threading.Timer(30.0, self._background_refresh)
+                    self._refresh_timer.daemon = True
+                    self._refresh_timer.start()
+
+    def close(self):
+        """Drop the client and its HTTP session (e.g. on shutdown or key rotation)."""
+        with self._lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+            self._credentials = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            expiry = self._credentials.expiry if self._credentials is not None else None
+            return {
+                "connected": self._client is not None,
+                "project": self.project_id,
+                "http_pool_size": self.pool_size,
+                "age_seconds": round(time.time() - self._created_at, 1) if self._created_at else None,
+                "credential_loads": self._credential_loads,
+                "token_refreshes": self._token_refreshes,
+                "token_expiry": expiry.isoformat() + "Z" if expiry else None,
+                "acquisitions": self._acquisitions,
+            }
+
+
+client_manager = BigQueryClientManager(
+    KEY_FILE, PROJECT_ID, BQ_HTTP_POOL_SIZE, BQ_TOKEN_REFRESH_MARGIN_SECONDS
+)
 
 
 def get_client():
-    credentials = service_account.Credentials.from_service_account_file(
-        KEY_FILE,
-        scopes=["https://www.googleapis.com/auth/bigquery"]
-    )
-    return bigquery.Client(credentials=credentials, project=PROJECT_ID)
+    return client_manager.get_client()
+
 
-def execute_bigquery(sql: str) -> dict:
+def qualify_table_names(sql: str) -> str:
+    """Rewrite bare schema table names to their full backticked BigQuery path."""
+    for table in ["orders", "users", "products", "order_items"]:
+        sql = sql.replace(
+            f" {table} ",
+            f" `{DATASET}.{table}` "
+        )
+    return sql
+
+
+def execute_bigquery(sql: str, result_format: str = "rows", page_size: int = None, job_id: str = None) -> dict:
     """
     Execute SQL on BigQuery and return results.
+    result_format: "rows" (list of dicts), "columnar" or "arrow" — see result_format.py.
+    page_size: download at most this many rows; the result then carries total_rows
+    and a next_page_token that fetch_bigquery_page reads the rest with.
+    job_id: run under this BigQuery job id, so cancel_bigquery_job can stop it.
     """
     try:
         client = get_client()
-        query_job = client.query(sql)
-        results = query_job.result()
+        with _job_slots:
+            if job_id is not None:
+                with _cancelled_lock:
+                    if _cancelled_job_ids.pop(job_id, 0) > time.time():
+                        raise RuntimeError("Query cancelled.")
+            query_job = client.query(sql, job_id=job_id)
+            results = query_job.result(page_size=page_size, max_results=page_size)
+        record_bigquery_job(query_job)
+        result = _bigquery_result(results, result_format)
+        if page_size is None:
+            return result
 
-        rows = [dict(row) for row in results]
-        columns = list(rows[0].keys()) if rows else []
-
-        return {
-            "success": True,
-            "columns": columns,
-            "rows": rows,
-            "row_count": len(rows),
-            "error": None
+        # The finished job's (anonymous) destination table holds the full result
+        destination = query_job.destination
+        state = {
+            "engine": "bigquery",
+            "table": f"{destination.project}.{destination.dataset_id}.{destination.table_id}",
+            "format": result_format,
+            "page_size": page_size,
+            "offset": 0,
         }
+        total_rows = results.total_rows or 0
+        return with_next_page(result, state, result["row_count"] < total_rows, total_rows)
     except Exception as e:
-        return {
-            "success": False,
-            "columns": [],
-            "rows": [],
-            "row_count": 0,
-            "error": str(e)
-        }
+        return error_result(result_format, str(e))
+
+
+def fetch_bigquery_page(state: dict) -> dict:
+    """
+    Read the page a next_page_token points at straight from the query's
+    destination table (tabledata.list); nothing is re-run or re-billed.
+    """
+    result_format = state["format"]
+    try:
+        results = get_client().list_rows(
+            state["table"], start_index=state["offset"],
+            max_results=state["page_size"], page_size=state["page_size"],
+        )
+        result = _bigquery_result(results, result_format)
+        total_rows = results.total_rows or 0
+        return with_next_page(result, state, state["offset"] + result["row_count"] < total_rows, total_rows)
+    except Exception as e:
+        return error_result(result_format, str(e))
+
+
+def _bigquery_result(results, result_format: str) -> dict:
+    if result_format != "rows":
+        return _columnar_bigquery_result(results, result_format)
+
+    rows = [dict(row) for row in results]
+    columns = list(rows[0].keys()) if rows else []
+
+    return {
+        "success": True,
+        "columns": columns,
+        "rows": rows,
+        "row_count": len(rows),
+        "error": None
+    }
+
+
+def _columnar_bigquery_result(results, result_format: str) -> dict:
+    """
+    Download the result as Arrow (through the Storage Read API when available)
+    instead of building one dict per row.
+    """
+    types = [field.field_type for field in results.schema]
+    if arrow_available():
+        table = results.to_arrow(create_bqstorage_client=BQ_USE_STORAGE_API)
+        if result_format == "arrow":
+            return arrow_table_to_ipc(table, types)
+        return arrow_table_to_columnar(table, types)
+
+    if result_format == "arrow":
+        raise RuntimeError("result_format 'arrow' requires pyarrow to be installed.")
+    columns = [field.name for field in results.schema]
+    data = [[] for _ in columns]
+    for row in results:
+        for values, value in zip(data, row.values()):
+            values.append(value)
+    return columnar_result(columns, types, data)
+
+
+def cancel_bigquery_job(job_id: str) -> bool:
+    """
+    Ask BigQuery to cancel a query job. Returns False if the job does not exist
+    (yet): execute_bigquery then refuses to submit it under this id.
+    """
+    try:
+        get_client().cancel_job(job_id)
+        return True
+    except Exception as e:
+        logger.info("BigQuery job %s not cancelled: %s", job_id, e)
+        _mark_cancelled(job_id)
+        return False
+
+
+def _mark_cancelled(job_id: str):
+    now = time.time()
+    with _cancelled_lock:
+        _cancelled_job_ids.pop(job_id, None)
+        _cancelled_job_ids[job_id] = now + _CANCELLED_TTL_SECONDS
+        while _cancelled_job_ids:
+            oldest, expires_at = next(iter(_cancelled_job_ids.items()))
+            if expires_at > now and len(_cancelled_job_ids) <= _CANCELLED_MAX:
+                break
+            del _cancelled_job_ids[oldest]
+
+
+def dry_run_bytes(sql: str) -> int:
+    """Bytes BigQuery would process for this SQL, from a dry run (nothing is billed or executed)."""
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    query_job = get_client().query(sql, job_config=job_config)
+    return query_job.total_bytes_processed or 0
+
+
+def iter_bigquery_pages(sql: str, page_size: int = BQ_STREAM_PAGE_SIZE):
+    """
+    Execute SQL on BigQuery and yield (columns, rows) one result page at a time,
+    so callers can forward rows before the whole result has been downloaded.
+    """
+    client = get_client()
+    with _job_slots:
+        query_job = client.query(sql)
+        results = query_job.result(page_size=page_size)
+    record_bigquery_job(query_job)
+    columns = [field.name for field in results.schema]
+    for page in results.pages:
+        yield columns, [dict(row) for row in page]
@@ -0,0 +1,215 @@
+"""
+question_cache.py - Cache of pipeline results keyed on the normalized question
+plus the schema fingerprint, so entries die with a schema change. Exact match is
+tried first, then (optionally) a near-duplicate match on the question's content
+tokens. No LLM is used here.
+"""
+import copy
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from app.schemas.schema_index import get_schema_index
+from app.monitoring.metrics import record_cache_lookup
+from app.cache.backends import MemoryCacheBackend, DiskCacheBackend
+from app.configuration.config import (
+    QUESTION_CACHE_ENABLED, QUESTION_CACHE_BACKEND, QUESTION_CACHE_PATH,
+    QUESTION_CACHE_TTL_SECONDS, QUESTION_CACHE_MAX_ENTRIES, QUESTION_CACHE_SIMILARITY,
+)
+
+# Filler words that do not change what a question asks for
+STOPWORDS = {
+    'a', 'an', 'the', 'me', 'my', 'us', 'our', 'please', 'show', 'list', 'give',
+    'get', 'find', 'display', 'tell', 'what', 'which', 'are', 'is', 'was', 'were',
+    'of', 'for', 'all', 'to', 'can', 'you', 'i', 'want', 'see', 'return', 'there',
+}
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = re.sub(r"[^\w\s.%'-]", " ", text)
+    text = re.sub(r"(?<!\d)[.](?!\d)", " ", text)
+    return " ".join(text.split())
+
+
+def content_tokens(normalized: str) -> frozenset:
+    """Tokens used for near-duplicate matching: no stopwords, naive singular form."""
+    tokens = set()
+    for tok in normalized.split():
+        if tok in STOPWORDS:
+            continue
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss") and not tok[0].isdigit():
+            tok = tok[:-1]
+        tokens.add(tok)
+    return frozenset(tokens)
+
+
+def _numbers(tokens: frozenset) -> frozenset:
+    return frozenset(t for t in tokens if any(ch.isdigit() for ch in t))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class QuestionCache:
+    """
+    TTL + LRU cache in front of process_question.
+    Values are the pipeline result dicts; only successful results are stored.
+    """
+
+    def __init__(self, backend, ttl: float, similarity: float = 0.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.similarity = similarity
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Near-duplicate index: key -> content tokens (oldest first, at most the
+        # backend's max_entries) and token -> keys whose question contains it
+        self._tokens = OrderedDict()
+        self._postings = {}
+        if similarity > 0:
+            for key, entry in backend.items():
+                self._index(key, frozenset(entry.get("tokens", [])))
+
+    def _index(self, key: str, tokens: frozenset):
+        """Add a key to the near-duplicate index (caller holds the lock, or is __init__)."""
+        self._unindex(key)
+        self._tokens[key] = tokens
+        for token in tokens:
+            self._postings.setdefault(token, set()).add(key)
+        # The backend evicts silently; never index more keys than it can hold
+        while len(self._tokens) > self.backend.max_entries:
+            self._unindex(next(iter(self._tokens)))
+
+    def _unindex(self, key: str):
+        tokens = self._tokens.pop(key, None)
+        for token in tokens or ():
+            keys = self._postings.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[token]
+
+    def _forget(self, key: str):
+        """Drop a key the backend no longer has (expired or evicted)."""
+        if self.similarity > 0:
+            with self._lock:
+                self._unindex(key)
+
+    def _key(self, fingerprint: str, normalized: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\x00{normalized}".encode()).hexdigest()
+
+    def get(self, question: str):
+        """Return a copy of the cached result for this question, or None."""
+        fingerprint = get_schema_index().fingerprint
+        normalized = normalize_question(question)
+        key = self._key(fingerprint, normalized)
+        entry = self.backend.get(key)
+        if entry is None:
+            self._forget(key)
+        else:
+            with self._lock:
+                self.hits += 1
+            record_cache_lookup("question", "hit")
+            return self._hit(entry, question)
+
+        if self.similarity > 0:
+            entry = self._near_duplicate(fingerprint, content_tokens(normalized))
+            if entry is not None:
+                with self._lock:
+                    self.near_hits += 1
+                record_cache_lookup("question", "near_hit")
+                return self._hit(entry, question)
+
+        with self._lock:
+            self.misses += 1
+        record_cache_lookup("question", "miss")
+        return None
+
+    def put(self, question: str, result: dict):
+        """Store a successful pipeline result."""
+        if not result.get("success"):
+            return
+        fingerprint = get_schema_index().fingerprint
+        normalized = normalize_question(question)
+        key = self._key(fingerprint, normalized)
+        tokens = content_tokens(normalized)
+        stored = {k: v for k, v in result.items() if k != "cache_hit"}
+        self.backend.set(key, {
+            "fingerprint": fingerprint,
+            "tokens": sorted(tokens),
+            "result": stored,
+        }, self.ttl)
+        if self.similarity > 0:
+            with self._lock:
+                self._index(key, tokens)
+
+    def _near_duplicate(self, fingerprint: str, tokens: frozenset):
+        """
+        The best live entry at least `similarity` alike. Only questions sharing a
+        token can reach a Jaccard score above 0, so only those are scored.
+        """
+        numbers = _numbers(tokens)
+        with self._lock:
+            keys = set().union(*(self._postings.get(token, ()) for token in tokens))
+            candidates = [(key, self._tokens[key]) for key in keys]
+
+        scored = []
+        for key, cand_tokens in candidates:
+            # Never treat "top 5" and "top 10" as the same question
+            if _numbers(cand_tokens) != numbers:
+                continue
+            score = _jaccard(tokens, cand_tokens)
+            if score >= self.similarity:
+                scored.append((score, key))
+
+        for _, key in sorted(scored, reverse=True):
+            entry = self.backend.get(key)
+            if entry is not None and entry.get("fingerprint") == fingerprint:
+                return entry
+            self._forget(key)
+        return None
+
+    def _hit(self, entry: dict, question: str) -> dict:
+        result = copy.deepcopy(entry["result"])
+        result["question"] = question
+        result["cache_hit"] = True
+        return result
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self._tokens.clear()
+            self._postings.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self.backend),
+                "indexed_questions": len(self._tokens),
+                "hits": self.hits,
+                "near_duplicate_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _build_question_cache():
+    if not QUESTION_CACHE_ENABLED:
+        return None
+    if QUESTION_CACHE_BACKEND == "disk":
+        backend = DiskCacheBackend(QUESTION_CACHE_PATH, QUESTION_CACHE_MAX_ENTRIES)
+    else:
+        backend = MemoryCacheBackend(QUESTION_CACHE_MAX_ENTRIES)
+    return QuestionCache(backend, QUESTION_CACHE_TTL_SECONDS, QUESTION_CACHE_SIMILARITY)
+
+
+question_cache = _build_question_cache()
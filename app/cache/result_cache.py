@@ -0,0 +1,232 @@
+"""
+result_cache.py - Cache of executed query results keyed on the canonical SQL
+(whitespace, keyword case and table aliases normalized) plus the dataset and
+result format, so different questions that compile to the same query, and
+dashboards re-running it, skip the warehouse round trip.
+Payloads are stored as (optionally zlib-compressed) JSON and evicted least
+recently used once their total size exceeds RESULT_CACHE_MAX_BYTES.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from app.validation.sql_parser import canonical_sql
+from app.execution.result_format import json_default
+from app.monitoring.metrics import record_cache_lookup
+from app.configuration.config import (
+    RESULT_CACHE_ENABLED, RESULT_CACHE_BACKEND, RESULT_CACHE_PATH, RESULT_CACHE_TTL_SECONDS,
+    RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ENTRY_BYTES, RESULT_CACHE_COMPRESS, RESULT_TOKEN_TTL_SECONDS,
+)
+
+
+class MemoryResultStore:
+    """In-process LRU of payload bytes, bounded by their total size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._data = OrderedDict()   # key -> (payload, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return payload
+
+    def set(self, key: str, payload: bytes, ttl: float):
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (payload, time.time() + ttl)
+            self.total_bytes += len(payload)
+            while self.total_bytes > self.max_bytes and self._data:
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= len(entry[0])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskResultStore:
+    """SQLite-backed store of payload bytes, shared across restarts and worker processes."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " payload BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results(last_access)")
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+        return bytes(row[0])
+
+    def set(self, key: str, payload: bytes, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, payload, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now + ttl, now),
+            )
+            # Drop least recently used rows until the running total fits
+            self._conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                " SELECT key FROM ("
+                "  SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key) AS running FROM results"
+                " ) WHERE running > ?)",
+                (self.max_bytes,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+class ResultCache:
+    """
+    TTL + size-bounded LRU cache in front of execute_bigquery / execute_query.
+    Only successful results are stored; results over max_entry_bytes are skipped.
+    """
+
+    def __init__(self, store, ttl: float, max_entry_bytes: int, compress: bool = True):
+        self.store = store
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def _key(self, sql: str, dataset: str, result_format: str, page_size: int = None) -> str:
+        # A first page and the whole result are different entries
+        paging = "" if page_size is None else f"\x00page={page_size}"
+        return hashlib.sha256(f"{dataset}\x00{result_format}{paging}\x00{canonical_sql(sql)}".encode()).hexdigest()
+
+    def get(self, sql: str, dataset: str, result_format: str = "rows", page_size: int = None):
+        """Return the cached result dict for this query (its first page when page_size is set), or None."""
+        payload = self.store.get(self._key(sql, dataset, result_format, page_size))
+        if payload is None:
+            with self._lock:
+                self.misses += 1
+            record_cache_lookup("result", "miss")
+            return None
+        with self._lock:
+            self.hits += 1
+        record_cache_lookup("result", "hit")
+        if self.compress:
+            payload = zlib.decompress(payload)
+        return json.loads(payload)
+
+    def put(self, sql: str, dataset: str, result_format: str, result: dict, ttl: float = None,
+            page_size: int = None):
+        """Store a successful result; ttl overrides the default for this entry."""
+        if not result.get("success"):
+            return
+        ttl = self.ttl if ttl is None else ttl
+        if result.get("next_page_token"):
+            # A cached first page must not outlive its continuation token
+            ttl = min(ttl, RESULT_TOKEN_TTL_SECONDS)
+        payload = json.dumps(result, default=json_default, separators=(",", ":")).encode()
+        if self.compress:
+            payload = zlib.compress(payload, 6)
+        if len(payload) > self.max_entry_bytes:
+            with self._lock:
+                self.skipped += 1
+            return
+        self.store.set(self._key(sql, dataset, result_format, page_size), payload, ttl)
+
+    def execute(self, executor, sql: str, dataset: str, result_format: str = "rows", page_size: int = None) -> tuple:
+        """
+        Serve from the cache, or run executor(sql, result_format[, page_size]) and store its result.
+        Returns (result, cache_hit).
+        """
+        cached = self.get(sql, dataset, result_format, page_size)
+        if cached is not None:
+            return cached, True
+        if page_size is None:
+            result = executor(sql, result_format)
+        else:
+            result = executor(sql, result_format, page_size)
+        self.put(sql, dataset, result_format, result, page_size=page_size)
+        return result, False
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.store),
+                "bytes": self.store.total_bytes,
+                "max_bytes": self.store.max_bytes,
+                "compressed": self.compress,
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped_too_large": self.skipped,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _build_result_cache():
+    if not RESULT_CACHE_ENABLED:
+        return None
+    if RESULT_CACHE_BACKEND == "disk":
+        store = DiskResultStore(RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES)
+    else:
+        store = MemoryResultStore(RESULT_CACHE_MAX_BYTES)
+    return ResultCache(store, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_MAX_ENTRY_BYTES, RESULT_CACHE_COMPRESS)
+
+
+result_cache = _build_result_cache()
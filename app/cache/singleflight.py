@@ -0,0 +1,71 @@
+"""
+singleflight.py - Request coalescing. Concurrent calls with the same key share
+one in-flight computation and all receive its result (or its exception), so a
+burst of identical questions or queries costs one LLM pipeline / one warehouse
+job. Nothing is kept once the computation finishes; caching is the job of
+question_cache.py and result_cache.py.
+"""
+import asyncio
+from app.monitoring.metrics import COALESCED
+
+
+class _Call:
+    """One in-flight computation plus the progress listeners of everyone waiting on it."""
+
+    def __init__(self):
+        self.task = None
+        self.events = []
+        self.listeners = []
+
+    def emit(self, event: str, data):
+        self.events.append((event, data))
+        for listener in list(self.listeners):
+            listener(event, data)
+
+    def subscribe(self, listener):
+        # Late joiners first get the events they missed
+        for event, data in self.events:
+            listener(event, data)
+        self.listeners.append(listener)
+
+
+class SingleFlight:
+    """
+    Per-event-loop map of key -> in-flight task.
+    The computation is shielded: a waiter that is cancelled (client disconnect)
+    does not cancel it for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}   # (loop, key) -> _Call
+
+    async def do(self, key: str, factory, listener=None) -> tuple:
+        """
+        Run factory(emit) for this key unless it is already running, and await it.
+        emit(event, data) is forwarded to the listener of every waiter.
+        Returns (value, shared): shared is True when another caller started the work.
+        """
+        flight_key = (asyncio.get_running_loop(), key)
+        call = self._calls.get(flight_key)
+        shared = call is not None
+        if call is None:
+            call = self._calls[flight_key] = _Call()
+            call.task = asyncio.ensure_future(factory(call.emit))
+            call.task.add_done_callback(lambda _: self._forget(flight_key, call))
+        COALESCED.inc(flight=self.name, role="follower" if shared else "leader")
+
+        if listener is not None:
+            call.subscribe(listener)
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            if listener is not None:
+                call.listeners.remove(listener)
+
+    def _forget(self, flight_key, call):
+        if self._calls.get(flight_key) is call:
+            del self._calls[flight_key]
+        if not call.task.cancelled():
+            # Mark the exception retrieved even if every waiter went away; waiters re-raise it
+            call.task.exception()
@@ -6,11 +6,129 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 GROQ_MODEL = "llama-3.3-70b-versatile"    
 MAX_RETRIES = 3
+LOG_LEVEL   = os.getenv("LOG_LEVEL", "WARNING")   # pipeline progress is logged at INFO / DEBUG
+
+# two_stage: intent call, then SQL call. combined: one call returning both,
+# falling back to two_stage when its SQL fails validation. Overridable per request.
+PIPELINE_MODES = ("two_stage", "combined")
+PIPELINE_MODE  = os.getenv("PIPELINE_MODE", "two_stage")
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"   # rule-based answers for simple questions, no LLM
+SQL_COMPILER_ENABLED = os.getenv("SQL_COMPILER_ENABLED", "true").lower() == "true"   # two_stage: compile the intent to SQL locally, LLM only as fallback
+# >1: the LLM SQL stage asks for this many candidates in parallel and keeps the first
+# that validates and passes the cost gate (one round trip instead of MAX_RETRIES in a row)
+SQL_CANDIDATES            = int(os.getenv("SQL_CANDIDATES", "1"))
+SQL_CANDIDATE_TEMPERATURE = float(os.getenv("SQL_CANDIDATE_TEMPERATURE", "0.7"))   # for every candidate after the first
+PIPELINE_STATS_WINDOW = int(os.getenv("PIPELINE_STATS_WINDOW", "1000"))   # latency samples kept per mode
+
+# --- LLM HTTP client (shared, keep-alive) ---
+LLM_MAX_CONNECTIONS           = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+LLM_TIMEOUT_SECONDS           = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_CONCURRENT_REQUESTS   = int(os.getenv("LLM_MAX_CONCURRENT_REQUESTS", "16"))   # in-flight Groq completions (AIMD ceiling)
+
+# --- LLM routing and hedging (app/llm/router.py); models are "provider:model", a bare name is a Groq model ---
+LLM_INTENT_MODEL                = os.getenv("LLM_INTENT_MODEL", GROQ_MODEL)   # e.g. llama-3.1-8b-instant: small and fast
+LLM_SQL_MODEL                   = os.getenv("LLM_SQL_MODEL", GROQ_MODEL)      # SQL generation and combined mode
+LLM_HEDGE_MODEL                 = os.getenv("LLM_HEDGE_MODEL", "")            # duplicate slow calls here; empty = no hedging
+LLM_HEDGE_PERCENTILE            = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))   # hedge calls slower than this percentile
+LLM_HEDGE_MIN_DELAY_SECONDS     = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.25"))
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "2.0"))   # until enough latencies are known
+LLM_HEDGE_MIN_SAMPLES           = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_LATENCY_WINDOW              = int(os.getenv("LLM_LATENCY_WINDOW", "500"))   # latencies kept per stage and model
+LLM_STREAMING_ENABLED           = os.getenv("LLM_STREAMING_ENABLED", "false").lower() == "true"   # stop reading at the end of the JSON object / SQL statement
+
+# --- LLM scheduler (rate limits, adaptive concurrency, priorities; see app/llm/scheduler.py) ---
+LLM_RATE_LIMIT_RPM            = int(os.getenv("LLM_RATE_LIMIT_RPM", "0"))       # requests/min of your Groq tier; 0 = unlimited
+LLM_RATE_LIMIT_TPM            = int(os.getenv("LLM_RATE_LIMIT_TPM", "0"))       # tokens/min (prompt + completion); 0 = unlimited
+LLM_COMPLETION_TOKEN_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", "300"))   # reserved per call until usage is known
+LLM_MIN_CONCURRENCY           = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))      # AIMD floor after repeated 429s
+LLM_RETRIES                   = int(os.getenv("LLM_RETRIES", "4"))              # on 429 / 5xx / connection errors
+LLM_BACKOFF_BASE_SECONDS      = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))   # doubled per retry unless retry-after says otherwise
+LLM_BACKOFF_MAX_SECONDS       = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "30"))
+
+
+# --- BigQuery client ---
+BQ_HTTP_POOL_SIZE               = int(os.getenv("BQ_HTTP_POOL_SIZE", "32"))
+BQ_TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("BQ_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+BQ_STREAM_PAGE_SIZE             = int(os.getenv("BQ_STREAM_PAGE_SIZE", "1000"))
+BQ_USE_STORAGE_API              = os.getenv("BQ_USE_STORAGE_API", "true").lower() == "true"   # Arrow downloads via Storage Read API
+BQ_MAX_CONCURRENT_JOBS          = int(os.getenv("BQ_MAX_CONCURRENT_JOBS", "8"))   # query jobs running at once
+
+# Cost gate: dry-run every generated query before it is accepted
+COST_GATE_ENABLED               = os.getenv("COST_GATE_ENABLED", "true").lower() == "true"
+COST_GATE_MAX_BYTES             = int(os.getenv("COST_GATE_MAX_BYTES", str(1024 ** 3)))    # 1 GiB
+COST_GATE_ACTION                = os.getenv("COST_GATE_ACTION", "rewrite")   # rewrite (then reject) | reject
+COST_GATE_ROW_LIMIT             = int(os.getenv("COST_GATE_ROW_LIMIT", "10000"))           # LIMIT injected by rewrites
+COST_ESTIMATE_CACHE_TTL_SECONDS = int(os.getenv("COST_ESTIMATE_CACHE_TTL_SECONDS", "3600"))
+COST_ESTIMATE_CACHE_MAX_ENTRIES = int(os.getenv("COST_ESTIMATE_CACHE_MAX_ENTRIES", "4096"))
 
 
 # --- PostgreSQL Settings ---
+EXECUTION_ENGINE = os.getenv("EXECUTION_ENGINE", "bigquery")   # bigquery | postgres (run /ask and /ask/stream on the database below)
 DB_HOST     = os.getenv("DB_HOST", "localhost")
 DB_PORT     = os.getenv("DB_PORT", "5432")
 DB_NAME     = os.getenv("DB_NAME", "nl2sql_db")
 DB_USER     = os.getenv("DB_USER", "postgres")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "1234567")
\ No newline at end of file
+DB_PASSWORD = os.getenv("DB_PASSWORD", "1234567")
+
+# Connection pool
+DB_POOL_MIN                 = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX                 = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT_SECONDS     = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))
+DB_POOL_HEALTHCHECK_SECONDS = float(os.getenv("DB_POOL_HEALTHCHECK_SECONDS", "30"))  # ping connections idle longer than this
+DB_STREAM_BATCH_SIZE        = int(os.getenv("DB_STREAM_BATCH_SIZE", "1000"))   # rows per fetchmany from a server-side cursor
+DB_PAGE_CURSORS_MAX         = int(os.getenv("DB_PAGE_CURSORS_MAX", "4"))       # paged results kept open for their next page (each holds a connection)
+DB_PAGE_CURSOR_IDLE_SECONDS = float(os.getenv("DB_PAGE_CURSOR_IDLE_SECONDS", "120"))   # close an open page cursor unread this long
+
+# --- Question Cache (in front of process_question) ---
+QUESTION_CACHE_ENABLED     = os.getenv("QUESTION_CACHE_ENABLED", "true").lower() == "true"
+QUESTION_CACHE_BACKEND     = os.getenv("QUESTION_CACHE_BACKEND", "memory")     # memory | disk
+QUESTION_CACHE_PATH        = os.getenv("QUESTION_CACHE_PATH", ".cache/question_cache.sqlite3")
+QUESTION_CACHE_TTL_SECONDS = int(os.getenv("QUESTION_CACHE_TTL_SECONDS", "3600"))
+QUESTION_CACHE_MAX_ENTRIES = int(os.getenv("QUESTION_CACHE_MAX_ENTRIES", "1024"))
+QUESTION_CACHE_SIMILARITY  = float(os.getenv("QUESTION_CACHE_SIMILARITY", "0"))  # 0 disables near-duplicate matching
+
+# --- Result Cache (executed query results, keyed on canonical SQL + dataset) ---
+RESULT_CACHE_ENABLED         = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_BACKEND         = os.getenv("RESULT_CACHE_BACKEND", "memory")     # memory | disk
+RESULT_CACHE_PATH            = os.getenv("RESULT_CACHE_PATH", ".cache/result_cache.sqlite3")
+RESULT_CACHE_TTL_SECONDS     = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "300"))
+RESULT_CACHE_MAX_BYTES       = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))   # stored payload bytes
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", str(8 * 1024 ** 2)))  # larger results are not cached
+RESULT_CACHE_COMPRESS        = os.getenv("RESULT_CACHE_COMPRESS", "true").lower() == "true"       # zlib payloads
+
+# --- Result paging (first page inline, the rest from /results/{token}) ---
+RESULT_PAGE_SIZE         = int(os.getenv("RESULT_PAGE_SIZE", "1000"))       # rows per page; 0 = whole result at once
+RESULT_MAX_PAGE_SIZE     = int(os.getenv("RESULT_MAX_PAGE_SIZE", "10000"))  # upper bound for a requested page_size
+RESULT_TOKEN_SECRET      = os.getenv("RESULT_TOKEN_SECRET", "")             # HMAC key; empty = random per process
+RESULT_TOKEN_TTL_SECONDS = int(os.getenv("RESULT_TOKEN_TTL_SECONDS", "3600"))  # BigQuery keeps result tables ~24h
+
+# --- Async jobs (POST /jobs, then poll GET /jobs/{id} or subscribe to its events) ---
+JOBS_ENABLED      = os.getenv("JOBS_ENABLED", "true").lower() == "true"
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "memory")     # memory | disk (shared by workers)
+JOB_STORE_PATH    = os.getenv("JOB_STORE_PATH", ".cache/jobs.sqlite3")
+JOB_TTL_SECONDS   = int(os.getenv("JOB_TTL_SECONDS", "3600"))     # jobs are dropped this long after their last update
+JOB_MAX_STORED    = int(os.getenv("JOB_MAX_STORED", "1000"))
+JOB_MAX_ACTIVE    = int(os.getenv("JOB_MAX_ACTIVE", "100"))       # queued + running per process; more is refused (429)
+JOB_CONCURRENCY   = int(os.getenv("JOB_CONCURRENCY", "8"))        # jobs running at once per process
+JOB_POLL_SECONDS  = float(os.getenv("JOB_POLL_SECONDS", "0.5"))   # event subscription to a job owned by another worker
+
+# --- Batch endpoint (/ask/batch) ---
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+BATCH_CONCURRENCY   = int(os.getenv("BATCH_CONCURRENCY", "8"))    # questions in flight per batch
+
+# Single-flight: concurrent identical questions / SQL executions share one computation
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# --- Schema pruning (local retrieval ahead of the LLM prompts) ---
+SCHEMA_PRUNING_ENABLED     = os.getenv("SCHEMA_PRUNING_ENABLED", "true").lower() == "true"
+SCHEMA_PRUNING_TOP_K       = int(os.getenv("SCHEMA_PRUNING_TOP_K", "8"))          # tables sent to intent extraction
+SCHEMA_PRUNING_MAX_COLUMNS = int(os.getenv("SCHEMA_PRUNING_MAX_COLUMNS", "40"))   # per table; keys are always kept
+
+# --- Schema catalog (live INFORMATION_SCHEMA introspection; off = schema.py only) ---
+CATALOG_ENABLED         = os.getenv("CATALOG_ENABLED", "false").lower() == "true"
+CATALOG_SOURCE          = os.getenv("CATALOG_SOURCE", "bigquery")        # bigquery | postgres
+CATALOG_SNAPSHOT_PATH   = os.getenv("CATALOG_SNAPSHOT_PATH", ".cache/catalog.json")
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "600"))   # 0 = refresh once at startup only
+CATALOG_TABLES          = [t.strip() for t in os.getenv("CATALOG_TABLES", "").split(",") if t.strip()]  # empty = every table
+CATALOG_PG_SCHEMA       = os.getenv("CATALOG_PG_SCHEMA", "public")
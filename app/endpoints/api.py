@@ -1,17 +1,74 @@
 """
 api.py - FastAPI application exposing NL2SQL as a REST API.
 """
+import asyncio
+import copy
+import functools
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from app.services.NL2sql import process_question
-from app.execution.database import execute_query, test_connection
-from app.bigquery_client import execute_bigquery
+from starlette.concurrency import iterate_in_threadpool
+from app.services.NL2sql import process_question_async
+from app.llm.gemini_client import aclose_async_client
+from app.llm.scheduler import llm_priority, scheduler_stats, PRIORITY_BATCH
+from app.llm.router import router
+from app.execution.database import execute_query, fetch_postgres_page, stream_query, test_connection, close_pool
+from app.bigquery_client import (
+    execute_bigquery, fetch_bigquery_page, client_manager, qualify_table_names, iter_bigquery_pages, DATASET,
+)
+from app.cache.question_cache import question_cache, normalize_question
+from app.cache.result_cache import result_cache
+from app.cache.singleflight import SingleFlight
+from app.validation.sql_parser import canonical_sql
+from app.execution.result_format import RESULT_FORMATS, json_default
+from app.execution.pagination import decode_page_token, InvalidPageToken, ExpiredPageToken
+from app.monitoring.pipeline_stats import pipeline_stats
+from app.monitoring.metrics import track_request, stage_timer, render_metrics
+from app.execution.cost_gate import estimator as cost_estimator
+from app.schemas.catalog import catalog
+from app.jobs.job_manager import job_manager, JobLimitExceeded
+from app.schemas.schema_index import get_schema_index
+from app.configuration.config import (
+    PIPELINE_MODES, LOG_LEVEL, COST_GATE_ENABLED, COST_GATE_MAX_BYTES, BQ_STREAM_PAGE_SIZE,
+    SINGLE_FLIGHT_ENABLED, BATCH_MAX_QUESTIONS, BATCH_CONCURRENCY, RESULT_PAGE_SIZE, RESULT_MAX_PAGE_SIZE,
+    EXECUTION_ENGINE, DB_NAME,
+)
+
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+logger = logging.getLogger(__name__)
+
+execution_flight = SingleFlight("execution")
+
+# Result cache / single-flight namespace of the engine queries run on
+RESULT_DATASET = f"postgres:{DB_NAME}" if EXECUTION_ENGINE == "postgres" else DATASET
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if catalog is not None:
+        # Snapshot only; introspection runs on the catalog's background timer
+        await asyncio.to_thread(catalog.start)
+    yield
+    if catalog is not None:
+        catalog.stop()
+    if job_manager is not None:
+        await job_manager.close()
+    await aclose_async_client()
+    client_manager.close()
+    close_pool()
+
 
 app = FastAPI(
     title="NL2SQL API",
     description="Convert natural language questions to SQL and execute on PostgreSQL",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -26,6 +83,9 @@ app.add_middleware(
 
 class QuestionRequest(BaseModel):
     question: str
+    result_format: str = "rows"     # rows | columnar | arrow
+    mode: str | None = None         # two_stage | combined (default: PIPELINE_MODE)
+    page_size: int | None = None    # rows in db_result (default: RESULT_PAGE_SIZE)
 
 class NL2SQLResponse(BaseModel):
     question: str
@@ -36,6 +96,44 @@ class NL2SQLResponse(BaseModel):
     success: bool
     message: str
     attempts: int
+    cache_hit: bool = False
+    result_cache_hit: bool = False
+    coalesced: bool = False
+    fast_path: bool = False
+    compiled: bool = False
+    repairs: list = []
+    mode: str | None = None
+    fallback: bool = False
+    cost: dict | None = None
+    timings: dict | None = None
+
+
+class BatchRequest(BaseModel):
+    questions: list[str]
+    result_format: str = "rows"
+    mode: str | None = None
+    page_size: int | None = None
+
+class BatchResponse(BaseModel):
+    results: list[NL2SQLResponse]
+    unique_questions: int
+    total_ms: float
+
+
+def _check_request(request: QuestionRequest):
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+    if request.mode is not None and request.mode not in PIPELINE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(PIPELINE_MODES)}.")
+    if request.page_size is not None and not 1 <= request.page_size <= RESULT_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"page_size must be between 1 and {RESULT_MAX_PAGE_SIZE}.")
+
+
+def _page_size(requested: int | None) -> int | None:
+    """Rows to return inline; None = the whole result (RESULT_PAGE_SIZE=0 and no page_size given)."""
+    if requested is not None:
+        return requested
+    return RESULT_PAGE_SIZE or None
 
 
 # --- Routes ---
@@ -55,28 +153,127 @@ def health():
     }
 
 
-@app.post("/ask", response_model=NL2SQLResponse)
-def ask(request: QuestionRequest):
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters for the question cache."""
+    if question_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **question_cache.stats()}
+
+
+@app.get("/cache/results/stats")
+def result_cache_stats():
+    """Hit/miss counters and stored bytes for the executed-query result cache."""
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+
+@app.get("/bigquery/stats")
+def bigquery_stats():
+    """Shared BigQuery client and token refresh counters."""
+    return client_manager.stats()
+
+
+@app.get("/cost/stats")
+def cost_stats():
+    """Dry-run estimate cache counters for the cost gate."""
+    if not COST_GATE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, "max_bytes": COST_GATE_MAX_BYTES, **cost_estimator.stats()}
+
+
+@app.get("/schema/catalog")
+def catalog_stats():
+    """Live schema catalog: tables, last refresh and schema swaps."""
+    if catalog is None:
+        return {"enabled": False}
+    return {"enabled": True, **catalog.stats()}
+
+
+@app.post("/schema/catalog/refresh")
+async def refresh_catalog():
+    """Re-read changed tables from INFORMATION_SCHEMA now instead of waiting for the timer."""
+    if catalog is None:
+        raise HTTPException(status_code=404, detail="Schema catalog is disabled (CATALOG_ENABLED=false).")
+    try:
+        changes = await asyncio.to_thread(catalog.refresh)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Catalog refresh failed: {e}")
+    return {**changes, "fingerprint": get_schema_index().fingerprint}
+
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """LLM routes, hedging and per-model latency, plus the scheduler's budget, concurrency limit and queue."""
+    return {**router.stats(), "scheduler": scheduler_stats()}
+
+
+@app.get("/pipeline/stats")
+def pipeline_mode_stats():
+    """Latency and fallback counters per pipeline mode (two_stage vs combined)."""
+    return pipeline_stats.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics: stage latencies, LLM calls/tokens, retries, cache and BigQuery usage."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def _engine_sql(sql: str) -> str:
+    """Generated SQL as the execution engine runs it (BigQuery needs the full table paths)."""
+    return sql if EXECUTION_ENGINE == "postgres" else qualify_table_names(sql)
+
+
+def _execute(sql: str, result_format: str, page_size: int = None, bigquery_job_id: str = None) -> tuple:
     """
-    Main endpoint: takes a natural language question,
-    generates SQL, validates it, executes on PostgreSQL,
-    and returns the result.
+    Run SQL on the execution engine through the result cache. Returns (db_result, result_cache_hit).
+    With page_size only the first page is downloaded; db_result carries a next_page_token.
     """
-    if not request.question.strip():
-        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+    if EXECUTION_ENGINE == "postgres":
+        executor = execute_query
+    elif bigquery_job_id:
+        executor = functools.partial(execute_bigquery, job_id=bigquery_job_id)
+    else:
+        executor = execute_bigquery
+    if result_cache is None:
+        return executor(sql, result_format, page_size), False
+    return result_cache.execute(executor, sql, RESULT_DATASET, result_format, page_size)
 
-    # Step 1: Generate and validate SQL
-    result = process_question(request.question)
 
-    db_result = None
-    if result["success"] and result["sql"]:
-        sql = result["sql"]
-        for table in ["orders", "users", "products", "order_items"]:
-            sql = sql.replace(
-                f" {table} ",
-                f" `bigquery-public-data.thelook_ecommerce.{table}` "
-            )
-        db_result = execute_bigquery(sql)
+async def _execute_async(sql: str, result_format: str, page_size: int = None, bigquery_job_id: str = None) -> tuple:
+    """
+    _execute in a worker thread; identical concurrent queries share one BigQuery job.
+    A query with its own bigquery_job_id (async jobs, which may cancel it) is never shared.
+    """
+    if not SINGLE_FLIGHT_ENABLED or bigquery_job_id:
+        return await asyncio.to_thread(_execute, sql, result_format, page_size, bigquery_job_id)
+    key = f"{RESULT_DATASET}\x00{result_format}\x00{page_size}\x00{canonical_sql(sql)}"
+    (db_result, cache_hit), shared = await execution_flight.do(
+        key, lambda emit: asyncio.to_thread(_execute, sql, result_format, page_size)
+    )
+    return (copy.deepcopy(db_result) if shared else db_result), cache_hit
+
+
+async def _answer(question: str, result_format: str, mode: str = None, page_size: int = None,
+                  on_event=None, bigquery_job_id: str = None) -> NL2SQLResponse:
+    """
+    Generate, validate and execute SQL for one question.
+    on_event(event, data) is called as each stage completes (async jobs).
+    """
+    with track_request() as timings:
+        # Step 1: Generate and validate SQL
+        result = await process_question_async(question, on_event=on_event, mode=mode)
+
+        db_result = None
+        result_cache_hit = False
+        if result["success"] and result["sql"]:
+            sql = _engine_sql(result["sql"])
+            if on_event is not None:
+                on_event("execution", {"bigquery_job_id": bigquery_job_id})
+            with stage_timer("execution"):
+                db_result, result_cache_hit = await _execute_async(sql, result_format, page_size, bigquery_job_id)
 
     return NL2SQLResponse(
         question=result["question"],
@@ -86,7 +283,328 @@ def ask(request: QuestionRequest):
         db_result=db_result,
         success=result["success"],
         message=result["message"],
-        attempts=result["attempts"]
+        attempts=result["attempts"],
+        cache_hit=result.get("cache_hit", False),
+        result_cache_hit=result_cache_hit,
+        coalesced=result.get("coalesced", False),
+        fast_path=result.get("fast_path", False),
+        compiled=result.get("compiled", False),
+        repairs=result.get("repairs", []),
+        mode=result.get("mode"),
+        fallback=result.get("fallback", False),
+        cost=result.get("cost"),
+        timings=timings.summary(),
+    )
+
+
+def _check_result_format(result_format: str):
+    if result_format not in RESULT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"result_format must be one of {', '.join(RESULT_FORMATS)}.")
+
+
+@app.post("/ask", response_model=NL2SQLResponse)
+async def ask(request: QuestionRequest):
+    """
+    Main endpoint: takes a natural language question,
+    generates SQL, validates it, executes on PostgreSQL,
+    and returns the result.
+    """
+    _check_request(request)
+    _check_result_format(request.result_format)
+    return await _answer(request.question, request.result_format, request.mode, _page_size(request.page_size))
+
+
+@app.get("/results/{token}")
+async def result_page(token: str):
+    """
+    Next page of an /ask result: pass db_result.next_page_token (or the
+    next_page_token of the previous page). BigQuery pages are read from the
+    finished job's destination table, so the query is not run again.
+    """
+    try:
+        state = decode_page_token(token)
+    except ExpiredPageToken as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except InvalidPageToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    fetch = fetch_postgres_page if state.get("engine") == "postgres" else fetch_bigquery_page
+    with stage_timer("execution"):
+        return await asyncio.to_thread(fetch, state)
+
+
+# --- Batch ---
+
+async def _answer_batch(questions: list, result_format: str, mode: str = None, page_size: int = None):
+    """
+    Answer every distinct question with at most BATCH_CONCURRENCY in flight and
+    yield (indexes, response) as each finishes; indexes are the positions of all
+    copies of that question in the batch. Groq and BigQuery concurrency are
+    additionally capped process-wide (app/llm/scheduler.py, BQ_MAX_CONCURRENT_JOBS);
+    batch LLM calls queue behind interactive ones.
+    """
+    positions = {}
+    for i, question in enumerate(questions):
+        positions.setdefault(normalize_question(question), []).append(i)
+
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(indexes: list) -> tuple:
+        async with slots:
+            try:
+                response = await _answer(questions[indexes[0]], result_format, mode, page_size)
+            except Exception as e:
+                logger.exception("Batch question failed: %s", questions[indexes[0]])
+                response = NL2SQLResponse(
+                    question=questions[indexes[0]], intent=None, sql=None, validation=None, db_result=None,
+                    success=False, message=f"Pipeline failed: {e}", attempts=0, mode=mode,
+                )
+            return indexes, response
+
+    with llm_priority(PRIORITY_BATCH):
+        tasks = [asyncio.create_task(run(indexes)) for indexes in positions.values()]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _stream_batch(questions: list, result_format: str, mode: str = None, page_size: int = None):
+    async for indexes, response in _answer_batch(questions, result_format, mode, page_size):
+        data = response.model_dump()
+        for i in indexes:
+            yield json.dumps({"index": i, **data, "question": questions[i]}, default=json_default) + "\n"
+
+
+@app.post("/ask/batch")
+async def ask_batch(request: BatchRequest, stream: bool = False):
+    """
+    Answer many questions in one call. Repeated questions are answered once.
+    Returns {"results": [...]} in request order, or with stream=true one NDJSON
+    line per question (tagged with its index) as soon as it finishes.
+    """
+    questions = request.questions
+    if not questions:
+        raise HTTPException(status_code=400, detail="questions cannot be empty.")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"A batch holds at most {BATCH_MAX_QUESTIONS} questions.")
+    for question in questions:
+        _check_request(QuestionRequest(question=question, mode=request.mode, page_size=request.page_size))
+    _check_result_format(request.result_format)
+    page_size = _page_size(request.page_size)
+
+    if stream:
+        return StreamingResponse(
+            _stream_batch(questions, request.result_format, request.mode, page_size),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    started = time.perf_counter()
+    results = [None] * len(questions)
+    async for indexes, response in _answer_batch(questions, request.result_format, request.mode, page_size):
+        for i in indexes:
+            results[i] = response.model_copy(update={"question": questions[i]})
+    return BatchResponse(
+        results=results,
+        unique_questions=len({normalize_question(q) for q in questions}),
+        total_ms=round(1000 * (time.perf_counter() - started), 2),
+    )
+
+
+# --- Async jobs ---
+
+def _job_manager():
+    if job_manager is None:
+        raise HTTPException(status_code=404, detail="Async jobs are disabled (JOBS_ENABLED=false).")
+    return job_manager
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: QuestionRequest):
+    """
+    Start answering a question in the background and return the job at once.
+    Poll GET /jobs/{id}, or follow GET /jobs/{id}/events, for progress and the result.
+    """
+    manager = _job_manager()
+    _check_request(request)
+    _check_result_format(request.result_format)
+    page_size = _page_size(request.page_size)
+
+    async def runner(on_event, bigquery_job_id):
+        # Nobody is waiting on the HTTP response: queue behind interactive /ask calls
+        with llm_priority(PRIORITY_BATCH):
+            response = await _answer(
+                request.question, request.result_format, request.mode, page_size,
+                on_event=on_event, bigquery_job_id=bigquery_job_id,
+            )
+        return response.model_dump()
+
+    try:
+        return manager.submit(request.model_dump(), runner)
+    except JobLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+
+@app.get("/jobs/stats")
+def job_stats():
+    """Async job store size and active / submitted / rejected counters."""
+    if job_manager is None:
+        return {"enabled": False}
+    return {"enabled": True, **job_manager.stats()}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status, stage events so far and, once done, the same result /ask returns."""
+    job = _job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, format: str = "sse"):
+    """Stage events of a job as they happen, ending with a "job" event holding the finished job."""
+    manager = _job_manager()
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'.")
+    if manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+
+    async def stream():
+        async for event, data in manager.events(job_id):
+            yield _encode_event(event, data, format)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job, including its BigQuery query job."""
+    job = await _job_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job
+
+
+# --- Streaming ---
+
+def _encode_event(event: str, data, fmt: str) -> str:
+    payload = json.dumps(data, default=json_default)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {payload}\n\n"
+    return json.dumps({"event": event, "data": data}, default=json_default) + "\n"
+
+
+def _cached_pages(db_result: dict, page_size: int = BQ_STREAM_PAGE_SIZE):
+    """Replay a cached rows result in the same (columns, rows) pages iter_bigquery_pages yields."""
+    rows = db_result["rows"]
+    for start in range(0, max(len(rows), 1), page_size):
+        yield db_result["columns"], rows[start:start + page_size]
+
+
+async def _stream_answer(question: str, fmt: str, mode: str = None):
+    """Yield pipeline stage events as they complete, then result rows page by page."""
+    queue = asyncio.Queue()
+    task = asyncio.create_task(
+        process_question_async(
+            question, on_event=lambda event, data: queue.put_nowait((event, data)), mode=mode
+        )
+    )
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+
+    try:
+        while (item := await queue.get()) is not None:
+            yield _encode_event(*item, fmt)
+        result = task.result()
+    except Exception as e:
+        yield _encode_event("error", {"message": f"Pipeline failed: {e}"}, fmt)
+        return
+    finally:
+        if not task.done():
+            task.cancel()
+
+    yield _encode_event("result", {
+        "question": result["question"],
+        "intent": result["intent"],
+        "sql": result["sql"],
+        "validation": result["validation"],
+        "success": result["success"],
+        "message": result["message"],
+        "attempts": result["attempts"],
+        "cache_hit": result.get("cache_hit", False),
+        "coalesced": result.get("coalesced", False),
+        "fast_path": result.get("fast_path", False),
+        "compiled": result.get("compiled", False),
+        "repairs": result.get("repairs", []),
+        "mode": result.get("mode"),
+        "fallback": result.get("fallback", False),
+        "cost": result.get("cost"),
+        "timings": result.get("timings"),
+    }, fmt)
+    if not (result["success"] and result["sql"]):
+        return
+
+    # Streams read and store whole results: the entry /ask shares when RESULT_PAGE_SIZE=0
+    sql = _engine_sql(result["sql"])
+    cached = result_cache.get(sql, RESULT_DATASET, "rows", page_size=None) if result_cache is not None else None
+    # Rows kept for the cache until their encoded size passes the entry limit
+    kept = [] if result_cache is not None and cached is None else None
+    kept_bytes = 0
+    columns = None
+    row_count = 0
+    try:
+        if cached is not None:
+            pages = _cached_pages(cached)
+        elif EXECUTION_ENGINE == "postgres":
+            pages = stream_query(sql)       # one server-side cursor, read in fetchmany batches
+        else:
+            pages = iter_bigquery_pages(sql)
+        async for page_columns, rows in iterate_in_threadpool(pages):
+            if columns is None:
+                columns = page_columns
+                yield _encode_event("columns", columns, fmt)
+            row_count += len(rows)
+            event = _encode_event("rows", rows, fmt)
+            if kept is not None:
+                kept_bytes += len(event)
+                if kept_bytes <= result_cache.max_entry_bytes:
+                    kept.extend(rows)
+                else:
+                    kept = None
+            yield event
+    except Exception as e:
+        yield _encode_event("error", {"message": str(e)}, fmt)
+        return
+    if kept is not None and columns is not None:
+        result_cache.put(sql, RESULT_DATASET, "rows", {
+            "success": True, "columns": columns, "rows": kept, "row_count": len(kept), "error": None,
+        })
+    yield _encode_event("done", {"row_count": row_count, "result_cache_hit": cached is not None}, fmt)
+
+
+@app.post("/ask/stream")
+async def ask_stream(request: QuestionRequest, format: str = "ndjson"):
+    """
+    Streaming variant of /ask. Emits intent, sql and validation events as each
+    stage completes, then the result rows page by page.
+    format=ndjson (default) or format=sse.
+    """
+    _check_request(request)
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'.")
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        _stream_answer(request.question, format, request.mode),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
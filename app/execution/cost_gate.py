@@ -0,0 +1,196 @@
+"""
+cost_gate.py - Pre-execution cost check. Each generated query is dry-run on
+BigQuery for a bytes-processed estimate (cached per canonical SQL). Queries over
+COST_GATE_MAX_BYTES are rewritten to something cheaper when possible, otherwise
+rejected with a hint the SQL retry loop can pass back to the LLM.
+"""
+import logging
+import threading
+from app.cache.backends import MemoryCacheBackend
+from app.bigquery_client import dry_run_bytes, qualify_table_names
+from app.validation.sql_parser import (
+    canonical_sql, parse_sql, identifier_name, expression_tokens, Select, TableRef, SQLSyntaxError,
+)
+from app.monitoring.metrics import COST_GATE, current_timings
+from app.configuration.config import (
+    COST_GATE_MAX_BYTES, COST_GATE_ACTION, COST_GATE_ROW_LIMIT,
+    COST_ESTIMATE_CACHE_TTL_SECONDS, COST_ESTIMATE_CACHE_MAX_ENTRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def format_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+class CostDecision:
+    """
+    Outcome of the cost check.
+      action: ok | rewritten | rejected | unknown (estimate unavailable; query allowed)
+      sql   : the query to run (the rewrite when action == "rewritten")
+    """
+
+    def __init__(self, action: str, sql: str, estimated_bytes, original_bytes=None, rewrites=()):
+        self.action = action
+        self.sql = sql
+        self.estimated_bytes = estimated_bytes
+        self.original_bytes = original_bytes if original_bytes is not None else estimated_bytes
+        self.rewrites = list(rewrites)
+
+    @property
+    def allowed(self) -> bool:
+        return self.action != "rejected"
+
+    def to_dict(self) -> dict:
+        return {
+            "action": self.action,
+            "estimated_bytes": self.estimated_bytes,
+            "original_estimated_bytes": self.original_bytes,
+            "limit_bytes": COST_GATE_MAX_BYTES,
+            "rewrites": self.rewrites,
+        }
+
+
+class CostEstimator:
+    """Dry-run estimates, cached by canonical SQL so repeated queries cost one dry run."""
+
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.dry_runs = 0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def estimate(self, sql: str):
+        """Estimated bytes processed, or None when the dry run fails."""
+        sql = qualify_table_names(sql)
+        key = canonical_sql(sql)
+        cached = self.backend.get(key)
+        if cached is not None:
+            with self._lock:
+                self.cache_hits += 1
+            return cached
+        try:
+            estimate = dry_run_bytes(sql)
+        except Exception as e:
+            logger.warning("Dry run failed, cost unknown: %s", e)
+            return None
+        with self._lock:
+            self.dry_runs += 1
+        self.backend.set(key, estimate, self.ttl)
+        return estimate
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self.backend), "dry_runs": self.dry_runs, "cache_hits": self.cache_hits}
+
+
+estimator = CostEstimator(MemoryCacheBackend(COST_ESTIMATE_CACHE_MAX_ENTRIES), COST_ESTIMATE_CACHE_TTL_SECONDS)
+
+
+# --- Rewrites ---
+
+def _explicit_columns(sql: str, intent: dict):
+    """
+    Replace `*` / `alias.*` in the outer SELECT with the columns the intent asked
+    for. BigQuery is columnar, so fewer columns is the rewrite that reduces bytes.
+    Returns the new SQL, or None when there is nothing to rewrite.
+    """
+    selected = (intent or {}).get("selected_columns") or {}
+    try:
+        query = parse_sql(sql)
+    except SQLSyntaxError:
+        return None
+    if len(query.branches) != 1 or query.ctes or not isinstance(query.branches[0], Select):
+        return None
+    select = query.branches[0]
+    tables = [item for item in select.from_items if isinstance(item, TableRef)]
+
+    edits = []
+    for item in select.items:
+        toks = expression_tokens(item)
+        if len(toks) == 1 and toks[0].value == "*" and len(tables) == 1:
+            table, star = tables[0], toks[0]
+        elif len(toks) == 3 and toks[2].value == "*" and toks[1].is_punct("."):
+            table, star = select.aliases.get(identifier_name(toks[0])), toks[0]
+            if not isinstance(table, TableRef):
+                continue
+        else:
+            continue
+        columns = selected.get(table.name)
+        if not columns:
+            continue
+        prefix = f"{table.alias or table.name}." if (table.alias or len(tables) > 1) else ""
+        edits.append((star.pos, toks[-1].end, ", ".join(f"{prefix}{col}" for col in columns)))
+
+    for start, end, text in sorted(edits, reverse=True):
+        sql = sql[:start] + text + sql[end:]
+    return sql if edits else None
+
+
+def _with_limit(sql: str):
+    """
+    Add LIMIT COST_GATE_ROW_LIMIT to an unlimited query. On BigQuery this bounds the
+    result size and download time, not the bytes scanned.
+    """
+    try:
+        query = parse_sql(sql)
+    except SQLSyntaxError:
+        return None
+    if query.limit is not None:
+        return None
+    return sql.rstrip().rstrip(";").rstrip() + f"\nLIMIT {COST_GATE_ROW_LIMIT}"
+
+
+def check_cost(sql: str, intent: dict = None) -> CostDecision:
+    """Estimate the query and apply the gate. Blocking (does a dry run on a cache miss)."""
+    estimated = estimator.estimate(sql)
+    decision = _decide(sql, intent, estimated)
+    COST_GATE.inc(action=decision.action)
+    timings = current_timings()
+    if timings is not None and decision.estimated_bytes is not None:
+        timings.bq_estimated_bytes = decision.estimated_bytes
+    return decision
+
+
+def _decide(sql: str, intent: dict, estimated) -> CostDecision:
+    if estimated is None:
+        return CostDecision("unknown", sql, None)
+    if estimated <= COST_GATE_MAX_BYTES:
+        return CostDecision("ok", sql, estimated)
+    if COST_GATE_ACTION != "rewrite":
+        return CostDecision("rejected", sql, estimated)
+
+    # Only dropping columns lowers the scan; LIMIT rides along to bound the result
+    rewritten = _explicit_columns(sql, intent)
+    if rewritten is None:
+        return CostDecision("rejected", sql, estimated)
+    rewrites = ["replaced SELECT * with the intent's columns"]
+    limited = _with_limit(rewritten)
+    if limited is not None:
+        rewritten = limited
+        rewrites.append(f"added LIMIT {COST_GATE_ROW_LIMIT}")
+
+    new_estimate = estimator.estimate(rewritten)
+    if new_estimate is not None and new_estimate <= COST_GATE_MAX_BYTES:
+        logger.info("Cost gate rewrite: %s → %s", format_bytes(estimated), format_bytes(new_estimate))
+        return CostDecision("rewritten", rewritten, new_estimate, estimated, rewrites)
+    return CostDecision("rejected", sql, estimated)
+
+
+def build_cost_hint(decision: CostDecision) -> str:
+    """Retry hint for a query the gate rejected."""
+    return (
+        f"The previous SQL passed validation but BigQuery estimates it would scan "
+        f"{format_bytes(decision.estimated_bytes)}, above the {format_bytes(COST_GATE_MAX_BYTES)} limit.\n"
+        "Write a cheaper query that answers the same question:\n"
+        "- Never use SELECT *; select only the columns the answer needs (BigQuery bills per column read).\n"
+        "- Aggregate in SQL instead of returning raw rows where the question allows it.\n"
+        "- Avoid joining tables whose columns are not needed in the result.\n"
+        "- Keep any date range from the question as a WHERE filter on created_at."
+    )
@@ -1,9 +1,31 @@
 """
-database.py - PostgreSQL connection and query execution.
+database.py - PostgreSQL connection pool and query execution.
+Results are read through named (server-side) cursors in fetchmany batches, so
+PostgreSQL holds the result and Python only ever holds one batch or page.
 """
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 import psycopg2
-import psycopg2.extras
-from app.configuration.config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+import psycopg2.pool
+from app.configuration.config import (
+    DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD,
+    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT_SECONDS, DB_POOL_HEALTHCHECK_SECONDS,
+    DB_STREAM_BATCH_SIZE, DB_PAGE_CURSORS_MAX, DB_PAGE_CURSOR_IDLE_SECONDS,
+)
+from app.execution.result_format import (
+    PG_TYPE_NAMES, columnar_result, columnar_to_arrow, arrow_available, arrow_table_to_ipc,
+    error_result,
+)
+from app.execution.pagination import with_next_page
+
+_pool = None
+_pool_lock = threading.Lock()
+# Bounds concurrent checkouts: ThreadedConnectionPool raises instead of waiting when exhausted
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_used = {}   # id(conn) -> time the connection was last returned to the pool
 
 
 def get_connection():
@@ -17,46 +39,309 @@ def get_connection():
     )
 
 
-def execute_query(sql: str) -> dict:
+def get_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX,
+                    host=DB_HOST,
+                    port=DB_PORT,
+                    dbname=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASSWORD
+                )
+    return _pool
+
+
+def _is_healthy(conn) -> bool:
+    """Cheap check for closed connections; ping only if idle for a while."""
+    if conn.closed:
+        return False
+    last_used = _last_used.get(id(conn))
+    if last_used is None or time.time() - last_used < DB_POOL_HEALTHCHECK_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout():
+    """A healthy pooled connection; waits up to DB_POOL_TIMEOUT_SECONDS for a free slot."""
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT_SECONDS):
+        raise TimeoutError(f"No database connection available within {DB_POOL_TIMEOUT_SECONDS}s.")
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+        if not _is_healthy(conn):
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        return conn
+    except BaseException:
+        _pool_slots.release()
+        raise
+
+
+def _checkin(conn, broken: bool = False):
+    """Roll back and return a _checkout() connection (closed instead if it is broken)."""
+    try:
+        if not broken and not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken or conn.closed:
+            _last_used.pop(id(conn), None)
+            get_pool().putconn(conn, close=True)
+        else:
+            _last_used[id(conn)] = time.time()
+            get_pool().putconn(conn)
+    finally:
+        _pool_slots.release()
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Check a healthy connection out of the pool and return it afterwards.
+    Waits up to DB_POOL_TIMEOUT_SECONDS for a free slot.
+    """
+    conn = _checkout()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        _checkin(conn, broken)
+
+
+def close_pool():
+    """Close every pooled connection (call on shutdown)."""
+    global _pool
+    _open_pages.close_all()
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+
+def execute_query(sql: str, result_format: str = "rows", page_size: int = None) -> dict:
     """
     Execute a SQL query and return results.
     Returns a dict with columns, rows, and row count.
+    result_format: "rows" (list of dicts), "columnar" or "arrow" — see result_format.py.
+    page_size: return the first page only, with a next_page_token for the rest
+    (see fetch_postgres_page).
     """
-    conn = None
+    if page_size is not None:
+        return fetch_postgres_page(
+            {"engine": "postgres", "sql": sql, "format": result_format, "page_size": page_size, "offset": 0}
+        )
     try:
-        conn = get_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute(sql)
+        description, records = None, []
+        for description, rows in _read_batches(sql, DB_STREAM_BATCH_SIZE):
+            records.extend(rows)
+        return _postgres_result(description or [], records, result_format)
+
+    except Exception as e:
+        return error_result(result_format, str(e))
+
+
+def _read_batches(sql: str, batch_size: int):
+    """Yield (cursor.description, rows) batches from one named cursor; the connection is held until the end."""
+    with pooled_connection() as conn:
+        with conn.cursor(name=f"nl2sql_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                yield cursor.description or [], rows
+                if len(rows) < batch_size:
+                    return
+
+
+def stream_query(sql: str, batch_size: int = DB_STREAM_BATCH_SIZE):
+    """
+    Execute a SQL query through a named server-side cursor and yield
+    (columns, rows) pages of row dicts, batch_size rows at a time (the same
+    pages as iter_bigquery_pages). Only one batch is held in Python memory;
+    the pooled connection is held until the generator is exhausted or closed.
+    """
+    columns = None
+    for description, rows in _read_batches(sql, batch_size):
+        first = columns is None
+        if first:
+            columns = [col.name for col in description]
+        if rows or first:     # an empty result still reports its columns
+            yield columns, [dict(zip(columns, row)) for row in rows]
+
 
-        rows = cursor.fetchall()
-        columns = list(rows[0].keys()) if rows else []
+class _OpenPage:
+    """A paged result's named cursor, kept open (with its connection) for the next page."""
 
+    def __init__(self, sql: str, offset: int):
+        self.id = uuid.uuid4().hex
+        self.conn = _checkout()
+        try:
+            self.cursor = self.conn.cursor(name=f"nl2sql_{self.id}")
+            self.cursor.execute(sql)
+            if offset:
+                # Token from another worker, or its cursor was closed: skip inside PostgreSQL
+                self.cursor.scroll(offset)
+        except BaseException:
+            _checkin(self.conn, broken=True)
+            raise
+        self.offset = offset
+        self.lookahead = []
+        self.last_used = time.time()
+
+    def read(self, page_size: int) -> tuple:
+        """(rows, has_more): the next page, plus one row read ahead to tell if another follows."""
+        rows = self.lookahead + self.cursor.fetchmany(page_size + 1 - len(self.lookahead))
+        self.lookahead = rows[page_size:]
+        self.offset += min(len(rows), page_size)
+        self.last_used = time.time()
+        return rows[:page_size], bool(self.lookahead)
+
+    def close(self, broken: bool = False):
+        try:
+            self.cursor.close()
+        except psycopg2.Error:
+            broken = True
+        _checkin(self.conn, broken)
+
+
+class _OpenPages:
+    """
+    Cursors of paged results waiting for their next page, at most
+    DB_PAGE_CURSORS_MAX (each holds a pooled connection), closed after
+    DB_PAGE_CURSOR_IDLE_SECONDS without a read. Reading the pages in order
+    then costs one query and sees one snapshot.
+    """
+
+    def __init__(self, max_open: int, idle_seconds: float):
+        self.max_open = max_open
+        self.idle_seconds = idle_seconds
+        self._pages = OrderedDict()     # id -> _OpenPage
+        self._lock = threading.Lock()
+
+    def claim(self, page_id: str, offset: int):
+        """Take the open cursor for this token, if it is positioned at offset."""
+        stale = self._expire()
+        with self._lock:
+            page = self._pages.get(page_id)
+            if page is not None and page.offset == offset:
+                del self._pages[page_id]
+            else:
+                page = None
+        self._close(stale)
+        return page
+
+    def park(self, page: _OpenPage) -> bool:
+        """Keep a cursor for its next page; False (caller closes it) when none can be kept."""
+        if self.max_open <= 0:
+            return False
+        with self._lock:
+            self._pages[page.id] = page
+            evicted = []
+            while len(self._pages) > self.max_open:
+                evicted.append(self._pages.popitem(last=False)[1])
+        self._close(evicted)
+        return True
+
+    def _expire(self) -> list:
+        cutoff = time.time() - self.idle_seconds
+        with self._lock:
+            stale = [page for page in self._pages.values() if page.last_used < cutoff]
+            for page in stale:
+                del self._pages[page.id]
+        return stale
+
+    def _close(self, pages: list):
+        for page in pages:
+            page.close()
+
+    def close_all(self):
+        with self._lock:
+            pages = list(self._pages.values())
+            self._pages.clear()
+        self._close(pages)
+
+    def __len__(self):
+        return len(self._pages)
+
+
+_open_pages = _OpenPages(DB_PAGE_CURSORS_MAX, DB_PAGE_CURSOR_IDLE_SECONDS)
+
+
+def fetch_postgres_page(state: dict) -> dict:
+    """
+    One page of a query through a named (server-side) cursor, page_size + 1
+    rows at a time (the extra row tells whether another page follows). The
+    cursor stays open for the next page's token (see _OpenPages), so pages read
+    in order continue it instead of running the statement again. A token whose
+    cursor is gone re-runs the statement and MOVEs past the earlier rows inside
+    PostgreSQL; its ORDER BY then decides the page order.
+    """
+    result_format = state["format"]
+    page_size = state["page_size"]
+    page = _open_pages.claim(state.get("cursor"), state["offset"])
+    try:
+        if page is None:
+            page = _OpenPage(state["sql"], state["offset"])
+        rows, has_more = page.read(page_size)
+        description = page.cursor.description or []
+    except Exception as e:
+        if page is not None:
+            page.close(broken=isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)))
+        return error_result(result_format, str(e))
+
+    if not (has_more and _open_pages.park(page)):
+        page.close()
+    try:
+        result = _postgres_result(description, rows, result_format)
+    except Exception as e:
+        return error_result(result_format, str(e))
+    return with_next_page(result, {**state, "cursor": page.id}, has_more)
+
+
+def _postgres_result(description, records: list, result_format: str) -> dict:
+    columns = [col.name for col in description]
+    if result_format == "rows":
+        rows = [dict(zip(columns, row)) for row in records]
         return {
             "success": True,
             "columns": columns,
-            "rows": [dict(row) for row in rows],
+            "rows": rows,
             "row_count": len(rows),
             "error": None
         }
 
-    except Exception as e:
-        return {
-            "success": False,
-            "columns": [],
-            "rows": [],
-            "row_count": 0,
-            "error": str(e)
-        }
-    finally:
-        if conn:
-            conn.close()
+    types = [PG_TYPE_NAMES.get(col.type_code, "UNKNOWN") for col in description]
+    data = [list(values) for values in zip(*records)] or [[] for _ in columns]
+    if result_format == "arrow":
+        if not arrow_available():
+            raise RuntimeError("result_format 'arrow' requires pyarrow to be installed.")
+        return arrow_table_to_ipc(columnar_to_arrow(columns, data), types)
+    return columnar_result(columns, types, data)
 
 
 def test_connection() -> bool:
     """Test if database connection works."""
     try:
-        conn = get_connection()
-        conn.close()
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
         return True
     except Exception:
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,72 @@
+"""
+pagination.py - Continuation tokens for paged query results.
+A token holds what the next page needs (the BigQuery job's destination table,
+or the PostgreSQL statement, plus the row offset and page size), an expiry and
+an HMAC, so a client can neither point it at another table or statement nor
+keep it past RESULT_TOKEN_TTL_SECONDS.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from app.configuration.config import RESULT_TOKEN_SECRET, RESULT_TOKEN_TTL_SECONDS
+
+# Without a configured secret, tokens only verify in the process that issued them
+_SECRET = RESULT_TOKEN_SECRET.encode() if RESULT_TOKEN_SECRET else secrets.token_bytes(32)
+
+
+class InvalidPageToken(ValueError):
+    """Malformed or tampered-with page token."""
+
+
+class ExpiredPageToken(InvalidPageToken):
+    """Page token older than RESULT_TOKEN_TTL_SECONDS."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(body: str) -> str:
+    return _b64encode(hmac.new(_SECRET, body.encode("ascii"), hashlib.sha256).digest())
+
+
+def encode_page_token(state: dict, ttl: float = RESULT_TOKEN_TTL_SECONDS) -> str:
+    payload = json.dumps({**state, "exp": int(time.time() + ttl)}, separators=(",", ":"), sort_keys=True)
+    body = _b64encode(payload.encode())
+    return f"{body}.{_sign(body)}"
+
+
+def decode_page_token(token: str) -> dict:
+    """Verify a token and return its state; raises InvalidPageToken / ExpiredPageToken."""
+    body, _, signature = token.partition(".")
+    try:
+        valid = bool(body) and hmac.compare_digest(signature.encode("ascii"), _sign(body).encode("ascii"))
+        state = json.loads(_b64decode(body)) if valid else None
+    except (UnicodeEncodeError, ValueError):
+        state = None
+    if not isinstance(state, dict):
+        raise InvalidPageToken("Invalid page token.")
+    if state.pop("exp", 0) < time.time():
+        raise ExpiredPageToken("Page token has expired; run the question again.")
+    return state
+
+
+def with_next_page(result: dict, state: dict, has_more: bool, total_rows: int = None) -> dict:
+    """
+    Add total_rows (None when the engine does not report it) and next_page_token
+    (None on the last page) to a page result. state describes the page just read.
+    """
+    if not result["success"]:
+        return result
+    result["total_rows"] = total_rows
+    result["next_page_token"] = (
+        encode_page_token({**state, "offset": state["offset"] + result["row_count"]}) if has_more else None
+    )
+    return result
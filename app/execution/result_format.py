@@ -0,0 +1,99 @@
+"""
+result_format.py - Alternative encodings for query results.
+  rows     : list of per-row dicts (default, what the UI uses)
+  columnar : one array per column plus a type header — column names are sent once
+  arrow    : Arrow IPC stream, base64 encoded (requires pyarrow)
+"""
+import base64
+import datetime
+import decimal
+
+try:
+    import pyarrow as pa
+except ImportError:   # pyarrow is optional; columnar JSON still works without it
+    pa = None
+
+RESULT_FORMATS = ("rows", "columnar", "arrow")
+
+# psycopg2 type OIDs → readable type names for the columnar type header
+PG_TYPE_NAMES = {
+    16: "BOOL", 20: "INT", 21: "INT", 23: "INT",
+    700: "FLOAT", 701: "FLOAT", 1700: "DECIMAL",
+    25: "VARCHAR", 1042: "VARCHAR", 1043: "VARCHAR",
+    1082: "DATE", 1083: "TIME", 1114: "TIMESTAMP", 1184: "TIMESTAMP",
+}
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def columnar_result(columns: list, types: list, data: list) -> dict:
+    """Build the columnar response dict; data holds one list of values per column."""
+    return {
+        "success": True,
+        "format": "columnar",
+        "columns": columns,
+        "types": types,
+        "data": data,
+        "row_count": len(data[0]) if data else 0,
+        "error": None
+    }
+
+
+def arrow_table_to_columnar(table, types: list = None) -> dict:
+    data = [table.column(i).to_pylist() for i in range(table.num_columns)]
+    return columnar_result(table.column_names, types or _arrow_types(table), data)
+
+
+def arrow_table_to_ipc(table, types: list = None) -> dict:
+    """Serialize an Arrow table as a base64 IPC stream."""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return {
+        "success": True,
+        "format": "arrow",
+        "columns": table.column_names,
+        "types": types or _arrow_types(table),
+        "arrow_ipc": base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii"),
+        "row_count": table.num_rows,
+        "error": None
+    }
+
+
+def columnar_to_arrow(columns: list, data: list):
+    return pa.table({name: values for name, values in zip(columns, data)})
+
+
+def _arrow_types(table) -> list:
+    return [str(field.type) for field in table.schema]
+
+
+def json_default(value):
+    """json.dumps default for warehouse values (Decimal, dates) that JSON has no type for."""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def error_result(result_format: str, error: str) -> dict:
+    if result_format == "rows":
+        return {
+            "success": False,
+            "columns": [],
+            "rows": [],
+            "row_count": 0,
+            "error": error
+        }
+    return {
+        "success": False,
+        "format": result_format,
+        "columns": [],
+        "types": [],
+        "data": [],
+        "row_count": 0,
+        "error": error
+    }
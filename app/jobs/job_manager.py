@@ -0,0 +1,257 @@
+"""
+job_manager.py - Asynchronous jobs: POST /jobs answers immediately with a job
+id while the pipeline and the BigQuery query run in the background. Jobs are
+kept in a bounded store with expiry (in-process, or SQLite so every worker can
+read them), report each pipeline stage as it completes, and can be cancelled —
+which also cancels the BigQuery job.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from app.bigquery_client import cancel_bigquery_job
+from app.cache.backends import MemoryCacheBackend, DiskCacheBackend
+from app.execution.result_format import json_default
+from app.monitoring.metrics import JOBS
+from app.configuration.config import (
+    JOBS_ENABLED, JOB_STORE_BACKEND, JOB_STORE_PATH, JOB_TTL_SECONDS, JOB_MAX_STORED,
+    JOB_MAX_ACTIVE, JOB_CONCURRENCY, JOB_POLL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class JobLimitExceeded(RuntimeError):
+    """JOB_MAX_ACTIVE jobs are already queued or running in this process."""
+
+
+def _jsonable(value):
+    """Round-trip through JSON so memory and disk stores hold the same values (Decimal -> float, ...)."""
+    return json.loads(json.dumps(value, default=json_default))
+
+
+class JobManager:
+    """
+    Runs jobs as asyncio tasks on the serving event loop, at most `concurrency`
+    at a time. A job is a JSON dict:
+      id, status (queued | running | done | failed | cancelled), request, stage,
+      events [{event, data, at}], result, error, bigquery_job_id, timestamps.
+    "done" means the pipeline ran; result["success"] says whether it answered.
+    """
+
+    def __init__(self, store, ttl: float, max_active: int, concurrency: int, poll_seconds: float):
+        self.store = store
+        self.ttl = ttl
+        self.max_active = max_active
+        self.poll_seconds = poll_seconds
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks = {}          # job id -> task, for jobs owned by this process
+        self._jobs = {}           # job id -> live job dict, for jobs owned by this process
+        self._subscribers = {}    # job id -> [asyncio.Event], set when the job has a new event or finishes
+        self.submitted = 0
+        self.rejected = 0
+
+    # -- store --
+
+    def _save(self, job: dict):
+        self._check_cancel_flag(job)
+        # Store a copy: the live dict keeps changing while the job runs
+        self.store.set(job["id"], {**job, "events": list(job["events"])}, self.ttl)
+
+    def _check_cancel_flag(self, job: dict):
+        """Pick up a cancel requested through another worker (shared disk store)."""
+        if job["cancel_requested"] or job["status"] in FINISHED:
+            return
+        stored = self.store.get(job["id"])
+        if stored is not None and stored.get("cancel_requested"):
+            job["cancel_requested"] = True
+            task = self._tasks.get(job["id"])
+            if task is not None:
+                task.cancel()
+
+    def get(self, job_id: str):
+        """The job as last saved, or None if unknown or expired."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return {**job, "events": list(job["events"])}
+        return self.store.get(job_id)
+
+    # -- lifecycle --
+
+    def submit(self, request: dict, runner) -> dict:
+        """
+        Queue runner(on_event, bigquery_job_id) -> result dict and return the new job.
+        Raises JobLimitExceeded when too many jobs are already active here.
+        """
+        if len(self._tasks) >= self.max_active:
+            self.rejected += 1
+            raise JobLimitExceeded(f"{self.max_active} jobs are already queued or running.")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "request": request,
+            "stage": None,
+            "events": [],
+            "result": None,
+            "error": None,
+            "bigquery_job_id": f"nl2sql_job_{job_id}",
+            "cancel_requested": False,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        self._jobs[job_id] = job
+        self._save(job)
+        self._tasks[job_id] = asyncio.create_task(self._run(job, runner))
+        self.submitted += 1
+        return self.get(job_id)
+
+    async def _run(self, job: dict, runner):
+        try:
+            async with self._slots:
+                job.update(status="running", started_at=time.time())
+                self._save(job)
+                result = await runner(lambda event, data: self._on_event(job, event, data), job["bigquery_job_id"])
+            self._check_cancel_flag(job)
+            if job["cancel_requested"]:
+                # Cancelled through another worker, which also cancelled the BigQuery job
+                self._finish(job, "cancelled")
+            else:
+                self._finish(job, "done", result=_jsonable(result))
+        except asyncio.CancelledError:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            logger.exception("Job %s failed", job["id"])
+            self._finish(job, "failed", error=str(e))
+        finally:
+            self._tasks.pop(job["id"], None)
+            self._jobs.pop(job["id"], None)
+
+    def _finish(self, job: dict, status: str, **fields):
+        job.update(status=status, finished_at=time.time(), **fields)
+        self._save(job)
+        JOBS.inc(status=status)
+        for wake in self._subscribers.pop(job["id"], []):
+            wake.set()
+
+    def _on_event(self, job: dict, event: str, data):
+        data = _jsonable(data)
+        job["stage"] = event
+        job["events"].append({"event": event, "data": data, "at": time.time()})
+        self._save(job)
+        self._publish(job)
+
+    def _publish(self, job: dict):
+        for wake in self._subscribers.get(job["id"], []):
+            wake.set()
+
+    async def cancel(self, job_id: str):
+        """
+        Cancel a queued or running job (a no-op once it finished). A job owned
+        by another worker is flagged in the store; its BigQuery job is cancelled
+        from here either way. Returns the job, or None if unknown.
+        """
+        job = self.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        job["cancel_requested"] = True
+        task = self._tasks.get(job_id)
+        if task is not None:
+            self._jobs[job_id]["cancel_requested"] = True
+            task.cancel()
+        else:
+            self.store.set(job_id, job, self.ttl)
+        if job["stage"] == "execution":
+            await asyncio.to_thread(cancel_bigquery_job, job["bigquery_job_id"])
+        if task is not None:
+            # Let it record its final status before answering
+            await asyncio.wait([task], timeout=5)
+        return self.get(job_id)
+
+    async def events(self, job_id: str):
+        """
+        Yield (event, data) for the job: the stages so far, then each new one as
+        it happens, ending with a "job" event carrying the finished job.
+        """
+        live = self._jobs.get(job_id)
+        if live is not None:
+            # Subscribe before replaying, and read the live event list by index:
+            # events and the finish published while the replay is being sent
+            # are neither missed nor sent twice
+            wake = asyncio.Event()
+            self._subscribers.setdefault(job_id, []).append(wake)
+            seen = 0
+            try:
+                while True:
+                    wake.clear()
+                    while seen < len(live["events"]):
+                        item = live["events"][seen]
+                        seen += 1
+                        yield item["event"], item["data"]
+                    if live["status"] in FINISHED:
+                        break
+                    await wake.wait()
+            finally:
+                wakes = self._subscribers.get(job_id, [])
+                if wake in wakes:
+                    wakes.remove(wake)
+        else:
+            job = self.store.get(job_id)
+            if job is None:
+                return
+            for item in job["events"]:
+                yield item["event"], item["data"]
+            seen = len(job["events"])
+            # Owned by another worker (disk store): follow it through the store
+            while job is not None and job["status"] not in FINISHED:
+                await asyncio.sleep(self.poll_seconds)
+                job = self.store.get(job_id)
+                if job is None:
+                    return
+                for item in job["events"][seen:]:
+                    yield item["event"], item["data"]
+                seen = len(job["events"])
+
+        job = self.get(job_id)
+        if job is not None:
+            yield "job", job
+
+    async def close(self):
+        """Cancel every job this process owns (call on shutdown)."""
+        tasks = list(self._tasks.items())
+        for job_id, task in tasks:
+            job = self._jobs.get(job_id)
+            if job is not None and job["stage"] == "execution":
+                await asyncio.to_thread(cancel_bigquery_job, job["bigquery_job_id"])
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*(task for _, task in tasks), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.store).__name__,
+            "stored": len(self.store),
+            "active": len(self._tasks),
+            "running": sum(1 for job in self._jobs.values() if job["status"] == "running"),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "max_active": self.max_active,
+        }
+
+
+def _build_job_manager():
+    if not JOBS_ENABLED:
+        return None
+    if JOB_STORE_BACKEND == "disk":
+        store = DiskCacheBackend(JOB_STORE_PATH, JOB_MAX_STORED)
+    else:
+        store = MemoryCacheBackend(JOB_MAX_STORED)
+    return JobManager(store, JOB_TTL_SECONDS, JOB_MAX_ACTIVE, JOB_CONCURRENCY, JOB_POLL_SECONDS)
+
+
+job_manager = _build_job_manager()
@@ -1,32 +1,32 @@
 """
-gemini_client.py - Handles all communication with the Gemini API.
+gemini_client.py - Handles all communication with the LLM.
+Calls are routed per pipeline stage to a provider and model (router.py), wait
+in the scheduler for rate-limit budget (scheduler.py) and reuse the providers'
+keep-alive clients (providers.py). JSON answers are cut at the end of the
+object and can be streamed (stream_parser.py).
 """
+import functools
 import json
-from groq import Groq 
-from app.configuration.config import GROQ_API_KEY, GROQ_MODEL
+from app.llm.router import router, use_transport
+from app.llm.stream_parser import JsonObjectScanner
 
 
-def call_gemini(prompt: str) -> str:
-    
-    """Send a prompt to Groq and return the raw text response."""
-    client = Groq(api_key=GROQ_API_KEY)
-    response = client.chat.completions.create(
-        model=GROQ_MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.1,
-    )
-    return response.choices[0].message.content.strip()
+async def aclose_async_client():
+    """Close the async clients of the running loop (call on app shutdown)."""
+    await router.aclose()
 
 
-
-def call_gemini_for_json(prompt: str) -> dict:
+def set_llm_transport(transport):
     """
-    Send a prompt expecting a JSON response.
-    Strips any accidental markdown fencing and parses to dict.
+    Route every completion through `transport` instead of the configured providers,
+    or restore them with None. The transport needs complete(prompt) -> str and
+    async acomplete(prompt) -> str.
     """
-    raw = call_gemini(prompt)
+    use_transport(transport)
+
 
-    # Strip markdown code fences if present
+def _parse_json_response(raw: str) -> dict:
+    """Strip any accidental markdown fencing and parse to dict."""
     if raw.startswith("```"):
         lines = raw.splitlines()
         lines = [l for l in lines if not l.strip().startswith("```")]
@@ -36,4 +36,38 @@ def call_gemini_for_json(prompt: str) -> dict:
         return json.loads(raw)
     except json.JSONDecodeError as e:
         raise ValueError(f"Groq returned invalid JSON.\nRaw response:\n{raw}\n\nError: {e}")
-    
\ No newline at end of file
+
+
+def _json_scanner(stop_when):
+    return functools.partial(JsonObjectScanner, stop_when)
+
+
+def call_gemini(prompt: str, stage: str = None, scanner=None) -> str:
+    """
+    Send a prompt and return the raw text response.
+    stage ("intent", "sql", "combined") picks the model, see LLM_INTENT_MODEL / LLM_SQL_MODEL.
+    scanner (stream_parser.py) cuts the response where the answer ends.
+    """
+    return router.complete(prompt, stage, scanner=scanner).strip()
+
+
+def call_gemini_for_json(prompt: str, stage: str = None, stop_when=None) -> dict:
+    """
+    Send a prompt expecting a JSON response.
+    Ignores any accidental markdown fencing or trailing text and parses to dict.
+    stop_when(fields) can end the response early, see JsonObjectScanner.
+    """
+    return _parse_json_response(call_gemini(prompt, stage, _json_scanner(stop_when)))
+
+
+async def call_gemini_async(prompt: str, temperature: float = 0.1, stage: str = None, scanner=None) -> str:
+    """
+    Async version of call_gemini. Waits in the scheduler for a slot and
+    rate-limit budget (429s are retried there) and is hedged when slow.
+    """
+    return (await router.acomplete(prompt, stage, temperature, scanner)).strip()
+
+
+async def call_gemini_for_json_async(prompt: str, stage: str = None, stop_when=None) -> dict:
+    """Async version of call_gemini_for_json."""
+    return _parse_json_response(await call_gemini_async(prompt, stage=stage, scanner=_json_scanner(stop_when)))
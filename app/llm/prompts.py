@@ -7,6 +7,10 @@ def build_schema_summary(tables: dict) -> str:
     lines = []
     for table_name, table_info in tables.items():
         lines.append(f"Table: {table_name} — {table_info['description']}")
+        if table_info.get("partitioned_by"):
+            lines.append(f"  (partitioned by {table_info['partitioned_by']}: filter on it to scan less)")
+        if table_info.get("clustered_by"):
+            lines.append(f"  (clustered by {', '.join(table_info['clustered_by'])})")
         for col, meta in table_info["columns"].items():
             fk = f" [FK → {meta['foreign_key']}]" if meta.get("foreign_key") else ""
             pk = " [PK]" if meta.get("primary_key") else ""
@@ -15,19 +19,13 @@ def build_schema_summary(tables: dict) -> str:
     return "\n".join(lines)
 
 
-INTENT_EXTRACTION_PROMPT = """
-You are a SQL intent extractor. Given a user's natural language question and the available database schema, extract the intent as structured JSON.
-
-=== SCHEMA ===
-{schema}
-
-=== USER QUESTION ===
-{question}
+# Prompts are laid out static-first: instructions and schema form a prefix that is
+# byte-identical across requests (so provider-side prompt-prefix caching applies),
+# and the per-request parts (question, intent) come last.
 
-=== INSTRUCTIONS ===
-Respond with ONLY a valid JSON object (no markdown, no explanation). Use this exact structure:
+# Shared blocks (templates, so literal braces are doubled)
 
-{{
+_INTENT_JSON_FORMAT = """{{
   "is_relevant": true or false,           // Is the question answerable using the given tables?
   "irrelevance_reason": "..." or null,    // If not relevant, explain briefly
   "target_tables": ["table1", ...],       // List of tables needed
@@ -68,30 +66,9 @@ Respond with ONLY a valid JSON object (no markdown, no explanation). Use this ex
   ],
   "limit": null or integer,              // LIMIT clause
   "query_intent_summary": "..."          // One-line plain English summary of what query does
-}}
-"""
+}}"""
 
-
-SQL_GENERATION_PROMPT = """
-You are a SQL query generator. Given the structured intent JSON and the database schema, generate a clean, correct SQL query.
-
-=== SCHEMA ===
-{schema}
-
-=== INTENT JSON ===
-{intent_json}
-
-=== ORIGINAL QUESTION ===
-{question}
-
-=== INSTRUCTIONS ===
-- Use the intent JSON as your primary guide. Do NOT add tables or columns not present in the intent.
-- Generate standard SQL (compatible with MySQL/PostgreSQL).
-- Use table aliases where appropriate.
-- If the intent has joins, use them exactly as specified.
-- Return ONLY the SQL query. No explanation, no markdown, no code fences.
-
-=== STRICT SQL RULES ===
+_SQL_RULES = """=== STRICT SQL RULES ===
 - If using COUNT(*) or any aggregate function WITHOUT GROUP BY, do NOT select individual columns — only select the aggregate.
 - If you need BOTH individual columns AND a count, use GROUP BY on ALL non-aggregated columns.
 - NEVER mix individual columns and aggregate functions without a proper GROUP BY clause.
@@ -121,4 +98,83 @@ You are a SQL query generator. Given the structured intent JSON and the database
 - ALWAYS use exact case for status values: 'Processing', 'Complete', 'Cancelled', 'Returned', 'Shipped'
 - NEVER use lowercase status values like 'processing', 'complete', 'cancelled'
 - When unsure about case, use: LOWER(col) = 'value' to make it case insensitive
-"""
\ No newline at end of file
+"""
+
+
+INTENT_EXTRACTION_PREFIX = """
+You are a SQL intent extractor. Given a user's natural language question and the available database schema, extract the intent as structured JSON.
+
+=== INSTRUCTIONS ===
+Respond with ONLY a valid JSON object (no markdown, no explanation). Use this exact structure:
+
+""" + _INTENT_JSON_FORMAT + """
+
+=== SCHEMA ===
+{schema}
+"""
+
+INTENT_EXTRACTION_SUFFIX = """
+=== USER QUESTION ===
+{question}
+"""
+
+INTENT_EXTRACTION_PROMPT = INTENT_EXTRACTION_PREFIX + INTENT_EXTRACTION_SUFFIX
+
+
+SQL_GENERATION_PREFIX = """
+You are a SQL query generator. Given the structured intent JSON and the database schema, generate a clean, correct SQL query.
+
+=== INSTRUCTIONS ===
+- Use the intent JSON as your primary guide. Do NOT add tables or columns not present in the intent.
+- Generate standard SQL (compatible with MySQL/PostgreSQL).
+- Use table aliases where appropriate.
+- If the intent has joins, use them exactly as specified.
+- Return ONLY the SQL query. No explanation, no markdown, no code fences.
+
+""" + _SQL_RULES + """
+=== SCHEMA ===
+{schema}
+"""
+
+SQL_GENERATION_SUFFIX = """
+=== INTENT JSON ===
+{intent_json}
+
+=== ORIGINAL QUESTION ===
+{question}
+"""
+
+SQL_GENERATION_PROMPT = SQL_GENERATION_PREFIX + SQL_GENERATION_SUFFIX
+
+
+# Single-shot mode: intent and SQL in one JSON response (PIPELINE_MODE=combined)
+
+COMBINED_PREFIX = """
+You are a SQL intent extractor and query generator. Given a user's natural language question and the available database schema, extract the intent as structured JSON and write the SQL query that answers it.
+
+=== INSTRUCTIONS ===
+Respond with ONLY a valid JSON object (no markdown, no explanation) with exactly these two keys:
+
+{{
+  "intent": {{ ... }},                    // The intent object, structure below
+  "sql": "..." or null                    // The SQL query as one string; null if the question is not relevant
+}}
+
+The intent object uses this exact structure:
+
+""" + _INTENT_JSON_FORMAT + """
+
+SQL instructions:
+- Write the SQL from the intent object. Do NOT add tables or columns not present in the intent.
+- Use table aliases where appropriate.
+- If the intent has joins, use them exactly as specified.
+- Put the SQL in the "sql" string only. No markdown or code fences inside it.
+
+""" + _SQL_RULES + """
+=== SCHEMA ===
+{schema}
+"""
+
+COMBINED_SUFFIX = INTENT_EXTRACTION_SUFFIX
+
+COMBINED_PROMPT = COMBINED_PREFIX + COMBINED_SUFFIX
@@ -0,0 +1,191 @@
+"""
+providers.py - LLM backends behind one interface, so each pipeline stage can
+use a different model and tests can plug in a local stub. A provider has
+    complete(model, prompt, temperature) -> Completion
+    async acomplete(model, prompt, temperature) -> Completion
+    stream(model, prompt, temperature) -> iterator of Completion deltas
+    astream(model, prompt, temperature) -> async iterator of Completion deltas
+    async aclose()
+and is registered under a name; models are then written "name:model".
+A streamed delta carries the next piece of text; usage, if the provider
+reports it, comes with the last one.
+"""
+import asyncio
+import threading
+import weakref
+from collections import namedtuple
+import httpx
+from groq import Groq, AsyncGroq, DefaultHttpxClient, DefaultAsyncHttpxClient
+from app.configuration.config import (
+    GROQ_API_KEY, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_TIMEOUT_SECONDS,
+)
+
+# usage: the provider's token usage block (prompt_tokens, completion_tokens, total_tokens) or None
+Completion = namedtuple("Completion", "text usage")
+
+DEFAULT_PROVIDER = "groq"
+
+# Rate limits, concurrency and retries are handled by scheduler.py, not the SDK
+_SDK_RETRIES = 0
+
+
+class GroqProvider:
+    """
+    Groq chat completions. Clients are created once and reused so HTTP
+    connections stay alive between calls: one sync client per process, one
+    async client per event loop (httpx pools cannot be shared across loops).
+    """
+
+    def __init__(self, api_key: str = GROQ_API_KEY):
+        self.api_key = api_key
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _http_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        )
+
+    def get_client(self) -> Groq:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = Groq(
+                        api_key=self.api_key,
+                        timeout=LLM_TIMEOUT_SECONDS,
+                        max_retries=_SDK_RETRIES,
+                        http_client=DefaultHttpxClient(limits=self._http_limits()),
+                    )
+        return self._client
+
+    def get_async_client(self) -> AsyncGroq:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = AsyncGroq(
+                api_key=self.api_key,
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=_SDK_RETRIES,
+                http_client=DefaultAsyncHttpxClient(limits=self._http_limits()),
+            )
+        return client
+
+    def complete(self, model: str, prompt: str, temperature: float) -> Completion:
+        response = self.get_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+        )
+        return Completion(response.choices[0].message.content, response.usage)
+
+    async def acomplete(self, model: str, prompt: str, temperature: float) -> Completion:
+        response = await self.get_async_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+        )
+        return Completion(response.choices[0].message.content, response.usage)
+
+    def stream(self, model: str, prompt: str, temperature: float):
+        stream = self.get_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            stream=True,
+        )
+        try:
+            for chunk in stream:
+                yield _delta(chunk)
+        finally:
+            # Closing the response mid-stream stops the download
+            stream.close()
+
+    async def astream(self, model: str, prompt: str, temperature: float):
+        stream = await self.get_async_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            stream=True,
+        )
+        try:
+            async for chunk in stream:
+                yield _delta(chunk)
+        finally:
+            await stream.close()
+
+    async def aclose(self):
+        """Close the async client of the running loop."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+
+def _delta(chunk) -> Completion:
+    """A Groq stream chunk as a Completion delta (Groq reports usage in x_groq on the last chunk)."""
+    text = chunk.choices[0].delta.content if chunk.choices else None
+    usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or getattr(chunk, "usage", None)
+    return Completion(text or "", usage)
+
+
+class TransportProvider:
+    """
+    Adapts an object with complete(prompt) -> str and async acomplete(prompt) -> str
+    (benchmarks/mock_llm.py, test stubs). Model and temperature are ignored.
+    Streams with the transport's stream(prompt) / astream(prompt) text iterators
+    if it has them, else as one delta.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def complete(self, model: str, prompt: str, temperature: float) -> Completion:
+        return Completion(self.transport.complete(prompt), None)
+
+    async def acomplete(self, model: str, prompt: str, temperature: float) -> Completion:
+        return Completion(await self.transport.acomplete(prompt), None)
+
+    def stream(self, model: str, prompt: str, temperature: float):
+        if not hasattr(self.transport, "stream"):
+            yield self.complete(model, prompt, temperature)
+            return
+        for text in self.transport.stream(prompt):
+            yield Completion(text, None)
+
+    async def astream(self, model: str, prompt: str, temperature: float):
+        if not hasattr(self.transport, "astream"):
+            yield await self.acomplete(model, prompt, temperature)
+            return
+        async for text in self.transport.astream(prompt):
+            yield Completion(text, None)
+
+    async def aclose(self):
+        pass
+
+
+_providers = {DEFAULT_PROVIDER: GroqProvider()}
+
+
+def register_provider(name: str, provider):
+    """Make `provider` available as "name:model" (replaces any provider of that name)."""
+    _providers[name] = provider
+
+
+def get_provider(name: str):
+    provider = _providers.get(name)
+    if provider is None:
+        raise ValueError(f"Unknown LLM provider '{name}'. Registered: {', '.join(sorted(_providers))}.")
+    return provider
+
+
+def registered_providers() -> list:
+    return list(_providers.values())
+
+
+def parse_model(spec: str) -> tuple:
+    """'groq:llama-3.1-8b-instant' -> ('groq', 'llama-3.1-8b-instant'); a bare model name is a Groq model."""
+    name, sep, model = spec.partition(":")
+    if not sep:
+        return DEFAULT_PROVIDER, spec
+    return name, model
@@ -0,0 +1,257 @@
+"""
+router.py - Chooses the provider and model for each pipeline stage (intent
+extraction can use a small fast model, SQL generation a larger one) and hedges
+slow calls: when a call has not answered by the LLM_HEDGE_PERCENTILE latency
+of its stage and model, a duplicate goes to LLM_HEDGE_MODEL, the first answer
+wins and the other request is cancelled. A call that fails before then falls
+back to LLM_HEDGE_MODEL straight away. Every request, hedges included,
+waits in the scheduler (rate limits, concurrency, retries).
+Callers can pass a scanner (stream_parser.py) that knows when the answer is
+complete; with LLM_STREAMING_ENABLED the completion is streamed and reading
+stops there.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from app.llm.providers import Completion, TransportProvider, get_provider, parse_model, registered_providers
+from app.llm.scheduler import get_scheduler, run_sync
+from app.llm.stream_parser import scan_text
+from app.monitoring.metrics import LLM_HEDGES, LLM_STREAMS, record_llm_usage
+from app.configuration.config import (
+    LLM_STREAMING_ENABLED, GROQ_MODEL, LLM_INTENT_MODEL, LLM_SQL_MODEL, LLM_HEDGE_MODEL, LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_DELAY_SECONDS, LLM_HEDGE_DEFAULT_DELAY_SECONDS, LLM_HEDGE_MIN_SAMPLES, LLM_LATENCY_WINDOW,
+)
+
+
+class LatencyTracker:
+    """Recent response times per (stage, model), for the hedge deadline."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: tuple, seconds: float):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key: tuple, pct: float, min_samples: int = 1):
+        """The pct-th percentile latency, or None with fewer than min_samples samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            keys = list(self._samples)
+        return {
+            f"{stage}/{model}": {
+                "samples": len(self._samples[(stage, model)]),
+                "p50_ms": round(1000 * self.percentile((stage, model), 50), 1),
+                "p95_ms": round(1000 * self.percentile((stage, model), 95), 1),
+            }
+            for stage, model in keys
+        }
+
+
+class LLMRouter:
+    """
+    routes: stage -> "provider:model" (stages without a route use `default`).
+    hedge: model for hedged duplicates, or None to never hedge.
+    override: provider used for every model, e.g. a stub in tests and benchmarks.
+    stream: stream completions that have a scanner and stop once it is complete.
+    """
+
+    def __init__(self, routes: dict, default: str, hedge: str = None, percentile: float = 95,
+                 min_delay: float = 0.25, default_delay: float = 2.0, min_samples: int = 20, window: int = 500,
+                 stream: bool = False):
+        self.routes = routes
+        self.default = default
+        self.hedge = hedge or None
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.latency = LatencyTracker(window)
+        self.override = None
+        self.stream = stream
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.streams_cut = 0
+
+    def model_for(self, stage: str) -> str:
+        return self.routes.get(stage) or self.default
+
+    def _provider(self, spec: str):
+        name, model = parse_model(spec)
+        return (self.override or get_provider(name)), model
+
+    def hedge_delay(self, stage: str, spec: str) -> float:
+        """How long to wait for `spec` before hedging: its recent percentile latency, floored at min_delay."""
+        observed = self.latency.percentile((stage, spec), self.percentile, self.min_samples)
+        return max(self.min_delay, self.default_delay if observed is None else observed)
+
+    # -- streaming --
+
+    def _read(self, stage: str, deltas, scanner) -> Completion:
+        usage, cut = None, False
+        try:
+            for delta in deltas:
+                usage = delta.usage or usage
+                if scanner.feed(delta.text):
+                    cut = True
+                    break
+        finally:
+            deltas.close()
+        return self._streamed(stage, scanner, usage, cut)
+
+    async def _aread(self, stage: str, deltas, scanner) -> Completion:
+        usage, cut = None, False
+        try:
+            async for delta in deltas:
+                usage = delta.usage or usage
+                if scanner.feed(delta.text):
+                    cut = True
+                    break
+        finally:
+            await deltas.aclose()
+        return self._streamed(stage, scanner, usage, cut)
+
+    def _streamed(self, stage: str, scanner, usage, cut: bool) -> Completion:
+        # A stream closed early reports no usage: the scheduler keeps its token estimate
+        if cut:
+            self.streams_cut += 1
+        LLM_STREAMS.inc(stage=stage or "other", ended="early" if cut else "full")
+        return Completion(scanner.result(), usage)
+
+    # -- sync --
+
+    def complete(self, prompt: str, stage: str = None, temperature: float = 0.1, scanner=None) -> str:
+        """
+        Blocking completion (CLI / worker threads): routed, but never hedged.
+        scanner: stream_parser scanner class (or factory); the answer ends where it says.
+        """
+        spec = self.model_for(stage)
+        provider, model = self._provider(spec)
+
+        def send():
+            started = time.perf_counter()
+            if scanner is not None and self.stream:
+                completion = self._read(stage, provider.stream(model, prompt, temperature), scanner())
+            else:
+                completion = provider.complete(model, prompt, temperature)
+                if scanner is not None:
+                    completion = completion._replace(text=scan_text(scanner(), completion.text))
+            self.latency.observe((stage, spec), time.perf_counter() - started)
+            return completion
+
+        completion = run_sync(send, prompt)
+        record_llm_usage(completion.usage)
+        return completion.text
+
+    # -- async --
+
+    async def _call(self, stage: str, spec: str, prompt: str, temperature: float, scanner):
+        provider, model = self._provider(spec)
+
+        async def send():
+            # Latency of the provider itself (to the end of the answer), without time queued in the scheduler
+            started = time.perf_counter()
+            if scanner is not None and self.stream:
+                completion = await self._aread(stage, provider.astream(model, prompt, temperature), scanner())
+            else:
+                completion = await provider.acomplete(model, prompt, temperature)
+                if scanner is not None:
+                    completion = completion._replace(text=scan_text(scanner(), completion.text))
+            self.latency.observe((stage, spec), time.perf_counter() - started)
+            return completion
+
+        return await get_scheduler().run(send, prompt)
+
+    async def acomplete(self, prompt: str, stage: str = None, temperature: float = 0.1, scanner=None) -> str:
+        spec = self.model_for(stage)
+        if self.hedge is None:
+            completion = await self._call(stage, spec, prompt, temperature, scanner)
+            record_llm_usage(completion.usage)
+            return completion.text
+
+        primary = asyncio.ensure_future(self._call(stage, spec, prompt, temperature, scanner))
+        hedge = None
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay(stage, spec))
+            if not done:
+                self.hedged += 1
+                hedge = asyncio.ensure_future(self._call(stage, self.hedge, prompt, temperature, scanner))
+                pending.add(hedge)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()     # the other request may still answer
+                        if hedge is None:
+                            # Failed before the hedge deadline: fall back to the hedge model now
+                            self.hedged += 1
+                            hedge = asyncio.ensure_future(self._call(stage, self.hedge, prompt, temperature, scanner))
+                            pending.add(hedge)
+                        continue
+                    if hedge is not None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        LLM_HEDGES.inc(stage=stage or "other", winner="hedge" if task is hedge else "primary")
+                    completion = task.result()
+                    record_llm_usage(completion.usage)
+                    return completion.text
+            raise error
+        finally:
+            # Cancel the slower request (or both, if our caller was cancelled)
+            for task in pending:
+                task.cancel()
+
+    async def aclose(self):
+        """Close every provider's clients for the running loop (call on app shutdown)."""
+        for provider in registered_providers():
+            await provider.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "routes": {stage: self.model_for(stage) for stage in ("intent", "sql", "combined")},
+            "hedge_model": self.hedge,
+            "hedge_percentile": self.percentile,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "streaming": self.stream,
+            "streams_cut_early": self.streams_cut,
+            "override": type(self.override).__name__ if self.override is not None else None,
+            "latency": self.latency.stats(),
+        }
+
+
+router = LLMRouter(
+    routes={"intent": LLM_INTENT_MODEL, "sql": LLM_SQL_MODEL, "combined": LLM_SQL_MODEL},
+    default=GROQ_MODEL,
+    hedge=LLM_HEDGE_MODEL,
+    percentile=LLM_HEDGE_PERCENTILE,
+    min_delay=LLM_HEDGE_MIN_DELAY_SECONDS,
+    default_delay=LLM_HEDGE_DEFAULT_DELAY_SECONDS,
+    min_samples=LLM_HEDGE_MIN_SAMPLES,
+    window=LLM_LATENCY_WINDOW,
+    stream=LLM_STREAMING_ENABLED,
+)
+
+
+def set_override(provider):
+    """Send every call to `provider` (None restores the configured routes)."""
+    router.override = provider
+
+
+def use_transport(transport):
+    """Send every call to a transport object (complete / acomplete), or restore the routes with None."""
+    set_override(TransportProvider(transport) if transport is not None else None)
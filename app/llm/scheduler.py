@@ -0,0 +1,330 @@
+"""
+scheduler.py - Backpressure for LLM calls, so bursts queue here instead of
+turning into Groq 429s. Every completion waits for:
+  - the requests/min and tokens/min budgets (token buckets shared by all
+    threads and loops; prompt tokens are estimated before sending and
+    corrected with the reported usage afterwards)
+  - a concurrency limit that grows by one per round of successful calls and
+    halves on a 429/503 (AIMD), between LLM_MIN_CONCURRENCY and
+    LLM_MAX_CONCURRENT_REQUESTS
+Waiting calls are served by priority (interactive /ask before batch and
+async jobs), then in arrival order. A 429/503 blocks dispatch for its
+retry-after; it and other transient failures are retried with jittered
+exponential backoff, up to LLM_RETRIES times.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+import httpx
+from groq import APIConnectionError
+from app.configuration.config import (
+    LLM_MAX_CONCURRENT_REQUESTS, LLM_MIN_CONCURRENCY, LLM_RATE_LIMIT_RPM, LLM_RATE_LIMIT_TPM,
+    LLM_COMPLETION_TOKEN_ESTIMATE, LLM_RETRIES, LLM_BACKOFF_BASE_SECONDS, LLM_BACKOFF_MAX_SECONDS,
+)
+from app.monitoring.metrics import LLM_QUEUE_SECONDS, LLM_THROTTLED
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+THROTTLE_STATUSES = (429, 503)
+TRANSIENT_STATUSES = (408, 500, 502, 504)
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """LLM calls made inside (including by tasks created inside) are queued at this priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Tokens the call will be billed: ~4 characters per prompt token plus the expected completion."""
+    return len(prompt) // 4 + LLM_COMPLETION_TOKEN_ESTIMATE
+
+
+class TokenBucket:
+    """per_minute units, refilled continuously; per_minute <= 0 means unlimited."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.per_minute, self.level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount is available. A call larger than the whole budget waits for a full bucket."""
+        if self.per_minute <= 0:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (min(amount, self.per_minute) - self.level) * 60 / self.per_minute)
+
+    def take(self, amount: float):
+        if self.per_minute > 0:
+            self.level -= amount    # may go negative: later calls wait for the overdraft
+
+
+class RateLimits:
+    """Process-wide Groq budget (limits are per API key, not per worker thread or loop)."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0     # monotonic time a 429 asked us to wait until
+        self._lock = threading.Lock()
+
+    def try_take(self, tokens: int) -> float:
+        """Take one request and `tokens` tokens and return 0, or return the seconds to wait first."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self.blocked_until - now,
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(tokens, now),
+            )
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            return 0.0
+
+    def correct(self, estimated: int, usage):
+        """Replace the estimate with the usage Groq reported."""
+        total = getattr(usage, "total_tokens", None)
+        if total:
+            with self._lock:
+                self.tokens.take(total - estimated)
+
+    def block(self, seconds: float):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self.requests.wait_time(0, now)
+            self.tokens.wait_time(0, now)
+            return {
+                "rpm": self.requests.per_minute or None,
+                "tpm": self.tokens.per_minute or None,
+                "requests_available": round(self.requests.level, 1) if self.requests.per_minute > 0 else None,
+                "tokens_available": round(self.tokens.level) if self.tokens.per_minute > 0 else None,
+                "blocked_seconds": round(max(0.0, self.blocked_until - now), 2),
+            }
+
+
+def _failure_kind(error: Exception):
+    """'throttled' (429/503), 'transient' (other 5xx, timeouts, connection errors) or None (not retryable)."""
+    status = getattr(error, "status_code", None)
+    if status in THROTTLE_STATUSES:
+        return "throttled"
+    if status in TRANSIENT_STATUSES or isinstance(error, (APIConnectionError, httpx.TransportError)):
+        return "transient"
+    return None
+
+
+def _retry_after(error: Exception):
+    """Seconds from the retry-after-ms / retry-after header of a failed response, or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                pass    # HTTP-date form: fall back to backoff
+    return None
+
+
+def _backoff(attempt: int, retry_after) -> float:
+    """At least retry-after (else exponential), plus up to 50% jitter so retries don't arrive together."""
+    delay = retry_after if retry_after is not None else LLM_BACKOFF_BASE_SECONDS * 2 ** attempt
+    delay = min(delay, LLM_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(1.0, 1.5)
+
+
+class LLMScheduler:
+    """Priority queue + AIMD concurrency limit for the calls of one event loop."""
+
+    def __init__(self, limits: RateLimits, max_concurrency: int, min_concurrency: int):
+        self.limits = limits
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = max(1, min(min_concurrency, max_concurrency))
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self._waiters = []                 # heap of (priority, seq, future, tokens)
+        self._seq = itertools.count()
+        self._timer = None
+        self._decrease_hold = 0.0          # no second halving until the first 429 burst has passed
+        self.completed = 0
+        self.throttled = 0
+        self.decreases = 0
+
+    async def _acquire(self, tokens: int, priority: int, seq: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, seq, future, tokens))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()     # granted just as the caller went away
+            raise
+
+    def _dispatch(self):
+        """Grant slots to the head of the queue while the limit and the budgets allow."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiters:
+            _, _, future, tokens = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)     # caller cancelled
+                continue
+            if self.in_flight >= int(self.limit):
+                return                           # _release dispatches again
+            wait = self.limits.try_take(tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _on_success(self):
+        self.completed += 1
+        # Additive increase: +1 per limit's worth of successful calls
+        self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+    def _on_throttled(self, retry_after):
+        self.throttled += 1
+        now = time.monotonic()
+        if now >= self._decrease_hold:
+            # Multiplicative decrease, once per burst of 429s
+            self.limit = max(float(self.min_concurrency), self.limit / 2)
+            self.decreases += 1
+            self._decrease_hold = now + max(retry_after or 0.0, 1.0)
+        if retry_after:
+            self.limits.block(retry_after)
+
+    async def run(self, send, prompt: str):
+        """
+        await send() once the scheduler admits it, retrying rate-limited and
+        transient failures. send() returns the completion (its .usage, if any,
+        corrects the token estimate).
+        """
+        priority = _priority.get()
+        seq = next(self._seq)       # kept across retries so a retry is not sent to the back
+        tokens = estimate_tokens(prompt)
+        for attempt in itertools.count():
+            queued = time.perf_counter()
+            await self._acquire(tokens, priority, seq)
+            LLM_QUEUE_SECONDS.observe(time.perf_counter() - queued, priority=PRIORITY_NAMES.get(priority, priority))
+            try:
+                response = await send()
+            except asyncio.CancelledError:
+                self._release()     # e.g. the losing request of a hedge
+                raise
+            except Exception as e:
+                kind = _failure_kind(e)
+                retry_after = _retry_after(e)
+                if kind == "throttled":
+                    self._on_throttled(retry_after)
+                self._release()
+                if kind is None:
+                    raise
+                if attempt >= LLM_RETRIES:
+                    LLM_THROTTLED.inc(reason=kind, outcome="gave_up")
+                    raise
+                LLM_THROTTLED.inc(reason=kind, outcome="retried")
+                await asyncio.sleep(_backoff(attempt, retry_after))
+                continue
+            self._on_success()
+            self._release()
+            self.limits.correct(tokens, getattr(response, "usage", None))
+            return response
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": sum(1 for _, _, future, _ in self._waiters if not future.done()),
+            "completed": self.completed,
+            "throttled": self.throttled,
+            "limit_decreases": self.decreases,
+        }
+
+
+rate_limits = RateLimits(LLM_RATE_LIMIT_RPM, LLM_RATE_LIMIT_TPM)
+
+# One scheduler per event loop (futures and timers are loop-bound); the budget is shared
+_schedulers = weakref.WeakKeyDictionary()
+
+# Sync callers (CLI, worker threads) share the budget but not the async queue
+_sync_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENT_REQUESTS)
+
+
+def get_scheduler() -> LLMScheduler:
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = LLMScheduler(rate_limits, LLM_MAX_CONCURRENT_REQUESTS, LLM_MIN_CONCURRENCY)
+    return scheduler
+
+
+def run_sync(send, prompt: str):
+    """Blocking counterpart of LLMScheduler.run: fixed concurrency, shared budget, same retries."""
+    tokens = estimate_tokens(prompt)
+    for attempt in itertools.count():
+        with _sync_slots:
+            while (wait := rate_limits.try_take(tokens)) > 0:
+                time.sleep(wait)
+            try:
+                response = send()
+            except Exception as e:
+                kind = _failure_kind(e)
+                retry_after = _retry_after(e)
+                if kind is None:
+                    raise
+                if kind == "throttled" and retry_after:
+                    rate_limits.block(retry_after)
+                if attempt >= LLM_RETRIES:
+                    LLM_THROTTLED.inc(reason=kind, outcome="gave_up")
+                    raise
+                LLM_THROTTLED.inc(reason=kind, outcome="retried")
+                backoff = _backoff(attempt, retry_after)
+            else:
+                rate_limits.correct(tokens, getattr(response, "usage", None))
+                return response
+        time.sleep(backoff)
+
+
+def scheduler_stats() -> dict:
+    """Budget plus the queue of the calling event loop."""
+    stats = {"budget": rate_limits.stats()}
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return stats
+    scheduler = _schedulers.get(loop)
+    if scheduler is not None:
+        stats.update(scheduler.stats())
+    return stats
@@ -0,0 +1,196 @@
+"""
+stream_parser.py - Incremental scanners that tell when a streamed completion
+holds a whole answer, so the rest of the stream (trailing explanations, a
+second statement) is never waited for. Feed text as it arrives:
+
+    scanner = SqlStatementScanner()
+    for delta in stream:
+        if scanner.feed(delta):
+            break               # complete: stop reading
+    answer = scanner.result()
+
+The same scanners trim non-streamed completions, so both paths return the
+same answer.
+"""
+import json
+
+_FENCE = "```"
+
+
+class JsonObjectScanner:
+    """
+    The first top-level JSON object, ignoring text (markdown fences, prose)
+    before and after it. Top-level members are parsed as soon as they close,
+    into `fields`; stop_when(fields) -> True ends the scan early with just the
+    members seen so far (e.g. an off-topic verdict needs nothing after it).
+    """
+
+    def __init__(self, stop_when=None):
+        self.stop_when = stop_when
+        self.text = ""
+        self.done = False
+        self.stopped_early = False
+        self.fields = {}
+        self._pos = 0
+        self._start = None          # index of the opening brace
+        self._end = None            # index just past the object (or its last complete member)
+        self._member_start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> bool:
+        """Add streamed text; True once the object is complete (further text is ignored)."""
+        if self.done:
+            return True
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if self._start is None:
+                if char == "{":
+                    self._start = self._member_start = i + 1
+                    self._depth = 1
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close_member(i)
+                    self._end = i + 1
+                    self.done = True
+                    self._pos = i + 1
+                    return True
+            elif char == "," and self._depth == 1:
+                self._close_member(i)
+                if self.stop_when is not None and self.stop_when(self.fields):
+                    self._end = i
+                    self.done = self.stopped_early = True
+                    self._pos = i + 1
+                    return True
+                self._member_start = i + 1
+        self._pos = len(text)
+        return False
+
+    def _close_member(self, end: int):
+        member = self.text[self._member_start:end].strip()
+        if not member:
+            return
+        try:
+            self.fields.update(json.loads("{" + member + "}"))
+        except json.JSONDecodeError:
+            pass        # the full parse reports it
+
+    def result(self) -> str:
+        """The object's text (closed after the last member when stopped early), or all text if incomplete."""
+        if not self.done:
+            return self.text
+        if self.stopped_early:
+            return self.text[self._start - 1:self._end] + "}"
+        return self.text[self._start - 1:self._end]
+
+
+class SqlStatementScanner:
+    """
+    The first SQL statement: complete at a ';' outside string literals, quoted
+    identifiers and comments, or at a closing code fence. An opening fence
+    (```sql) is dropped. A statement with neither is complete when the stream ends.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._body = None           # index where the statement starts (after any opening fence)
+        self._end = None
+        self._quote = None          # ' " ` -- or /* while inside one
+        self._escape = False
+
+    def feed(self, chunk: str) -> bool:
+        """Add streamed text; True once the statement is complete."""
+        if self.done:
+            return True
+        self.text += chunk
+        text = self.text
+        i = self._pos
+        while i < len(text):
+            if self._body is None:
+                stripped = text[i:].lstrip()
+                if len(stripped) < len(_FENCE) and _FENCE.startswith(stripped):
+                    break               # may be the start of a fence: wait
+                if stripped.startswith(_FENCE):
+                    newline = text.find("\n", i)
+                    if newline < 0:
+                        break           # the fence's language tag is still arriving
+                    i = newline + 1
+                self._body = i
+                continue
+
+            char = text[i]
+            quote = self._quote
+            if quote in ("'", '"', "`"):
+                if self._escape:
+                    self._escape = False
+                elif char == "\\" and quote != "`":
+                    self._escape = True
+                elif char == quote:
+                    self._quote = None
+                i += 1
+                continue
+            if quote == "--":
+                if char == "\n":
+                    self._quote = None
+                i += 1
+                continue
+            if quote == "/*":
+                if text.startswith("*/", i):
+                    self._quote = None
+                    i += 2
+                elif char == "*" and i + 1 == len(text):
+                    break
+                else:
+                    i += 1
+                continue
+
+            if char in "-/`" and i + 2 >= len(text):
+                break                   # need the next characters to tell what this starts
+            if char == ";":
+                self._end = i + 1
+                self.done = True
+                break
+            if text.startswith(_FENCE, i):
+                self._end = i
+                self.done = True
+                break
+            if text.startswith("--", i) or text.startswith("/*", i):
+                self._quote = text[i:i + 2]
+                i += 2
+                continue
+            if char in "'\"`":
+                self._quote = char
+            i += 1
+        self._pos = i
+        return self.done
+
+    def result(self) -> str:
+        """The statement (ending at its ';'), or everything after the opening fence if incomplete."""
+        start = self._body or 0
+        end = self._end if self.done else len(self.text)
+        return self.text[start:end].strip()
+
+
+def scan_text(scanner, text: str) -> str:
+    """Run a scanner over an already complete response."""
+    scanner.feed(text)
+    return scanner.result()
@@ -0,0 +1,249 @@
+"""
+metrics.py - Hot-path instrumentation: Prometheus-style counters and histograms
+(rendered by GET /metrics) plus a per-request timing breakdown carried in a
+context variable, so stage timers, LLM token usage and BigQuery job stats land
+on the request that caused them without being passed through every call.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: tuple, values: tuple, extra: tuple = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        # Unlabelled counters are exported as 0 before their first increment
+        self._values = {} if labels else {(): 0.0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, "") for name in self.labels), 0.0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                labels = _label_text(self.labels, key)
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = _label_text(self.labels, key, (("le", f"{bound:g}"),))
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _label_text(self.labels, key, (("le", "+Inf"),))
+                lines.append(f"{self.name}_bucket{le} {series[-1]}")
+                lines.append(f"{self.name}_sum{labels} {series[-2]:g}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+# --- Metrics ---
+
+REQUESTS = Counter("nl2sql_requests_total", "Pipeline runs by mode and outcome.", ("mode", "outcome"))
+STAGE_SECONDS = Histogram("nl2sql_stage_duration_seconds", "Time spent per pipeline stage.", ("stage",))
+LLM_CALLS = Counter("nl2sql_llm_calls_total", "LLM completions by pipeline stage.", ("stage",))
+LLM_TOKENS = Counter("nl2sql_llm_tokens_total", "LLM tokens by pipeline stage and kind.", ("stage", "kind"))
+RETRIES = Counter("nl2sql_sql_retries_total", "SQL regenerations after a validation failure.")
+LLM_QUEUE_SECONDS = Histogram("nl2sql_llm_queue_seconds", "Time LLM calls waited in the scheduler, by priority.", ("priority",))
+LLM_THROTTLED = Counter("nl2sql_llm_throttled_total", "LLM calls that failed retryably, by reason (throttled = 429/503, transient) and outcome (retried, gave_up).", ("reason", "outcome"))
+LLM_HEDGES = Counter("nl2sql_llm_hedges_total", "Hedged LLM calls by stage and which request answered (primary, hedge).", ("stage", "winner"))
+LLM_STREAMS = Counter("nl2sql_llm_streams_total", "Streamed LLM completions by stage and whether reading stopped once the answer was complete (early) or ran to the end (full).", ("stage", "ended"))
+FAST_PATH = Counter("nl2sql_fast_path_total", "Rule-based fast path attempts by result (hit, miss, rejected).", ("result",))
+SQL_COMPILER = Counter("nl2sql_sql_compiler_total", "Intents compiled to SQL without the LLM, by result (accepted, rejected, unsupported).", ("result",))
+SQL_REPAIRS = Counter("nl2sql_sql_repairs_total", "Generated queries fixed locally, by whether the fixed query validated (accepted, rejected).", ("result",))
+FALLBACKS = Counter("nl2sql_combined_fallbacks_total", "Combined-mode runs that fell back to two stages.")
+CACHE_LOOKUPS = Counter("nl2sql_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"))
+BQ_JOBS = Counter("bigquery_jobs_total", "BigQuery query jobs run.", ("cache_hit",))
+BQ_BYTES = Counter("bigquery_bytes_processed_total", "Bytes processed by BigQuery query jobs.")
+BQ_SLOT_MS = Counter("bigquery_slot_milliseconds_total", "Slot time consumed by BigQuery query jobs.")
+COALESCED = Counter("nl2sql_single_flight_calls_total", "Single-flight calls that started (leader) or joined (follower) a computation.", ("flight", "role"))
+COST_GATE = Counter("nl2sql_cost_gate_total", "Cost gate decisions on generated SQL.", ("action",))
+JOBS = Counter("nl2sql_jobs_total", "Async jobs by final status (done, failed, cancelled).", ("status",))
+
+REGISTRY = [
+    REQUESTS, STAGE_SECONDS, LLM_CALLS, LLM_TOKENS, LLM_QUEUE_SECONDS, LLM_THROTTLED, LLM_HEDGES, LLM_STREAMS, RETRIES, FAST_PATH, SQL_COMPILER, SQL_REPAIRS, FALLBACKS, CACHE_LOOKUPS,
+    BQ_JOBS, BQ_BYTES, BQ_SLOT_MS, COST_GATE, COALESCED, JOBS,
+]
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition of every metric."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Per-request timings ---
+
+class RequestTimings:
+    """Everything measured while serving one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.cache_hit = False
+        self.bq_bytes_processed = 0
+        self.bq_slot_millis = 0
+        self.bq_estimated_bytes = None
+
+    def add_stage(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def summary(self) -> dict:
+        return {
+            "total_ms": round(1000 * (time.perf_counter() - self.started), 2),
+            "stages_ms": {stage: round(1000 * seconds, 2) for stage, seconds in self.stages.items()},
+            "llm_calls": self.llm_calls,
+            "llm_tokens": {"prompt": self.prompt_tokens, "completion": self.completion_tokens},
+            "retries": self.retries,
+            "cache_hit": self.cache_hit,
+            "bigquery": {
+                "estimated_bytes": self.bq_estimated_bytes,
+                "bytes_processed": self.bq_bytes_processed,
+                "slot_millis": self.bq_slot_millis,
+            },
+        }
+
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+_current_stage = contextvars.ContextVar("pipeline_stage", default=None)
+
+
+def current_timings():
+    return _request_timings.get()
+
+
+@contextmanager
+def track_request():
+    """
+    Collect timings for the enclosed work. Nested calls share the outer request's
+    timings, so /ask can wrap both the pipeline and query execution.
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        yield timings
+        return
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a pipeline stage; LLM usage recorded inside it is attributed to the stage."""
+    token = _current_stage.set(stage)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _current_stage.reset(token)
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.add_stage(stage, elapsed)
+
+
+def record_llm_usage(usage):
+    """Count one completion and its token usage (the `usage` block of a Groq response, may be None)."""
+    stage = _current_stage.get() or "other"
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    LLM_CALLS.inc(stage=stage)
+    LLM_TOKENS.inc(prompt, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(completion, stage=stage, kind="completion")
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.llm_calls += 1
+        timings.prompt_tokens += prompt
+        timings.completion_tokens += completion
+
+
+def record_retry():
+    RETRIES.inc()
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.retries += 1
+
+
+def record_cache_lookup(cache: str, result: str):
+    """result: hit | near_hit | miss"""
+    CACHE_LOOKUPS.inc(cache=cache, result=result)
+    timings = _request_timings.get()
+    if timings is not None and result != "miss":
+        timings.cache_hit = True
+
+
+def record_bigquery_job(job):
+    """Bytes processed and slot time of a finished BigQuery query job."""
+    bytes_processed = job.total_bytes_processed or 0
+    slot_millis = job.slot_millis or 0
+    BQ_JOBS.inc(cache_hit=str(bool(job.cache_hit)).lower())
+    BQ_BYTES.inc(bytes_processed)
+    BQ_SLOT_MS.inc(slot_millis)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.bq_bytes_processed += bytes_processed
+        timings.bq_slot_millis += slot_millis
@@ -0,0 +1,63 @@
+"""
+pipeline_stats.py - Rolling latency statistics per pipeline mode, so the
+two_stage and combined modes can be compared on live traffic.
+"""
+import threading
+from collections import deque
+from app.configuration.config import PIPELINE_STATS_WINDOW
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class PipelineStats:
+    """Counts and the last `window` latencies for each mode (cache hits are not recorded)."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._lock = threading.Lock()
+        self._modes = {}
+
+    def record(self, mode: str, seconds: float, success: bool, llm_calls: int, fallback: bool = False):
+        with self._lock:
+            entry = self._modes.get(mode)
+            if entry is None:
+                entry = self._modes[mode] = {
+                    "requests": 0, "successes": 0, "fallbacks": 0, "llm_calls": 0,
+                    "latencies": deque(maxlen=self.window),
+                }
+            entry["requests"] += 1
+            entry["successes"] += int(success)
+            entry["fallbacks"] += int(fallback)
+            entry["llm_calls"] += llm_calls
+            entry["latencies"].append(seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {}
+            for mode, entry in self._modes.items():
+                latencies = sorted(entry["latencies"])
+                out[mode] = {
+                    "requests": entry["requests"],
+                    "successes": entry["successes"],
+                    "fallbacks": entry["fallbacks"],
+                    "avg_llm_calls": round(entry["llm_calls"] / entry["requests"], 2),
+                    "latency_ms": {
+                        "avg": round(1000 * sum(latencies) / len(latencies), 1),
+                        "p50": round(1000 * _percentile(latencies, 50), 1),
+                        "p95": round(1000 * _percentile(latencies, 95), 1),
+                        "max": round(1000 * latencies[-1], 1),
+                    },
+                }
+            return out
+
+    def reset(self):
+        with self._lock:
+            self._modes.clear()
+
+
+pipeline_stats = PipelineStats(PIPELINE_STATS_WINDOW)
@@ -0,0 +1,400 @@
+"""
+catalog.py - Live schema catalog. Tables, columns, types, partitioning and
+clustering are read from BigQuery INFORMATION_SCHEMA (or PostgreSQL
+information_schema), saved to a local JSON snapshot that is loaded at startup,
+and refreshed in the background: only tables whose version (BigQuery
+last-modified time, a column signature on PostgreSQL) changed are described
+again. A changed schema is swapped in with reload_schema_index(), so running
+workers pick it up on their next request.
+Descriptions, primary and foreign keys come from the catalog where the database
+declares them, else from the hand-written schema.py, else from naming
+(`id` is the key, `<table>_id` references it).
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from app.bigquery_client import DATASET, execute_bigquery
+from app.schemas.schema import TABLES
+from app.schemas.schema_index import reload_schema_index
+from app.configuration.config import (
+    CATALOG_ENABLED, CATALOG_SOURCE, CATALOG_SNAPSHOT_PATH, CATALOG_REFRESH_SECONDS, CATALOG_TABLES,
+    CATALOG_PG_SCHEMA,
+)
+
+logger = logging.getLogger(__name__)
+
+_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _in_list(names) -> str:
+    """SQL IN list of table names (already checked against _NAME_RE)."""
+    return ", ".join(f"'{name}'" for name in names)
+
+
+class BigQueryCatalogSource:
+    """Reads one dataset's tables through its INFORMATION_SCHEMA views."""
+
+    name = "bigquery"
+
+    def __init__(self, dataset: str = DATASET):
+        self.dataset = dataset
+
+    def _rows(self, sql: str) -> list:
+        result = execute_bigquery(sql)
+        if not result["success"]:
+            raise RuntimeError(result["error"])
+        return result["rows"]
+
+    def table_versions(self) -> dict:
+        """table -> last modified time (ms); changes with data loads and schema changes."""
+        rows = self._rows(f"SELECT table_id, last_modified_time FROM `{self.dataset}.__TABLES__` WHERE type = 1")
+        return {row["table_id"]: row["last_modified_time"] for row in rows}
+
+    def describe(self, tables: list) -> dict:
+        """Catalog entries (see SchemaCatalog) for the given tables."""
+        names = _in_list(tables)
+        columns = self._rows(
+            "SELECT c.table_name, c.column_name, c.data_type, c.is_partitioning_column,"
+            " c.clustering_ordinal_position, f.description"
+            f" FROM `{self.dataset}.INFORMATION_SCHEMA.COLUMNS` c"
+            f" LEFT JOIN `{self.dataset}.INFORMATION_SCHEMA.COLUMN_FIELD_PATHS` f"
+            "  ON f.table_name = c.table_name AND f.field_path = c.column_name"
+            f" WHERE c.table_name IN ({names})"
+            " ORDER BY c.table_name, c.ordinal_position"
+        )
+        options = self._rows(
+            "SELECT table_name, option_value"
+            f" FROM `{self.dataset}.INFORMATION_SCHEMA.TABLE_OPTIONS`"
+            f" WHERE option_name = 'description' AND table_name IN ({names})"
+        )
+        try:
+            keys = self._rows(
+                "SELECT k.table_name, k.column_name, t.constraint_type, u.table_name AS ref_table,"
+                " u.column_name AS ref_column"
+                f" FROM `{self.dataset}.INFORMATION_SCHEMA.KEY_COLUMN_USAGE` k"
+                f" JOIN `{self.dataset}.INFORMATION_SCHEMA.TABLE_CONSTRAINTS` t USING (constraint_name)"
+                f" LEFT JOIN `{self.dataset}.INFORMATION_SCHEMA.CONSTRAINT_COLUMN_USAGE` u"
+                "  ON u.constraint_name = k.constraint_name AND t.constraint_type = 'FOREIGN KEY'"
+                f" WHERE k.table_name IN ({names})"
+            )
+        except RuntimeError as e:
+            # Key constraints are optional metadata; names and schema.py fill the gap
+            logger.debug("No key constraints for %s: %s", self.dataset, e)
+            keys = []
+
+        described = {table: {"description": None, "columns": {}, "partitioning": None, "clustering": []}
+                     for table in tables}
+        for row in columns:
+            entry = described[row["table_name"]]
+            entry["columns"][row["column_name"]] = {
+                "type": row["data_type"], "description": row["description"] or None,
+                "primary_key": False, "foreign_key": None,
+            }
+            if row["is_partitioning_column"] == "YES":
+                entry["partitioning"] = row["column_name"]
+            if row["clustering_ordinal_position"] is not None:
+                entry["clustering"].append((row["clustering_ordinal_position"], row["column_name"]))
+        for row in options:
+            # option_value is a quoted string literal: "text"
+            described[row["table_name"]]["description"] = row["option_value"].strip('"') or None
+        _apply_keys(described, keys)
+        for entry in described.values():
+            entry["clustering"] = [name for _, name in sorted(entry["clustering"])]
+        return {table: entry for table, entry in described.items() if entry["columns"]}
+
+
+class PostgresCatalogSource:
+    """Reads one PostgreSQL schema through information_schema."""
+
+    name = "postgres"
+
+    def __init__(self, schema: str = CATALOG_PG_SCHEMA):
+        self.schema = schema
+
+    def _rows(self, sql: str, params: tuple) -> list:
+        from app.execution.database import pooled_connection
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                columns = [col.name for col in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor]
+
+    def table_versions(self) -> dict:
+        """table -> signature of its columns; PostgreSQL keeps no last-modified time for DDL."""
+        rows = self._rows(
+            "SELECT table_name, md5(string_agg(column_name || ':' || data_type, ',' ORDER BY ordinal_position))"
+            " AS version FROM information_schema.columns WHERE table_schema = %s GROUP BY table_name",
+            (self.schema,),
+        )
+        return {row["table_name"]: row["version"] for row in rows}
+
+    def describe(self, tables: list) -> dict:
+        columns = self._rows(
+            "SELECT c.table_name, c.column_name, c.data_type,"
+            " col_description(format('%%I.%%I', c.table_schema, c.table_name)::regclass, c.ordinal_position) AS description"
+            " FROM information_schema.columns c"
+            " WHERE c.table_schema = %s AND c.table_name = ANY(%s)"
+            " ORDER BY c.table_name, c.ordinal_position",
+            (self.schema, list(tables)),
+        )
+        comments = self._rows(
+            "SELECT c.relname AS table_name, obj_description(c.oid, 'pg_class') AS description,"
+            " pg_get_partkeydef(c.oid) AS partitioning"
+            " FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace"
+            " WHERE n.nspname = %s AND c.relname = ANY(%s)",
+            (self.schema, list(tables)),
+        )
+        keys = self._rows(
+            "SELECT k.table_name, k.column_name, t.constraint_type, u.table_name AS ref_table,"
+            " u.column_name AS ref_column"
+            " FROM information_schema.key_column_usage k"
+            " JOIN information_schema.table_constraints t"
+            "  ON t.constraint_name = k.constraint_name AND t.table_schema = k.table_schema"
+            " LEFT JOIN information_schema.constraint_column_usage u"
+            "  ON u.constraint_name = k.constraint_name AND t.constraint_type = 'FOREIGN KEY'"
+            " WHERE k.table_schema = %s AND k.table_name = ANY(%s)",
+            (self.schema, list(tables)),
+        )
+
+        described = {table: {"description": None, "columns": {}, "partitioning": None, "clustering": []}
+                     for table in tables}
+        for row in columns:
+            described[row["table_name"]]["columns"][row["column_name"]] = {
+                "type": row["data_type"].upper(), "description": row["description"],
+                "primary_key": False, "foreign_key": None,
+            }
+        for row in comments:
+            described[row["table_name"]]["description"] = row["description"]
+            described[row["table_name"]]["partitioning"] = row["partitioning"]
+        _apply_keys(described, keys)
+        return {table: entry for table, entry in described.items() if entry["columns"]}
+
+
+def _apply_keys(described: dict, keys: list):
+    """Mark declared primary keys and foreign keys (BigQuery: unenforced constraints)."""
+    for row in keys:
+        meta = described.get(row["table_name"], {}).get("columns", {}).get(row["column_name"])
+        if meta is None:
+            continue
+        if row["constraint_type"] == "PRIMARY KEY":
+            meta["primary_key"] = True
+        elif row["constraint_type"] == "FOREIGN KEY" and row["ref_table"]:
+            meta["foreign_key"] = f"{row['ref_table']}.{row['ref_column']}"
+
+
+def _inferred_reference(table: str, column: str, tables: dict):
+    """`user_id` -> users.id (or the referenced table's own `user_id` key), when that table exists."""
+    if not column.endswith("_id") or column == "id":
+        return None
+    stem = column[:-3]
+    for target in (stem + "s", stem + "es", stem[:-1] + "ies" if stem.endswith("y") else None, stem):
+        if target is None or target == table or target not in tables:
+            continue
+        target_columns = tables[target]["columns"]
+        if "id" in target_columns:
+            return f"{target}.id"
+        if target_columns.get(column, {}).get("primary_key"):
+            return f"{target}.{column}"
+    return None
+
+
+def annotate(described: dict, annotations: dict = TABLES) -> dict:
+    """
+    Turn catalog entries into the TABLES format (schema.py), filling descriptions and
+    keys the database does not declare from `annotations`, then from naming.
+    """
+    tables = {}
+    for table, entry in described.items():
+        static = annotations.get(table, {})
+        static_columns = static.get("columns", {})
+        columns = {}
+        for column, meta in entry["columns"].items():
+            known = static_columns.get(column, {})
+            columns[column] = {
+                "type": meta["type"],
+                "description": meta.get("description") or known.get("description") or column.replace("_", " "),
+                "primary_key": meta.get("primary_key") or known.get("primary_key", False),
+                "foreign_key": meta.get("foreign_key") or known.get("foreign_key"),
+            }
+        if not any(meta["primary_key"] for meta in columns.values()) and "id" in columns:
+            columns["id"]["primary_key"] = True
+        info = {
+            "description": entry.get("description") or static.get("description") or table.replace("_", " "),
+            "columns": columns,
+        }
+        if entry.get("partitioning"):
+            info["partitioned_by"] = entry["partitioning"]
+        if entry.get("clustering"):
+            info["clustered_by"] = list(entry["clustering"])
+        tables[table] = info
+
+    for table, info in tables.items():
+        for column, meta in info["columns"].items():
+            if meta["foreign_key"] is None:
+                meta["foreign_key"] = _inferred_reference(table, column, tables)
+            elif meta["foreign_key"].split(".", 1)[0] not in tables:
+                meta["foreign_key"] = None     # references a table outside the catalog
+    return dict(sorted(tables.items()))
+
+
+class SchemaCatalog:
+    """
+    Introspected schema plus per-table versions, persisted to a snapshot file.
+    refresh() is incremental; start() loads the snapshot and refreshes every
+    refresh_seconds on a daemon timer.
+    """
+
+    def __init__(self, source, snapshot_path: str, refresh_seconds: float, include: list = None):
+        self.source = source
+        self.snapshot_path = snapshot_path
+        self.refresh_seconds = refresh_seconds
+        self.include = set(include or ())
+        self.described = {}       # table -> raw catalog entry
+        self.versions = {}        # table -> version at the time it was described
+        self.tables = None        # annotated TABLES-format dict currently in the index
+        self.refreshed_at = None
+        self.refreshes = 0
+        self.tables_described = 0
+        self.swaps = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._timer = None
+        self._stopped = False
+
+    # -- snapshot --
+
+    def _snapshot_key(self) -> dict:
+        return {"source": self.source.name, "location": getattr(self.source, "dataset", None)
+                or getattr(self.source, "schema", None)}
+
+    def load_snapshot(self) -> bool:
+        """Load and apply the snapshot file if it was written for this source."""
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if snapshot.get("key") != self._snapshot_key():
+            return False
+        with self._lock:
+            self.described = snapshot["described"]
+            self.versions = snapshot["versions"]
+            self.refreshed_at = snapshot.get("refreshed_at")
+            self._apply()
+        logger.info("Schema catalog snapshot loaded: %d tables", len(self.described))
+        return True
+
+    def _save_snapshot(self):
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        snapshot = {
+            "key": self._snapshot_key(),
+            "refreshed_at": self.refreshed_at,
+            "versions": self.versions,
+            "described": self.described,
+        }
+        # Write-then-rename so other workers never read a half-written file
+        tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f, default=str, sort_keys=True)
+        os.replace(tmp, self.snapshot_path)
+
+    # -- refresh --
+
+    def _apply(self):
+        """Swap the annotated schema into the index if it changed. Caller holds the lock."""
+        tables = annotate(self.described)
+        if tables and tables != self.tables:
+            self.tables = tables
+            reload_schema_index(tables)
+            self.swaps += 1
+
+    def refresh(self) -> dict:
+        """Describe new and changed tables, drop removed ones; returns what changed."""
+        with self._lock:
+            try:
+                versions = self.source.table_versions()
+                if self.include:
+                    versions = {t: v for t, v in versions.items() if t in self.include}
+                versions = {t: v for t, v in versions.items() if _NAME_RE.match(t)}
+                changed = sorted(t for t, v in versions.items() if self.versions.get(t) != v)
+                removed = sorted(set(self.versions) - set(versions))
+                if changed:
+                    self.described.update(self.source.describe(changed))
+                    self.tables_described += len(changed)
+                for table in removed:
+                    self.described.pop(table, None)
+                self.versions = {t: v for t, v in versions.items() if t in self.described}
+                self.refreshed_at = time.time()
+                self.refreshes += 1
+                self.last_error = None
+                if changed or removed:
+                    self._apply()
+                    self._save_snapshot()
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+        if changed or removed:
+            logger.info("Schema catalog refreshed: changed %s, removed %s", changed, removed)
+        return {"changed": changed, "removed": removed}
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # Keep serving the current schema; try again next period
+            logger.warning("Schema catalog refresh failed: %s", e)
+        if self.refresh_seconds > 0:
+            self._schedule(self.refresh_seconds)
+        elif not self.refreshes:
+            self._schedule(60.0)     # refresh-once mode: retry until the first refresh succeeds
+
+    def _schedule(self, delay: float):
+        if self._stopped:
+            return
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def start(self):
+        """Apply the snapshot (fast, no network) and refresh in the background."""
+        self._stopped = False
+        self.load_snapshot()
+        self._schedule(0)
+
+    def stop(self):
+        self._stopped = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "source": self.source.name,
+                "tables": sorted(self.described),
+                "snapshot_path": self.snapshot_path,
+                "refresh_seconds": self.refresh_seconds,
+                "refreshed_at": self.refreshed_at,
+                "refreshes": self.refreshes,
+                "tables_described": self.tables_described,
+                "schema_swaps": self.swaps,
+                "last_error": self.last_error,
+            }
+
+
+def _build_catalog():
+    if not CATALOG_ENABLED:
+        return None
+    if CATALOG_SOURCE == "postgres":
+        source = PostgresCatalogSource(CATALOG_PG_SCHEMA)
+    else:
+        source = BigQueryCatalogSource(DATASET)
+    return SchemaCatalog(source, CATALOG_SNAPSHOT_PATH, CATALOG_REFRESH_SECONDS, CATALOG_TABLES)
+
+
+catalog = _build_catalog()
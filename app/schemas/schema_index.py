@@ -0,0 +1,91 @@
+"""
+schema_index.py - Immutable, precomputed view of TABLES built once at import
+(or on reload) so the hot path never re-renders or re-derives schema data.
+"""
+import hashlib
+import json
+import threading
+from types import MappingProxyType
+from app.schemas.schema import TABLES
+from app.schemas.schema_retriever import SchemaRetriever
+from app.llm.prompts import (
+    build_schema_summary, INTENT_EXTRACTION_PREFIX, SQL_GENERATION_PREFIX, COMBINED_PREFIX,
+)
+
+
+class SchemaIndex:
+    """Everything the pipeline derives from the schema, computed once."""
+
+    __slots__ = (
+        "fingerprint", "schema_text", "valid_tables", "valid_columns", "column_types",
+        "column_tables", "foreign_keys", "fk_graph", "table_list_text", "retry_hint_schema",
+        "intent_prompt_prefix", "sql_prompt_prefix", "combined_prompt_prefix", "max_table_columns", "retriever",
+    )
+
+    def __init__(self, tables: dict):
+        payload = json.dumps(tables, sort_keys=True, default=str)
+        self.fingerprint = hashlib.sha256(payload.encode()).hexdigest()[:16]
+        self.schema_text = build_schema_summary(tables)
+
+        self.valid_tables = frozenset(tables)
+        self.valid_columns = MappingProxyType({
+            table: frozenset(info["columns"]) for table, info in tables.items()
+        })
+        self.column_types = MappingProxyType({
+            (table, col): meta["type"]
+            for table, info in tables.items() for col, meta in info["columns"].items()
+        })
+
+        column_tables = {}
+        foreign_keys = []
+        fk_graph = {table: set() for table in tables}
+        for table, info in tables.items():
+            for col, meta in info["columns"].items():
+                column_tables.setdefault(col, set()).add(table)
+                fk = meta.get("foreign_key")
+                if fk:
+                    ref_table, ref_col = fk.split(".", 1)
+                    foreign_keys.append((table, col, ref_table, ref_col))
+                    fk_graph[table].add(ref_table)
+                    fk_graph.setdefault(ref_table, set()).add(table)
+        self.column_tables = MappingProxyType({c: frozenset(t) for c, t in column_tables.items()})
+        self.foreign_keys = tuple(foreign_keys)
+        self.fk_graph = MappingProxyType({t: frozenset(n) for t, n in fk_graph.items()})
+
+        self.max_table_columns = max((len(info["columns"]) for info in tables.values()), default=0)
+        self.retriever = SchemaRetriever(tables, self.fk_graph)
+
+        self.table_list_text = ", ".join(sorted(tables))
+        hint_lines = [
+            "\nOnly use tables and columns that exist in the provided schema.",
+            f"Valid tables: {self.table_list_text}",
+        ]
+        for table in sorted(tables):
+            hint_lines.append(f"  {table}: {', '.join(sorted(self.valid_columns[table]))}")
+        self.retry_hint_schema = "\n".join(hint_lines)
+
+        # Static prompt prefixes — identical bytes on every request
+        self.intent_prompt_prefix = INTENT_EXTRACTION_PREFIX.format(schema=self.schema_text)
+        self.sql_prompt_prefix = SQL_GENERATION_PREFIX.format(schema=self.schema_text)
+        self.combined_prompt_prefix = COMBINED_PREFIX.format(schema=self.schema_text)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError("SchemaIndex is immutable; use reload_schema_index().")
+        object.__setattr__(self, name, value)
+
+
+_index = SchemaIndex(TABLES)
+_reload_lock = threading.Lock()
+
+
+def get_schema_index() -> SchemaIndex:
+    return _index
+
+
+def reload_schema_index(tables: dict = None) -> SchemaIndex:
+    """Rebuild the index (after TABLES changed) and swap it in atomically."""
+    global _index
+    with _reload_lock:
+        _index = SchemaIndex(TABLES if tables is None else tables)
+    return _index
@@ -0,0 +1,174 @@
+"""
+schema_retriever.py - Local retrieval stage ahead of intent extraction.
+Ranks tables (BM25 over names and descriptions) and columns against the question,
+so only the relevant slice of a large schema is sent to the LLM. Question words the
+schema never uses are matched to near spellings by character trigrams. No LLM is used here.
+"""
+import math
+import re
+from collections import Counter
+from app.llm.prompts import build_schema_summary
+
+# Question words that never identify a table or column
+STOPWORDS = {
+    'a', 'an', 'the', 'me', 'my', 'us', 'our', 'please', 'show', 'list', 'give', 'get',
+    'find', 'display', 'tell', 'what', 'which', 'who', 'how', 'many', 'much', 'are', 'is',
+    'was', 'were', 'of', 'for', 'all', 'to', 'can', 'you', 'i', 'want', 'see', 'return',
+    'there', 'in', 'on', 'by', 'with', 'and', 'or', 'from', 'each', 'per', 'top', 'than',
+    'more', 'less', 'most', 'least', 'have', 'has', 'do', 'does', 'that', 'their', 'its',
+    # aggregate words name an operation, not a column
+    'count', 'number', 'total', 'sum', 'average', 'avg', 'max', 'maximum', 'min', 'minimum',
+}
+
+# Field weights: a hit on the table or column name counts more than one in a description
+TABLE_NAME_WEIGHT = 3
+COLUMN_NAME_WEIGHT = 2
+FUZZY_MIN_SIMILARITY = 0.5   # trigram Jaccard needed to treat a misspelling as a schema word
+FUZZY_CACHE_SIZE = 4096
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _stem(word: str) -> str:
+    """Very small plural folder: categories → category, orders → order."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def words(text: str) -> list:
+    """Split text (including snake_case identifiers) into stemmed, stopword-free words."""
+    return [
+        _stem(w) for w in re.findall(r"[a-z0-9]+", text.lower().replace("_", " "))
+        if len(w) > 1 and w not in STOPWORDS
+    ]
+
+
+def trigrams(word: str) -> frozenset:
+    padded = f"#{word}#"
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class _BM25:
+    """Okapi BM25 over a fixed list of token lists."""
+
+    def __init__(self, docs: list):
+        self.term_freqs = [Counter(doc) for doc in docs]
+        self.doc_lens = [len(doc) for doc in docs]
+        self.avg_len = (sum(self.doc_lens) / len(docs)) if docs else 0.0
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(docs)
+        self.idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in doc_freq.items()}
+
+    def scores(self, query: list) -> list:
+        terms = [t for t in set(query) if t in self.idf]
+        out = []
+        for tf, length in zip(self.term_freqs, self.doc_lens):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / self.avg_len) if self.avg_len else BM25_K1
+            score = 0.0
+            for t in terms:
+                f = tf.get(t)
+                if f:
+                    score += self.idf[t] * f * (BM25_K1 + 1) / (f + norm)
+            out.append(score)
+        return out
+
+
+class SchemaRetriever:
+    """Table and column ranking over one schema; built once per SchemaIndex."""
+
+    def __init__(self, tables: dict, fk_graph):
+        self.tables = tables
+        self.table_names = list(tables)
+        self.fk_graph = fk_graph
+
+        word_docs = []
+        self._column_words = {}
+        for table, info in tables.items():
+            doc = words(table) * TABLE_NAME_WEIGHT + words(info.get("description", ""))
+            for col, meta in info["columns"].items():
+                col_words = words(col)
+                doc += col_words * COLUMN_NAME_WEIGHT + words(meta.get("description", ""))
+                self._column_words[(table, col)] = set(col_words) | set(words(meta.get("description", "")))
+            word_docs.append(doc)
+
+        self._bm25 = _BM25(word_docs)
+        self._vocabulary = {w: trigrams(w) for w in self._bm25.idf if not w.isdigit()}
+        self._fuzzy_cache = {}
+
+    def _match_word(self, word: str):
+        """The word itself if the schema uses it, else its closest spelling in the schema (or None)."""
+        if word in self._bm25.idf:
+            return word
+        if word not in self._fuzzy_cache:
+            grams = trigrams(word)
+            best, best_score = None, FUZZY_MIN_SIMILARITY
+            for candidate, cand_grams in self._vocabulary.items():
+                score = len(grams & cand_grams) / len(grams | cand_grams)
+                if score >= best_score:
+                    best, best_score = candidate, score
+            if len(self._fuzzy_cache) >= FUZZY_CACHE_SIZE:
+                self._fuzzy_cache.clear()
+            self._fuzzy_cache[word] = best
+        return self._fuzzy_cache[word]
+
+    def query_terms(self, question: str) -> list:
+        return [t for t in (self._match_word(w) for w in words(question)) if t is not None]
+
+    def rank_tables(self, question: str) -> list:
+        """[(table, score)] best first, tables with no overlap at all left out."""
+        scores = self._bm25.scores(self.query_terms(question))
+        ranked = [(table, score) for table, score in zip(self.table_names, scores) if score > 0]
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked
+
+    def select_tables(self, question: str, top_k: int) -> list:
+        """
+        Top-k tables for the question, plus any table that links two of them that
+        are not joined directly (junction tables), so the joins the question needs stay possible.
+        Returns all tables when nothing matches, leaving relevance to the LLM.
+        """
+        ranked = self.rank_tables(question)
+        if not ranked:
+            return list(self.table_names)
+        selected = [table for table, _ in ranked[:top_k]]
+        chosen = set(selected)
+        for table in self.table_names:
+            if table in chosen:
+                continue
+            linked = self.fk_graph.get(table, frozenset()) & chosen
+            if any(b not in self.fk_graph.get(a, ()) for a in linked for b in linked if a != b):
+                selected.append(table)
+        return selected
+
+    def select_columns(self, question: str, table: str, max_columns: int) -> list:
+        """Keys first, then the columns that best match the question, in schema order."""
+        columns = self.tables[table]["columns"]
+        if len(columns) <= max_columns:
+            return list(columns)
+        query = set(self.query_terms(question))
+        keep = {col for col, meta in columns.items() if meta.get("primary_key") or meta.get("foreign_key")}
+        ranked = sorted(
+            (col for col in columns if col not in keep),
+            key=lambda col: len(query & self._column_words[(table, col)]),
+            reverse=True,
+        )
+        keep.update(ranked[:max(max_columns - len(keep), 0)])
+        return [col for col in columns if col in keep]
+
+    def render(self, question: str, tables: list, max_columns: int) -> str:
+        """Schema text for just these tables (and their best-matching columns)."""
+        subset = {}
+        for table in tables:
+            info = self.tables[table]
+            keep = self.select_columns(question, table, max_columns)
+            subset[table] = {
+                **info,
+                "columns": {col: info["columns"][col] for col in keep},
+            }
+        return build_schema_summary(subset)
@@ -1,46 +1,506 @@
 """
 nl2sql.py - Core pipeline: NL → Intent JSON → SQL → Validate → Return
 """
+import asyncio
+import copy
 import json
-from app.schemas.schema import TABLES, VALID_TABLES
-from app.llm.prompts import build_schema_summary, INTENT_EXTRACTION_PROMPT, SQL_GENERATION_PROMPT
-from app.llm.gemini_client import call_gemini, call_gemini_for_json
+import logging
+import time
+from app.schemas.schema_index import get_schema_index
+from app.llm.prompts import (
+    INTENT_EXTRACTION_PROMPT, INTENT_EXTRACTION_SUFFIX, SQL_GENERATION_PROMPT, SQL_GENERATION_SUFFIX,
+    COMBINED_PROMPT, COMBINED_SUFFIX,
+)
+from app.llm.gemini_client import (
+    call_gemini, call_gemini_for_json, call_gemini_async, call_gemini_for_json_async,
+    aclose_async_client,
+)
+from app.llm.stream_parser import SqlStatementScanner
 from app.validation.validator import validate_sql, build_retry_hint
-from app.configuration.config import MAX_RETRIES
+from app.validation.repair import repair_sql
+from app.execution.cost_gate import check_cost, build_cost_hint, format_bytes
+from app.services.fast_path import parse_question
+from app.services.sql_compiler import compile_intent, CompileError
+from app.configuration.config import (
+    MAX_RETRIES, PIPELINE_MODE, PIPELINE_MODES, FAST_PATH_ENABLED, SQL_COMPILER_ENABLED, SQL_CANDIDATES,
+    SQL_CANDIDATE_TEMPERATURE, COST_GATE_ENABLED, COST_GATE_MAX_BYTES,
+    SCHEMA_PRUNING_ENABLED, SCHEMA_PRUNING_TOP_K, SCHEMA_PRUNING_MAX_COLUMNS, SINGLE_FLIGHT_ENABLED,
+)
+from app.cache.question_cache import question_cache, normalize_question
+from app.cache.singleflight import SingleFlight
+from app.monitoring.pipeline_stats import pipeline_stats
+from app.monitoring.metrics import (
+    REQUESTS, FAST_PATH, SQL_COMPILER, SQL_REPAIRS, FALLBACKS, track_request, stage_timer, record_retry,
+)
+
+logger = logging.getLogger(__name__)
+
+question_flight = SingleFlight("question")
+
+
+def _pruning_applies(index) -> bool:
+    # Schemas no larger than top-k are sent whole, keeping the cacheable prompt prefix
+    return SCHEMA_PRUNING_ENABLED and (
+        len(index.valid_tables) > SCHEMA_PRUNING_TOP_K or index.max_table_columns > SCHEMA_PRUNING_MAX_COLUMNS
+    )
+
+
+def _schema_for_question(question: str, index) -> tuple:
+    """
+    Tables and schema text for intent extraction: the retriever's top-k tables
+    (see schema_retriever.py), or the full prerendered schema when that is all of it.
+    """
+    if not _pruning_applies(index):
+        return list(index.retriever.table_names), index.schema_text
+    selected = set(index.retriever.select_tables(question, SCHEMA_PRUNING_TOP_K))
+    tables = [t for t in index.retriever.table_names if t in selected]
+    if len(tables) == len(index.valid_tables) and index.max_table_columns <= SCHEMA_PRUNING_MAX_COLUMNS:
+        return tables, index.schema_text
+    return tables, index.retriever.render(question, tables, SCHEMA_PRUNING_MAX_COLUMNS)
+
+
+def _schema_for_intent(question: str, intent: dict, index, fallback: str) -> str:
+    """Schema text for SQL generation, narrowed to the tables the intent names."""
+    if not _pruning_applies(index):
+        return fallback
+    named = set(intent.get("target_tables") or [])
+    for join in intent.get("joins") or []:
+        named.update((join.get("left_table"), join.get("right_table")))
+    tables = [t for t in index.retriever.table_names if t in named]
+    if not tables:
+        return fallback
+    if len(tables) == len(index.valid_tables) and index.max_table_columns <= SCHEMA_PRUNING_MAX_COLUMNS:
+        return index.schema_text
+
+    # Columns the intent already picked count as matches when trimming wide tables
+    referenced = [col for cols in (intent.get("selected_columns") or {}).values() for col in cols]
+    referenced += [c.get("column") or "" for c in intent.get("conditions") or []]
+    return index.retriever.render(f"{question} {' '.join(referenced)}", tables, SCHEMA_PRUNING_MAX_COLUMNS)
+
+
+def _intent_prompt(question: str, schema_text: str) -> str:
+    index = get_schema_index()
+    if schema_text == index.schema_text:
+        # Reuse the prerendered static prefix
+        return index.intent_prompt_prefix + INTENT_EXTRACTION_SUFFIX.format(question=question)
+    return INTENT_EXTRACTION_PROMPT.format(schema=schema_text, question=question)
+
+
+def _sql_prompt(question: str, intent: dict, schema_text: str, retry_hint: str) -> str:
+    index = get_schema_index()
+    intent_json_str = json.dumps(intent, indent=2)
+    if schema_text == index.schema_text:
+        prompt = index.sql_prompt_prefix + SQL_GENERATION_SUFFIX.format(
+            intent_json=intent_json_str,
+            question=question,
+        )
+    else:
+        prompt = SQL_GENERATION_PROMPT.format(
+            schema=schema_text,
+            intent_json=intent_json_str,
+            question=question,
+        )
+    if retry_hint:
+        prompt += f"\n\n=== PREVIOUS ATTEMPT FAILED ===\n{retry_hint}"
+    return prompt
+
+
+def _combined_prompt(question: str, schema_text: str) -> str:
+    index = get_schema_index()
+    if schema_text == index.schema_text:
+        return index.combined_prompt_prefix + COMBINED_SUFFIX.format(question=question)
+    return COMBINED_PROMPT.format(schema=schema_text, question=question)
+
+
+def _parse_combined(response: dict) -> tuple:
+    """Split a combined response into (intent, sql); ValueError if it is malformed."""
+    intent = response.get("intent") if isinstance(response, dict) else None
+    if not isinstance(intent, dict):
+        raise ValueError(f"Combined response has no intent object: {response!r}")
+    sql = response.get("sql")
+    return intent, sql.strip() if isinstance(sql, str) else None
+
+
+def _intent_settled(fields: dict) -> bool:
+    """An off-topic verdict needs nothing after its reason: stop reading the intent there."""
+    return fields.get("is_relevant") is False and "irrelevance_reason" in fields
 
 
 def extract_intent(question: str, schema_text: str) -> dict:
     """Stage 1: Use Gemini to extract structured intent JSON from the question."""
-    prompt = INTENT_EXTRACTION_PROMPT.format(schema=schema_text, question=question)
-    return call_gemini_for_json(prompt)
+    return call_gemini_for_json(_intent_prompt(question, schema_text), stage="intent", stop_when=_intent_settled)
 
 
 def generate_sql(question: str, intent: dict, schema_text: str, retry_hint: str = "") -> str:
-    """Stage 2: Use Gemini to generate SQL from the intent JSON."""
-    intent_json_str = json.dumps(intent, indent=2)
-    prompt = SQL_GENERATION_PROMPT.format(
-        schema=schema_text,
-        intent_json=intent_json_str,
-        question=question,
+    """Stage 2: Use Gemini to generate SQL from the intent JSON (the first statement)."""
+    return call_gemini(_sql_prompt(question, intent, schema_text, retry_hint), stage="sql",
+                       scanner=SqlStatementScanner)
+
+
+async def extract_intent_async(question: str, schema_text: str) -> dict:
+    """Async Stage 1, awaiting the shared Groq client."""
+    return await call_gemini_for_json_async(_intent_prompt(question, schema_text), stage="intent",
+                                            stop_when=_intent_settled)
+
+
+async def generate_sql_async(question: str, intent: dict, schema_text: str, retry_hint: str = "",
+                             temperature: float = 0.1) -> str:
+    """Async Stage 2, awaiting the shared Groq client."""
+    return await call_gemini_async(_sql_prompt(question, intent, schema_text, retry_hint), temperature, stage="sql",
+                                   scanner=SqlStatementScanner)
+
+
+def generate_combined(question: str, schema_text: str) -> tuple:
+    """Single-shot mode: intent and SQL from one Gemini call, as (intent, sql)."""
+    return _parse_combined(call_gemini_for_json(_combined_prompt(question, schema_text), stage="combined"))
+
+
+async def generate_combined_async(question: str, schema_text: str) -> tuple:
+    """Async single-shot mode."""
+    return _parse_combined(await call_gemini_for_json_async(_combined_prompt(question, schema_text), stage="combined"))
+
+
+def _emit(on_event, event: str, data):
+    """Report a completed stage to the caller (used by the streaming endpoint)."""
+    if on_event is not None:
+        on_event(event, data)
+
+
+def _check_relevance(intent: dict, index, result: dict) -> bool:
+    """Fill in the 'not relevant' message and return False for off-topic questions."""
+    logger.debug("is_relevant: %s, summary: %s",
+                 intent.get("is_relevant"), intent.get("query_intent_summary", "N/A"))
+    if intent.get("is_relevant", False):
+        return True
+    table_names = index.table_list_text
+    reason = intent.get("irrelevance_reason", "The question doesn't relate to available tables.")
+    result["message"] = (
+        f"Your question doesn't seem to be related to the available data. {reason} "
+        f"Please ask questions about: {table_names}."
     )
+    logger.info("Irrelevant question: %s", result["message"])
+    return False
+
+
+def _record_validation(sql: str, intent: dict, result: dict, on_event):
+    with stage_timer("validation"):
+        validation = validate_sql(sql, intent)
+    result["validation"] = {
+        "is_valid": validation.is_valid,
+        "errors": validation.errors,
+    }
+    _emit(on_event, "validation", {"attempt": result["attempts"], **result["validation"]})
+    return validation
+
+
+async def _check_cost(sql: str, intent: dict, result: dict, on_event):
+    """Dry-run cost gate (see cost_gate.py); None when the gate is disabled."""
+    if not COST_GATE_ENABLED:
+        return None
+    with stage_timer("cost_estimate"):
+        decision = await asyncio.to_thread(check_cost, sql, intent)
+    result["cost"] = decision.to_dict()
+    _emit(on_event, "cost", {"attempt": result["attempts"], **result["cost"],
+                             "sql": decision.sql if decision.action == "rewritten" else None})
+    return decision
+
+
+def _repair(sql: str, result: dict, on_event) -> tuple:
+    """Fix mechanical mistakes locally (repair.py); returns (sql, fixes)."""
+    with stage_timer("repair"):
+        repaired, fixes = repair_sql(sql)
+    if fixes:
+        logger.debug("Repaired attempt %d: %s", result["attempts"], "; ".join(fixes))
+        result["sql"] = repaired
+        result["repairs"].extend(fixes)
+        _emit(on_event, "repair", {"attempt": result["attempts"], "fixes": fixes, "sql": repaired})
+    return repaired, fixes
+
+
+async def _accept_sql(sql: str, intent: dict, result: dict, on_event) -> tuple:
+    """
+    Repair, validate, then cost-check one generated query.
+    Returns (accepted, retry_hint, reason) — reason is "validation" or "cost" on failure.
+    """
+    sql, fixes = _repair(sql, result, on_event)
+    validation = _record_validation(sql, intent, result, on_event)
+    if fixes:
+        SQL_REPAIRS.inc(result="accepted" if validation.is_valid else "rejected")
+    if not validation.is_valid:
+        logger.info("Validation failed on attempt %d: %s", result["attempts"], "; ".join(validation.errors))
+        return False, build_retry_hint(validation, intent), "validation"
+
+    decision = await _check_cost(sql, intent, result, on_event)
+    if decision is not None and not decision.allowed:
+        logger.info("Cost gate rejected attempt %d: ~%s", result["attempts"], format_bytes(decision.estimated_bytes))
+        return False, build_cost_hint(decision), "cost"
+    if decision is not None and decision.action == "rewritten":
+        result["sql"] = decision.sql
+
+    result["success"] = True
+    result["message"] = "SQL generated and validated successfully."
+    return True, "", None
+
+
+def _failure_message(reason: str, result: dict, tries: str = f"{MAX_RETRIES} attempts") -> str:
+    if reason == "cost":
+        return (
+            f"Generated SQL would scan ~{format_bytes(result['cost']['estimated_bytes'])}, over the "
+            f"{format_bytes(COST_GATE_MAX_BYTES)} limit, after {tries}."
+        )
+    return f"SQL validation failed after {tries}."
+
+
+async def _run_fast_path(question: str, index, result: dict, on_event) -> bool:
+    """Answer without the LLM when the rule-based parser understands the question."""
+    with stage_timer("fast_path"):
+        parsed = parse_question(question, index)
+    if parsed is None:
+        FAST_PATH.inc(result="miss")
+        return False
+
+    intent, sql = parsed
+    result["attempts"] = 1
+    result["intent"] = intent
+    result["sql"] = sql
+    _emit(on_event, "intent", intent)
+    _emit(on_event, "sql", {"attempt": 1, "sql": sql})
+    accepted, _, reason = await _accept_sql(sql, intent, result, on_event)
+    if accepted:
+        FAST_PATH.inc(result="hit")
+        result["fast_path"] = True
+        return True
+
+    logger.info("Fast path SQL rejected (%s), using the LLM", reason)
+    FAST_PATH.inc(result="rejected")
+    result.update(attempts=0, intent=None, sql=None, validation=None, cost=None, repairs=[])
+    return False
+
+
+async def _run_compiled(intent: dict, index, result: dict, on_event) -> tuple:
+    """
+    Stage 2 without the LLM: render the intent with sql_compiler.
+    Returns (accepted, retry_hint); the hint is passed on to the LLM fallback.
+    """
+    try:
+        with stage_timer("sql_compile"):
+            sql = compile_intent(intent, index)
+    except CompileError as e:
+        logger.debug("Intent not compilable, using the LLM: %s", e)
+        SQL_COMPILER.inc(result="unsupported")
+        return False, ""
+
+    result["attempts"] += 1
+    result["sql"] = sql
+    _emit(on_event, "sql", {"attempt": result["attempts"], "sql": sql})
+    accepted, retry_hint, reason = await _accept_sql(sql, intent, result, on_event)
+    if accepted:
+        SQL_COMPILER.inc(result="accepted")
+        result["compiled"] = True
+        return True, ""
+    logger.info("Compiled SQL rejected (%s), using the LLM", reason)
+    SQL_COMPILER.inc(result="rejected")
+    return False, retry_hint
+
+
+async def _run_combined(question: str, index, schema_text: str, result: dict, on_event) -> tuple:
+    """
+    Single-shot mode. Returns (settled, retry_hint): settled is True when the question
+    is answered, irrelevant or failed; False means fall back to two stages, passing
+    retry_hint (why the combined SQL was rejected) to the SQL stage.
+    """
+    result["attempts"] = 1
+    result["llm_calls"] += 1
+    try:
+        with stage_timer("combined_generation"):
+            intent, sql = await generate_combined_async(question, schema_text)
+    except ValueError as e:
+        logger.info("Combined response unusable: %s", e)
+        return False, ""
+    except Exception as e:
+        result["message"] = f"Combined generation failed: {e}"
+        logger.warning(result["message"])
+        return True, ""
+
+    result["intent"] = intent
+    _emit(on_event, "intent", intent)
+    if not _check_relevance(intent, index, result):
+        return True, ""
+    if not sql:
+        logger.info("Combined response had no SQL")
+        return False, ""
+
+    result["sql"] = sql
+    _emit(on_event, "sql", {"attempt": 1, "sql": sql})
+    accepted, retry_hint, _ = await _accept_sql(sql, intent, result, on_event)
+    return accepted, retry_hint
+
+
+async def _run_two_stage(question: str, index, schema_text: str, result: dict, on_event, retry_hint: str = ""):
+    """Intent extraction, relevance check, then SQL generation with the retry loop."""
+    # --- Stage 1: Intent Extraction ---
+    result["llm_calls"] += 1
+    try:
+        with stage_timer("intent_extraction"):
+            intent = await extract_intent_async(question, schema_text)
+    except Exception as e:
+        result["message"] = f"Intent extraction failed: {e}"
+        logger.warning(result["message"])
+        return
+
+    result["intent"] = intent
+    _emit(on_event, "intent", intent)
+
+    # --- Relevance Check ---
+    if not _check_relevance(intent, index, result):
+        return
+
+    # --- Stage 2: compile the intent locally; the LLM only for what the compiler can't express ---
+    if SQL_COMPILER_ENABLED:
+        accepted, compiled_hint = await _run_compiled(intent, index, result, on_event)
+        if accepted:
+            return
+        retry_hint = compiled_hint or retry_hint
+
+    # --- Stage 2 (fallback): SQL Generation with Retry Loop ---
+    schema_text = _schema_for_intent(question, intent, index, schema_text)
+    if SQL_CANDIDATES > 1:
+        await _run_candidates(question, intent, schema_text, result, on_event, retry_hint)
+        return
+    previous_attempts = result["attempts"]
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        result["attempts"] = previous_attempts + attempt
+        if retry_hint:
+            record_retry()
+
+        result["llm_calls"] += 1
+        try:
+            with stage_timer("sql_generation"):
+                sql = await generate_sql_async(question, intent, schema_text, retry_hint)
+        except Exception as e:
+            result["message"] = f"SQL generation failed: {e}"
+            logger.warning(result["message"])
+            return
+
+        result["sql"] = sql
+        _emit(on_event, "sql", {"attempt": result["attempts"], "sql": sql})
+
+        # --- Stage 3: Validation and cost gate (no LLM) ---
+        accepted, retry_hint, reason = await _accept_sql(sql, intent, result, on_event)
+        if accepted:
+            logger.debug("SQL accepted on attempt %d", attempt)
+            break
+        if attempt == MAX_RETRIES:
+            result["message"] = _failure_message(reason, result)
+
+
+async def _run_candidates(question: str, intent: dict, schema_text: str, result: dict, on_event, retry_hint: str):
+    """
+    One round of SQL_CANDIDATES generations in parallel. Each is repaired, validated and
+    cost-checked as it arrives; the first accepted wins and the rest are cancelled.
+    """
+    async def generate(n: int) -> tuple:
+        temperature = 0.1 if n == 0 else SQL_CANDIDATE_TEMPERATURE
+        with stage_timer("sql_generation"):
+            return n, await generate_sql_async(question, intent, schema_text, retry_hint, temperature)
+
     if retry_hint:
-        prompt += f"\n\n=== PREVIOUS ATTEMPT FAILED ===\n{retry_hint}"
+        record_retry()
+    result["llm_calls"] += SQL_CANDIDATES
+    tasks = [asyncio.ensure_future(generate(n)) for n in range(SQL_CANDIDATES)]
+    reason, error = None, None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                n, sql = await next_done
+            except Exception as e:
+                error = e
+                continue
+            result["attempts"] += 1
+            result["sql"] = sql
+            _emit(on_event, "sql", {"attempt": result["attempts"], "sql": sql, "candidate": n})
+            accepted, _, reason = await _accept_sql(sql, intent, result, on_event)
+            if accepted:
+                logger.debug("SQL candidate %d accepted", n)
+                return
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+
+    if reason is None:
+        result["message"] = f"SQL generation failed: {error}"
+        logger.warning(result["message"])
+    else:
+        result["message"] = _failure_message(reason, result, f"{SQL_CANDIDATES} parallel candidates")
 
-    return call_gemini(prompt)
 
+def _outcome(result: dict) -> str:
+    if result["success"]:
+        return "success"
+    if result["intent"] is not None and not result["intent"].get("is_relevant", False):
+        return "irrelevant"
+    if result["validation"] is not None and not result["validation"]["is_valid"]:
+        return "invalid"
+    return "error"
 
-def process_question(question: str) -> dict:
+
+async def process_question_async(question: str, on_event=None, mode: str = None) -> dict:
     """
     Full pipeline:
-      1. Build schema summary
+      0. Return a cached result if the same question was answered recently
+      1. Pick the relevant slice of the schema (local retrieval, no LLM)
+      1b. Simple questions: rule-based intent + SQL (fast_path.py), skipping 2-4
       2. Extract intent via Gemini
       3. Check relevance
-      4. Generate SQL via Gemini
-      5. Validate SQL (no LLM)
-      6. Retry up to MAX_RETRIES if validation fails
-    Returns a result dict with all intermediate outputs.
+      4. Compile the intent to SQL (sql_compiler.py); generate it via Gemini only if that fails
+      5. Repair mechanical mistakes and validate SQL (no LLM), then dry-run it through the cost gate
+      6. Retry up to MAX_RETRIES if validation or the cost gate fails — or, with
+         SQL_CANDIDATES > 1, generate that many in parallel once and keep the first that passes
+    In "combined" mode steps 2 and 4 are one call; its output falls back to the
+    two-stage steps only if it fails validation. mode defaults to PIPELINE_MODE.
+    Returns a result dict with all intermediate outputs, including a per-stage
+    "timings" breakdown (see app/monitoring/metrics.py).
+    If on_event(event, data) is given it is called as each stage completes.
+    Concurrent calls for the same question share one run (see singleflight.py).
     """
-    schema_text = build_schema_summary(TABLES)
+    mode = mode or PIPELINE_MODE
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode '{mode}'. Use one of: {', '.join(PIPELINE_MODES)}.")
+
+    with track_request() as timings:
+        if SINGLE_FLIGHT_ENABLED:
+            key = f"{get_schema_index().fingerprint}\x00{mode}\x00{normalize_question(question)}"
+            result, shared = await question_flight.do(
+                key, lambda emit: _process_question(question, emit, mode), on_event
+            )
+            if shared:
+                # Followers get their own copy; the leader's dict is also cached and returned to it
+                result = copy.deepcopy(result)
+                result["question"] = question
+                result["coalesced"] = True
+        else:
+            result = await _process_question(question, on_event, mode)
+        result["timings"] = timings.summary()
+    return result
+
+
+async def _process_question(question: str, on_event, mode: str) -> dict:
+    if question_cache is not None:
+        with stage_timer("cache_lookup"):
+            cached = question_cache.get(question)
+        if cached is not None:
+            logger.info("Cache hit: %s", question)
+            REQUESTS.inc(mode=mode, outcome="cache_hit")
+            return cached
+
+    started = time.perf_counter()
+    index = get_schema_index()
+    with stage_timer("schema_retrieval"):
+        schema_tables, schema_text = _schema_for_question(question, index)
     result = {
         "question": question,
         "intent": None,
@@ -49,72 +509,52 @@ def process_question(question: str) -> dict:
         "success": False,
         "message": "",
         "attempts": 0,
+        "cache_hit": False,
+        "schema_tables": schema_tables,
+        "mode": mode,
+        "fallback": False,
+        "fast_path": False,
+        "compiled": False,
+        "repairs": [],
+        "llm_calls": 0,
+        "cost": None,
     }
 
-    # --- Stage 1: Intent Extraction ---
-    print(f"\n{'='*60}")
-    print(f" Question: {question}")
-    print(f"{'='*60}")
-    print(" Stage 1: Extracting intent...")
+    logger.info("Question (%s, %d/%d tables): %s", mode, len(schema_tables), len(index.valid_tables), question)
+    _emit(on_event, "schema", {"tables": schema_tables, "pruned": schema_text != index.schema_text})
 
-    try:
-        intent = extract_intent(question, schema_text)
-    except Exception as e:
-        result["message"] = f"Intent extraction failed: {e}"
-        print(f" {result['message']}")
-        return result
+    if FAST_PATH_ENABLED and await _run_fast_path(question, index, result, on_event):
+        logger.info("Answered by the fast path")
+    elif mode == "combined":
+        settled, retry_hint = await _run_combined(question, index, schema_text, result, on_event)
+        if not settled:
+            logger.info("Falling back to two-stage pipeline")
+            FALLBACKS.inc()
+            result["fallback"] = True
+            result["intent"] = None
+            await _run_two_stage(question, index, schema_text, result, on_event, retry_hint)
+    else:
+        await _run_two_stage(question, index, schema_text, result, on_event)
 
-    result["intent"] = intent
-    print(f"   is_relevant: {intent.get('is_relevant')}")
-    print(f"   summary: {intent.get('query_intent_summary', 'N/A')}")
+    # Fast-path answers are tracked as their own mode so they don't skew LLM latency stats
+    stats_mode = "fast_path" if result["fast_path"] else mode
+    REQUESTS.inc(mode=stats_mode, outcome=_outcome(result))
+    pipeline_stats.record(
+        stats_mode, time.perf_counter() - started, result["success"], result["llm_calls"], result["fallback"]
+    )
 
-    # --- Relevance Check ---
-    if not intent.get("is_relevant", False):
-        table_names = ", ".join(sorted(VALID_TABLES))
-        reason = intent.get("irrelevance_reason", "The question doesn't relate to available tables.")
-        result["message"] = (
-            f"Your question doesn't seem to be related to the available data. {reason} "
-            f"Please ask questions about: {table_names}."
-        )
-        print(f"  Irrelevant question: {result['message']}")
-        return result
+    if question_cache is not None and result["success"]:
+        question_cache.put(question, result)
 
-    # --- Stage 2: SQL Generation with Retry Loop ---
-    print("\n Stage 2: Generating SQL...")
-    retry_hint = ""
+    return result
 
-    for attempt in range(1, MAX_RETRIES + 1):
-        result["attempts"] = attempt
-        print(f"   Attempt {attempt}/{MAX_RETRIES}...")
 
+def process_question(question: str, mode: str = None) -> dict:
+    """Synchronous entry point (CLI): runs process_question_async to completion."""
+    async def _run():
         try:
-            sql = generate_sql(question, intent, schema_text, retry_hint)
-        except Exception as e:
-            result["message"] = f"SQL generation failed: {e}"
-            print(f" {result['message']}")
-            return result
-
-        result["sql"] = sql
+            return await process_question_async(question, mode=mode)
+        finally:
+            await aclose_async_client()
 
-        # --- Stage 3: Validation (no LLM) ---
-        validation = validate_sql(sql, intent)
-        result["validation"] = {
-            "is_valid": validation.is_valid,
-            "errors": validation.errors,
-        }
-
-        if validation.is_valid:
-            result["success"] = True
-            result["message"] = "SQL generated and validated successfully."
-            print(f"    Validation passed on attempt {attempt}")
-            break
-        else:
-            print(f"    Validation failed:")
-            for err in validation.errors:
-                print(f"      - {err}")
-            retry_hint = build_retry_hint(validation, intent)
-            if attempt == MAX_RETRIES:
-                result["message"] = f"SQL validation failed after {MAX_RETRIES} attempts."
-                print(f"    Max retries reached.")
-
-    return result
\ No newline at end of file
+    return asyncio.run(_run())
@@ -0,0 +1,496 @@
+"""
+fast_path.py - Deterministic parser for simple questions (counts, top-N,
+group-by a column, simple filters) against the schema. It produces the same
+intent JSON shape as INTENT_EXTRACTION_PROMPT plus the SQL, without an LLM call.
+Every word of the question has to be understood; otherwise parse_question()
+returns None and the pipeline falls back to the LLM stages.
+"""
+import re
+from datetime import datetime
+from app.services.sql_compiler import KNOWN_VALUES, NUMERIC_TYPES, TEMPORAL_TYPES, CompileError, compile_intent
+
+TABLE_SYNONYMS = {"customers": "users", "customer": "users", "items": "order_items", "item": "order_items"}
+
+COUNT_PHRASES = (("how", "many"), ("total", "number", "of"), ("number", "of"), ("count", "of"), ("count",))
+AGGREGATE_WORDS = {
+    "average": "AVG", "avg": "AVG", "mean": "AVG",
+    "total": "SUM", "sum": "SUM",
+    "maximum": "MAX", "max": "MAX", "minimum": "MIN", "min": "MIN",
+}
+GROUP_PHRASES = (("for", "each"), ("in", "each"), ("grouped", "by"), ("broken", "down", "by"), ("by",), ("per",), ("each",))
+TOP_WORDS = {"top": "DESC", "first": "DESC", "bottom": "ASC"}
+RANK_WORDS = {"most": "DESC", "highest": "DESC", "largest": "DESC", "biggest": "DESC",
+              "least": "ASC", "lowest": "ASC", "smallest": "ASC", "fewest": "ASC"}
+OPERATORS = (
+    (("greater", "than"), ">"), (("more", "than"), ">"), (("higher", "than"), ">"), (("over",), ">"),
+    (("above",), ">"), ((">",), ">"), (("less", "than"), "<"), (("lower", "than"), "<"), (("under",), "<"),
+    (("below",), "<"), (("<",), "<"), (("at", "least"), ">="), ((">=",), ">="), (("at", "most"), "<="),
+    (("<=",), "<="), (("equal", "to"), "="), (("equals",), "="), (("=",), "="), (("is",), "="), (("of",), "="),
+)
+# "older than 50" / "cheaper than 20": comparative implying a column
+COMPARATIVES = {
+    ("older", "than"): ("age", ">"), ("younger", "than"): ("age", "<"),
+    ("cheaper", "than"): ("price", "<"), ("pricier", "than"): ("price", ">"),
+}
+CONDITION_WORDS = {"with", "where", "whose", "having", "and", "that", "who"}
+LOCATION_WORDS = {"in", "from"}
+FILLER = {
+    "show", "me", "list", "give", "get", "find", "display", "tell", "what", "whats", "is", "are",
+    "was", "were", "the", "a", "an", "all", "please", "of", "there", "do", "does", "we", "have",
+    "has", "i", "want", "to", "see", "can", "you", "return", "which", "our", "exist", "in", "total",
+    "each", "dollars", "usd", "its", "their", "placed", "registered", "made",
+}
+
+_TOKEN_RE = re.compile(r"\d+(?:\.\d+)?|[A-Za-z_][A-Za-z0-9_']*|[<>]=?|=")
+
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("ses") and len(word) > 4:
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def _iso_date(value) -> bool:
+    try:
+        datetime.fromisoformat(str(value))
+    except ValueError:
+        return False
+    return True
+
+
+def _number(word: str):
+    try:
+        return int(word)
+    except ValueError:
+        try:
+            return float(word)
+        except ValueError:
+            return None
+
+
+class _Question:
+    """Token stream over the question: lowercased words plus their original spelling."""
+
+    def __init__(self, question: str):
+        self.raw = _TOKEN_RE.findall(question)
+        self.words = [w.lower() for w in self.raw]
+        self.pos = 0
+
+    def done(self) -> bool:
+        return self.pos >= len(self.words)
+
+    def peek(self, offset: int = 0):
+        j = self.pos + offset
+        return self.words[j] if j < len(self.words) else None
+
+    def phrase(self, *words) -> bool:
+        """Consume `words` if they come next."""
+        if tuple(self.words[self.pos:self.pos + len(words)]) == words:
+            self.pos += len(words)
+            return True
+        return False
+
+    def any_phrase(self, phrases):
+        for words in phrases:
+            if self.phrase(*words):
+                return words
+        return None
+
+
+class _Parse:
+    """What the question asked for, filled in while reading it."""
+
+    def __init__(self):
+        self.tables = []          # tables mentioned, in order
+        self.columns = []         # (table or None, column) projected
+        self.aggregate = None     # (function, table or None, column or None); column None = COUNT rows
+        self.group_by = None      # (table or None, column)
+        self.order_by = None      # (table or None, column) ordered by a plain column
+        self.limit = None
+        self.direction = None
+        self.conditions = []      # (table or None, column, operator, value)
+
+
+class FastPathParser:
+    """Recognizes simple questions against one SchemaIndex."""
+
+    def __init__(self, index):
+        self.index = index
+        self.table_words = {}
+        for table in index.valid_tables:
+            words = tuple(table.split("_"))
+            self.table_words[words] = table
+            self.table_words[words[:-1] + (_singular(words[-1]),)] = table
+        for word, table in TABLE_SYNONYMS.items():
+            if table in index.valid_tables:
+                self.table_words.setdefault((word,), table)
+        self.max_table_words = max((len(words) for words in self.table_words), default=1)
+
+    # -- schema lookups --
+
+    def _match_table(self, q: _Question):
+        for size in range(self.max_table_words, 0, -1):
+            words = tuple(q.words[q.pos:q.pos + size])
+            if len(words) == size and words in self.table_words:
+                q.pos += size
+                return self.table_words[words]
+        return None
+
+    def _match_column(self, q: _Question, tables):
+        """
+        Column named at the current position: `retail_price`, `retail price`, a plural
+        (`countries`) or one unambiguous part of a name (`price`). Returns (table or None, column).
+        """
+        candidates = tables or list(self.index.valid_tables)
+        for size in (3, 2, 1):
+            words = q.words[q.pos:q.pos + size]
+            if len(words) < size:
+                continue
+            for name in {"_".join(words), "_".join(words[:-1] + [_singular(words[-1])])}:
+                owners = [t for t in candidates if name in self.index.valid_columns[t]]
+                if owners:
+                    q.pos += size
+                    return (owners[0] if len(owners) == 1 else None), name
+        word = _singular(q.words[q.pos]) if not q.done() else None
+        if word and not word.isdigit() and word not in FILLER:
+            matches = {
+                (t, col) for t in candidates for col in self.index.valid_columns[t]
+                if word in col.split("_") and col != "id" and not col.endswith("_id")
+            }
+            if len(matches) == 1:
+                q.pos += 1
+                return next(iter(matches))
+        return None
+
+    def _column_table(self, table, column: str, entity: str):
+        """Owner of a column: the one given, else the entity table if it has it."""
+        if table is not None:
+            return table
+        if entity is not None and column in self.index.valid_columns[entity]:
+            return entity
+        return None
+
+    # -- grammar --
+
+    def parse(self, question: str):
+        """Return (intent, sql), or None when the question is not confidently understood."""
+        q = _Question(question)
+        p = _Parse()
+        if not q.words:
+            return None
+
+        while not q.done():
+            if not self._step(q, p):
+                return None
+        return self._build(p)
+
+    def _step(self, q: _Question, p: _Parse) -> bool:
+        """Consume one construct at q.pos; False when the next word is not understood."""
+        start = q.pos
+        word = q.peek()
+        known = [p.tables[0]] if p.tables else None
+
+        # top 10 ... / bottom 5 ...
+        if word in TOP_WORDS and _number(q.peek(1) or "") is not None:
+            q.pos += 2
+            return self._set_limit(p, q.words[start + 1], TOP_WORDS[word])
+        # 10 most ... / 5 lowest ...
+        if _number(word) is not None and (q.peek(1) in RANK_WORDS or q.peek(1) in TOP_WORDS):
+            direction = RANK_WORDS.get(q.peek(1)) or TOP_WORDS[q.peek(1)]
+            q.pos += 2
+            return self._set_limit(p, word, direction)
+        if word in RANK_WORDS and p.limit is not None:
+            q.pos += 1
+            p.direction = RANK_WORDS[word]
+            return True
+
+        if q.any_phrase(COUNT_PHRASES):
+            return self._set_aggregate(p, ("COUNT", None, None))
+        if word in AGGREGATE_WORDS:
+            q.pos += 1
+            q.phrase("of")
+            q.phrase("the")
+            column = self._match_column(q, known)
+            if column is None:
+                # "total" on its own is just filler ("in total")
+                q.pos = start
+                if word == "total":
+                    q.pos += 1
+                    return True
+                return False
+            return self._set_aggregate(p, (AGGREGATE_WORDS[word], column[0], column[1]))
+
+        group = q.any_phrase(GROUP_PHRASES)
+        if group is not None:
+            return self._parse_by(q, p, known, ordering=group == ("by",))
+
+        for words, (column, operator) in COMPARATIVES.items():
+            if q.phrase(*words):
+                return self._parse_value(q, p, self._implied_column(column, known), operator)
+        if word in CONDITION_WORDS:
+            q.pos += 1
+            q.phrase("have")
+            q.phrase("a")
+            return self._parse_condition(q, p, known)
+        if word in LOCATION_WORDS:
+            q.pos += 1
+            q.phrase("the")
+            if self._parse_location(q, p):
+                return True
+            q.pos = start
+
+        for column in ("status", "gender"):
+            values = KNOWN_VALUES[column]
+            if word in values:
+                q.pos += 1
+                p.conditions.append((None, column, "=", values[word]))
+                return True
+
+        table = self._match_table(q)
+        if table is not None:
+            if table not in p.tables:
+                p.tables.append(table)
+            return True
+        column = self._match_column(q, known)
+        if column is not None:
+            p.columns.append(column)
+            return True
+        if word in FILLER or word in RANK_WORDS:
+            q.pos += 1
+            return True
+        return False
+
+    def _set_limit(self, p: _Parse, number: str, direction: str) -> bool:
+        limit = _number(number)
+        if p.limit is not None or not isinstance(limit, int) or limit <= 0:
+            return False
+        p.limit, p.direction = limit, direction
+        return True
+
+    def _set_aggregate(self, p: _Parse, aggregate: tuple) -> bool:
+        if p.aggregate is not None:
+            return False
+        p.aggregate = aggregate
+        return True
+
+    def _parse_by(self, q: _Question, p: _Parse, known, ordering: bool) -> bool:
+        # "top 10 countries by number of users": rank groups by a count
+        if ordering and p.limit is not None and q.any_phrase(COUNT_PHRASES):
+            table = self._match_table(q)
+            if table is not None and table not in p.tables:
+                p.tables.append(table)
+            return self._set_aggregate(p, ("COUNT", None, None))
+        if ordering and p.limit is not None and q.peek() in AGGREGATE_WORDS:
+            return True
+        q.phrase("product")   # "per product category"
+        column = self._match_column(q, known)
+        if column is None:
+            return False
+        if ordering and p.limit is not None and p.aggregate is None and not p.columns:
+            if p.order_by is not None:
+                return False
+            p.order_by = column
+        else:
+            if p.group_by is not None:
+                return False
+            p.group_by = column
+        return True
+
+    def _implied_column(self, name: str, known):
+        tables = known or list(self.index.valid_tables)
+        matches = [(t, c) for t in tables for c in self.index.valid_columns[t] if name in c.split("_")]
+        return matches[0] if len(matches) == 1 else None
+
+    def _parse_condition(self, q: _Question, p: _Parse, known) -> bool:
+        column = self._match_column(q, known)
+        if column is None:
+            return False
+        operator = None
+        for words, op in OPERATORS:
+            if q.phrase(*words):
+                operator = op
+                break
+        return self._parse_value(q, p, column, operator or "=")
+
+    def _parse_value(self, q: _Question, p: _Parse, column, operator: str) -> bool:
+        if column is None or q.done():
+            return False
+        table, name = column
+        word = q.words[q.pos]
+        if name in KNOWN_VALUES and word in KNOWN_VALUES[name]:
+            q.pos += 1
+            p.conditions.append((table, name, operator, KNOWN_VALUES[name][word]))
+            return True
+        value = _number(word)
+        if value is None:
+            if operator != "=":
+                return False
+            value = q.raw[q.pos]
+        q.pos += 1
+        q.phrase("dollars") or q.phrase("usd") or q.phrase("years", "old") or q.phrase("years")
+        p.conditions.append((table, name, operator, value))
+        return True
+
+    def _parse_location(self, q: _Question, p: _Parse) -> bool:
+        """`in Brazil`, `from the United States`: only countries listed in KNOWN_VALUES."""
+        countries = KNOWN_VALUES["country"]
+        for size in (2, 1):
+            name = " ".join(q.words[q.pos:q.pos + size])
+            if name in countries:
+                q.pos += size
+                p.conditions.append((None, "country", "=", countries[name]))
+                return True
+        return False
+
+    # -- output --
+
+    def _entity(self, p: _Parse):
+        """The one table the question is about."""
+        if len(p.tables) > 1:
+            return None
+        if p.tables:
+            return p.tables[0]
+        refs = p.columns + [ref for ref in (p.group_by, p.order_by) if ref] + [c[:2] for c in p.conditions]
+        owners = {table for table, _ in refs if table}
+        if p.aggregate and p.aggregate[1]:
+            owners.add(p.aggregate[1])
+        return owners.pop() if len(owners) == 1 else None
+
+    def _build(self, p: _Parse):
+        entity = self._entity(p)
+        if entity is None:
+            return None
+        own = lambda table, column: self._column_table(table, column, entity)
+
+        columns = []
+        for table, column in p.columns:
+            if own(table, column) != entity:
+                return None
+            columns.append(column)
+        conditions = []
+        for table, column, operator, value in p.conditions:
+            if own(table, column) != entity:
+                return None
+            if not self._understood_value(entity, column, value):
+                return None
+            conditions.append((column, operator, value))
+        group_by = p.group_by
+        if group_by is not None:
+            if own(*group_by) != entity:
+                return None
+            group_by = group_by[1]
+        order_by = p.order_by
+        if order_by is not None:
+            if own(*order_by) != entity:
+                return None
+            order_by = order_by[1]
+
+        aggregate = p.aggregate
+        if aggregate is None and group_by is not None:
+            aggregate = ("COUNT", None, None)         # "orders by status"
+        if aggregate is not None:
+            function, table, column = aggregate
+            if column is not None:
+                if own(table, column) != entity:
+                    return None
+                if self.index.column_types[(entity, column)] not in NUMERIC_TYPES:
+                    return None
+            if group_by is None and columns:
+                if len(columns) > 1:
+                    return None
+                group_by = columns[0]                 # "top 10 countries by number of users"
+                columns = []
+            if columns or order_by is not None:
+                return None
+            aggregate = (function, column)
+        elif p.limit is not None and order_by is None:
+            return None                               # "top 10 products" — by what?
+
+        return self._render(entity, columns, aggregate, group_by, order_by, conditions, p.limit, p.direction)
+
+    def _understood_value(self, table: str, column: str, value) -> bool:
+        """Numbers for numeric columns, ISO dates for temporal ones, a listed value where KNOWN_VALUES has a list."""
+        column_type = self.index.column_types[(table, column)]
+        if (column_type in NUMERIC_TYPES) != isinstance(value, (int, float)):
+            return False
+        if column_type in TEMPORAL_TYPES:
+            return _iso_date(value)
+        if column in KNOWN_VALUES:
+            return value in KNOWN_VALUES[column].values()
+        return True
+
+    def _primary_key(self, table: str) -> str:
+        keys = [c for c in self.index.valid_columns[table] if c == "id" or c == f"{_singular(table)}_id"]
+        return keys[0] if keys else None
+
+    def _render(self, entity, columns, aggregate, group_by, order_by, conditions, limit, direction):
+        """Intent JSON for the parse; the SQL comes from sql_compiler like any other intent (None if it can't)."""
+        intent = {
+            "is_relevant": True,
+            "irrelevance_reason": None,
+            "target_tables": [entity],
+            "selected_columns": {entity: list(columns)},
+            "conditions": [
+                {"table": entity, "column": col, "operator": op, "value": value}
+                for col, op, value in conditions
+            ],
+            "joins": [],
+            "aggregations": [],
+            "group_by": [],
+            "order_by": [],
+            "limit": limit,
+            "query_intent_summary": _summary(entity, aggregate, group_by, order_by, conditions, limit),
+        }
+
+        if aggregate is not None:
+            function, column = aggregate
+            if column is None:
+                column = self._primary_key(entity) or "*"
+                name = f"{_singular(entity.split('_')[-1])}_count"
+            else:
+                name = f"{function.lower()}_{column}"
+            intent["aggregations"].append({"function": function, "column": column, "table": entity, "alias": name})
+            if group_by is not None:
+                intent["selected_columns"][entity] = [group_by]
+                intent["group_by"].append({"table": entity, "column": group_by})
+                intent["order_by"].append({"table": entity, "column": name, "direction": direction or "DESC"})
+        elif order_by is not None:
+            intent["order_by"].append({"table": entity, "column": order_by, "direction": direction or "DESC"})
+
+        try:
+            return intent, compile_intent(intent, self.index)
+        except CompileError:
+            return None
+
+
+def _summary(entity, aggregate, group_by, order_by, conditions, limit) -> str:
+    if aggregate is None:
+        text = f"List {entity}"
+    elif aggregate[1] is None:
+        text = f"Count {entity}"
+    else:
+        text = f"{aggregate[0]} of {aggregate[1]} over {entity}"
+    if group_by:
+        text += f" per {group_by}"
+    if conditions:
+        text += " where " + " and ".join(f"{col} {op} {value}" for col, op, value in conditions)
+    if order_by:
+        text += f" ordered by {order_by}"
+    if limit:
+        text += f", top {limit}"
+    return text
+
+
+_parsers = {}
+
+
+def parse_question(question: str, index):
+    """(intent, sql) for a question the fast path understands, else None."""
+    parser = _parsers.get(index.fingerprint)
+    if parser is None:
+        parser = _parsers[index.fingerprint] = FastPathParser(index)
+    return parser.parse(question)
@@ -0,0 +1,453 @@
+"""
+sql_compiler.py - Deterministic intent JSON -> BigQuery SQL, replacing the SQL
+generation LLM call for intents it can express. Tables are written with their
+full backticked path, joins follow the foreign keys in schema.py (intermediate
+tables are added when two tables are only linked through a third), and GROUP BY
+is derived from the select list so it is always complete.
+Anything it cannot render faithfully raises CompileError and the pipeline falls
+back to the LLM.
+"""
+import re
+from collections import deque
+from app.bigquery_client import DATASET
+
+# Known values of categorical columns: question / intent word -> stored value
+KNOWN_VALUES = {
+    "status": {
+        "processing": "Processing", "complete": "Complete", "completed": "Complete",
+        "cancelled": "Cancelled", "canceled": "Cancelled", "returned": "Returned", "shipped": "Shipped",
+    },
+    "gender": {"male": "M", "female": "F"},
+    # Spelled as stored in thelook_ecommerce (e.g. Brasil)
+    "country": {
+        "united states": "United States", "usa": "United States", "us": "United States",
+        "china": "China", "brazil": "Brasil", "brasil": "Brasil", "south korea": "South Korea",
+        "korea": "South Korea", "france": "France", "united kingdom": "United Kingdom",
+        "uk": "United Kingdom", "germany": "Germany", "spain": "Spain", "japan": "Japan",
+        "australia": "Australia", "belgium": "Belgium", "poland": "Poland", "colombia": "Colombia",
+        "austria": "Austria",
+    },
+}
+
+NUMERIC_TYPES = {"INT", "INTEGER", "DECIMAL", "FLOAT", "NUMERIC", "BIGNUMERIC", "FLOAT64", "INT64"}
+TEMPORAL_TYPES = {"DATE", "DATETIME", "TIMESTAMP"}
+AGGREGATES = {"COUNT", "SUM", "AVG", "MAX", "MIN"}
+COMPARISONS = {"=", "!=", "<>", ">", "<", ">=", "<="}
+JOIN_TYPES = {"INNER": "JOIN", "LEFT": "LEFT JOIN", "RIGHT": "RIGHT JOIN", "FULL": "FULL OUTER JOIN"}
+
+_IDENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_DATETIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?$")
+# Relative dates the intent may carry as a value (the forms _SQL_RULES asks for)
+_RELATIVE_DATE_RE = re.compile(
+    r"^(CAST\(\s*)?DATE_SUB\(\s*CURRENT_DATE\(\)\s*,\s*INTERVAL\s+\d+\s+(DAY|WEEK|MONTH|QUARTER|YEAR)\s*\)"
+    r"(\s+AS\s+TIMESTAMP\s*\))?$|^CURRENT_(DATE|TIMESTAMP)\(\)$",
+    re.IGNORECASE,
+)
+
+
+class CompileError(ValueError):
+    """The intent uses something the compiler cannot render faithfully."""
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        try:
+            return float(str(value).strip())
+        except ValueError:
+            return None
+
+
+class _Compiler:
+    """State for compiling one intent against one SchemaIndex."""
+
+    def __init__(self, intent: dict, index):
+        self.intent = intent
+        self.index = index
+        self.tables = []        # every table the query touches, in first-mention order
+        self.mentioned = []     # tables named by the intent (unqualified columns resolve against these)
+        self.aliases = {}       # table -> alias
+
+    # -- schema lookups --
+
+    def _use_table(self, table) -> str:
+        if not isinstance(table, str) or table not in self.index.valid_tables:
+            raise CompileError(f"Unknown table '{table}'.")
+        if table not in self.tables:
+            self.tables.append(table)
+        return table
+
+    def _owner(self, table, column: str) -> str:
+        """Table that holds `column`: the one named, else the only mentioned table that has it."""
+        if table:
+            self._use_table(table)
+            if column not in self.index.valid_columns[table]:
+                raise CompileError(f"Column '{column}' does not exist in table '{table}'.")
+            return table
+        owners = [t for t in self.mentioned if column in self.index.valid_columns[t]]
+        if len(owners) != 1:
+            raise CompileError(f"Cannot tell which table column '{column}' belongs to.")
+        return owners[0]
+
+    def _ref(self, table: str, column: str) -> str:
+        return f"{self.aliases[table]}.{column}"
+
+    def _type(self, table: str, column: str) -> str:
+        return str(self.index.column_types[(table, column)]).upper()
+
+    # -- joins --
+
+    def _base_table(self) -> str:
+        """The fact table: the one with the most foreign keys to the other tables in the query."""
+        linked = lambda t: sum(1 for src, _, ref, _ in self.index.foreign_keys if src == t and ref in self.tables)
+        return max(self.tables, key=lambda t: (linked(t), -self.tables.index(t)))
+
+    def _foreign_key(self, a: str, b: str):
+        """(a_column, b_column) of the first foreign key between a and b, in either direction."""
+        for src, col, ref, ref_col in self.index.foreign_keys:
+            if (src, ref) == (a, b):
+                return col, ref_col
+            if (src, ref) == (b, a):
+                return ref_col, col
+        return None
+
+    def _join_types(self) -> dict:
+        """(left, right) -> join type requested by the intent's joins."""
+        types = {}
+        for join in self.intent.get("joins") or []:
+            if not isinstance(join, dict):
+                continue
+            kind = str(join.get("join_type") or "INNER").upper().replace("JOIN", "").replace("OUTER", "").strip()
+            if kind not in JOIN_TYPES:
+                raise CompileError(f"Unsupported join type '{join.get('join_type')}'.")
+            left, right = join.get("left_table"), join.get("right_table")
+            for table in (left, right):
+                self._use_table(table)
+            types[(left, right)] = kind
+        return types
+
+    def _plan_joins(self) -> list:
+        """
+        Order the tables so each one joins a table already in the query over a foreign key.
+        Returns [(table, join_type, previous_table, previous_column, column)] after the base table.
+        """
+        join_types = self._join_types()
+        base = self._base_table()
+        joined = [base]
+        steps = []
+        pending = [t for t in self.tables if t != base]
+        while pending:
+            path = self._shortest_path(joined, set(pending))
+            if path is None:
+                raise CompileError(f"No foreign key path joins {', '.join(pending)} to {base}.")
+            for previous, table in zip(path, path[1:]):
+                prev_col, col = self._foreign_key(previous, table)
+                kind = join_types.get((previous, table))
+                if kind is None:
+                    flipped = join_types.get((table, previous), "INNER")
+                    kind = {"LEFT": "RIGHT", "RIGHT": "LEFT"}.get(flipped, flipped)
+                steps.append((table, kind, previous, prev_col, col))
+                joined.append(table)
+                if table in pending:
+                    pending.remove(table)
+        self.tables = joined
+        return steps
+
+    def _shortest_path(self, start: list, targets: set):
+        """Breadth-first search over fk_graph from any joined table to the nearest target."""
+        parents = {table: None for table in start}
+        queue = deque(start)
+        while queue:
+            table = queue.popleft()
+            if table in targets:
+                path = [table]
+                while parents[path[-1]] is not None:
+                    path.append(parents[path[-1]])
+                return path[::-1]
+            for neighbour in sorted(self.index.fk_graph.get(table, ())):
+                if neighbour not in parents:
+                    parents[neighbour] = table
+                    queue.append(neighbour)
+        return None
+
+    def _assign_aliases(self):
+        for table in self.tables:
+            alias = "".join(part[0] for part in table.split("_") if part) or "t"
+            candidate, n = alias, 2
+            while candidate in self.aliases.values():
+                candidate, n = f"{alias}{n}", n + 1
+            self.aliases[table] = candidate
+
+    # -- values --
+
+    def _literal(self, table: str, column: str, value, operator: str) -> str:
+        column_type = self._type(table, column)
+        if value is None:
+            raise CompileError(f"Condition on '{column}' has no value.")
+        if column_type in NUMERIC_TYPES:
+            number = _number(value)
+            if number is None:
+                raise CompileError(f"Non-numeric value {value!r} for numeric column '{column}'.")
+            return repr(number)
+        if column_type in TEMPORAL_TYPES:
+            if operator in ("LIKE", "NOT LIKE"):
+                raise CompileError(f"LIKE on {column_type} column '{column}'.")
+            return self._temporal_literal(column_type, value)
+        if column_type in ("BOOL", "BOOLEAN"):
+            text = str(value).strip().lower()
+            if text not in ("true", "false"):
+                raise CompileError(f"Non-boolean value {value!r} for column '{column}'.")
+            return text.upper()
+        if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+            raise CompileError(f"Unsupported value {value!r} for column '{column}'.")
+        text = str(value)
+        if operator not in ("LIKE", "NOT LIKE"):
+            text = KNOWN_VALUES.get(column, {}).get(text.strip().lower(), text)
+        return _quote(text)
+
+    def _temporal_literal(self, column_type: str, value) -> str:
+        text = str(value).strip()
+        if _RELATIVE_DATE_RE.match(text):
+            expr = re.sub(r"\s+", " ", text)
+            upper = expr.upper()
+            if column_type == "TIMESTAMP" and upper.startswith("DATE_SUB"):
+                expr = f"CAST({expr} AS TIMESTAMP)"
+            elif column_type == "TIMESTAMP" and upper == "CURRENT_DATE()":
+                expr = "CURRENT_TIMESTAMP()"
+            elif column_type == "DATE" and upper.startswith("CAST("):
+                expr = expr[len("CAST("):expr.upper().rindex(" AS TIMESTAMP")].strip()
+            return expr
+        if _DATE_RE.match(text) or _DATETIME_RE.match(text):
+            if column_type == "DATE" and not _DATE_RE.match(text):
+                raise CompileError(f"Date-time value {text!r} for DATE column.")
+            return f"{column_type} {_quote(text)}"
+        raise CompileError(f"Unsupported {column_type} value {value!r}.")
+
+    def _values(self, value) -> list:
+        if isinstance(value, (list, tuple)):
+            return list(value)
+        if isinstance(value, str):
+            text = value.strip().strip("()")
+            return [part.strip().strip("'\"") for part in text.split(",") if part.strip()]
+        return [value]
+
+    def _condition(self, cond: dict, aggregates: dict) -> tuple:
+        """Render one condition; returns (clause, is_having)."""
+        operator = " ".join(str(cond.get("operator") or "=").upper().split())
+        operator = {"==": "=", "EQUALS": "="}.get(operator, operator)
+        column = cond.get("column")
+        value = cond.get("value")
+
+        if column in aggregates and not cond.get("table"):
+            # Filter on an aggregate ("more than 5 orders") -> HAVING on its expression
+            if operator not in COMPARISONS:
+                raise CompileError(f"Unsupported operator '{operator}' on aggregate '{column}'.")
+            number = _number(value)
+            if number is None:
+                raise CompileError(f"Non-numeric value {value!r} for aggregate '{column}'.")
+            return f"{aggregates[column]} {operator} {number!r}", True
+
+        if not isinstance(column, str):
+            raise CompileError(f"Condition without a column: {cond!r}.")
+        table = self._owner(cond.get("table"), column)
+        ref = self._ref(table, column)
+
+        if operator in ("IS NULL", "IS NOT NULL"):
+            return f"{ref} {operator}", False
+        if value is None:
+            # The intent format uses null for "dynamic", not SQL NULL
+            raise CompileError(f"Condition on '{column}' has no value.")
+        if isinstance(value, str) and value.strip().upper() == "NULL":
+            if operator in ("=", "IS"):
+                return f"{ref} IS NULL", False
+            if operator in ("!=", "<>", "IS NOT"):
+                return f"{ref} IS NOT NULL", False
+            raise CompileError(f"Condition on '{column}' has no value.")
+        if operator in COMPARISONS or operator in ("LIKE", "NOT LIKE"):
+            if isinstance(value, (list, tuple)):
+                raise CompileError(f"List value for operator '{operator}'.")
+            return f"{ref} {operator} {self._literal(table, column, value, operator)}", False
+        if operator in ("IN", "NOT IN"):
+            values = self._values(value)
+            if not values:
+                raise CompileError(f"Empty {operator} list for '{column}'.")
+            items = ", ".join(self._literal(table, column, v, "=") for v in values)
+            return f"{ref} {operator} ({items})", False
+        if operator == "BETWEEN":
+            bounds = value if isinstance(value, (list, tuple)) else re.split(r"\s+AND\s+", str(value), flags=re.I)
+            if len(bounds) != 2:
+                raise CompileError(f"BETWEEN needs two values for '{column}'.")
+            low, high = (self._literal(table, column, v.strip() if isinstance(v, str) else v, "=") for v in bounds)
+            return f"{ref} BETWEEN {low} AND {high}", False
+        raise CompileError(f"Unsupported operator '{operator}'.")
+
+    # -- query --
+
+    def _aggregations(self) -> list:
+        """[(alias, expression, (table, column) or None)] for each intent aggregation."""
+        rendered, seen = [], set()
+        for agg in self.intent.get("aggregations") or []:
+            if not isinstance(agg, dict):
+                raise CompileError(f"Malformed aggregation {agg!r}.")
+            function = " ".join(str(agg.get("function") or "").upper().replace("_", " ").split())
+            distinct = function == "COUNT DISTINCT"
+            if distinct:
+                function = "COUNT"
+            if function not in AGGREGATES:
+                raise CompileError(f"Unsupported aggregate '{agg.get('function')}'.")
+            column = agg.get("column")
+            if column in (None, "", "*"):
+                if function != "COUNT" or distinct:
+                    raise CompileError(f"{function} needs a column.")
+                expr, source = "COUNT(*)", None
+            else:
+                table = self._owner(agg.get("table"), column)
+                if function in ("SUM", "AVG") and self._type(table, column) not in NUMERIC_TYPES:
+                    raise CompileError(f"{function} over non-numeric column '{column}'.")
+                source = (table, column)
+                inner = self._ref(table, column)
+                expr = f"COUNT(DISTINCT {inner})" if distinct else f"{function}({inner})"
+
+            alias = agg.get("alias")
+            if not isinstance(alias, str) or not _IDENT_RE.match(alias):
+                alias = f"{function.lower()}_{column}" if source else "count"
+            unique, n = alias, 2
+            while unique in seen:
+                unique, n = f"{alias}_{n}", n + 1
+            seen.add(unique)
+            rendered.append((unique, expr, source))
+        return rendered
+
+    def _mention_tables(self):
+        intent = self.intent
+        for table in intent.get("target_tables") or []:
+            self._use_table(table)
+        selected = intent.get("selected_columns") or {}
+        if not isinstance(selected, dict):
+            raise CompileError("selected_columns is not an object.")
+        for table in selected:
+            self._use_table(table)
+        for section in ("conditions", "aggregations", "group_by", "order_by"):
+            for item in intent.get(section) or []:
+                if not isinstance(item, dict):
+                    raise CompileError(f"Malformed {section} entry {item!r}.")
+                if item.get("table"):
+                    self._use_table(item["table"])
+        if not self.tables:
+            raise CompileError("Intent names no tables.")
+
+    def compile(self) -> str:
+        intent = self.intent
+        self._mention_tables()
+        self.mentioned = list(self.tables)
+        joins = self._plan_joins()
+        self._assign_aliases()
+
+        aggregations = self._aggregations()
+        aggregate_exprs = {alias: expr for alias, expr, _ in aggregations}
+        aggregated = {source for _, _, source in aggregations if source}
+
+        where, having = [], []
+        filtered = set()
+        for cond in intent.get("conditions") or []:
+            clause, is_having = self._condition(cond, aggregate_exprs)
+            (having if is_having else where).append(clause)
+            if not is_having:
+                filtered.add((self._owner(cond.get("table"), cond["column"]), cond["column"]))
+        if having and not aggregations:
+            raise CompileError("HAVING without aggregates.")
+
+        group_by = []
+        for item in intent.get("group_by") or []:
+            ref = (self._owner(item.get("table"), item.get("column")), item.get("column"))
+            if ref not in group_by:
+                group_by.append(ref)
+
+        columns, star = [], []
+        for table, names in (intent.get("selected_columns") or {}).items():
+            for name in names or []:
+                if name == "*":
+                    star.append(table)
+                    continue
+                ref = (self._owner(table, name), name)
+                if ref not in columns:
+                    columns.append(ref)
+
+        if aggregations and group_by:
+            # Other plain columns ride along in GROUP BY; aggregate inputs and filter columns do not
+            for ref in columns:
+                if ref not in group_by and ref not in aggregated and ref not in filtered:
+                    group_by.append(ref)
+        grouped = bool(aggregations or group_by)
+
+        if grouped:
+            select = [self._ref(*ref) for ref in group_by]
+        else:
+            select = [f"{self.aliases[t]}.*" for t in star] + [self._ref(*ref) for ref in columns]
+        select += [f"{expr} AS {alias}" for alias, expr, _ in aggregations]
+        if not select:
+            select = [f"{self.aliases[self.mentioned[0]]}.*"]
+
+        order = []
+        for item in intent.get("order_by") or []:
+            direction = str(item.get("direction") or "ASC").upper()
+            if direction not in ("ASC", "DESC"):
+                raise CompileError(f"Unsupported sort direction '{item.get('direction')}'.")
+            order.append(f"{self._order_target(item, aggregations, group_by if grouped else None)} {direction}")
+
+        limit = intent.get("limit")
+        if limit is not None:
+            limit = _number(limit)
+            if not isinstance(limit, int) or limit < 0:
+                raise CompileError(f"Invalid limit {intent.get('limit')!r}.")
+
+        base = self.tables[0]
+        sql = f"SELECT {', '.join(select)}\nFROM `{DATASET}.{base}` {self.aliases[base]}"
+        for table, kind, previous, prev_col, col in joins:
+            sql += (f"\n{JOIN_TYPES[kind]} `{DATASET}.{table}` {self.aliases[table]}"
+                    f" ON {self._ref(previous, prev_col)} = {self._ref(table, col)}")
+        if where:
+            sql += "\nWHERE " + " AND ".join(where)
+        if group_by:
+            sql += "\nGROUP BY " + ", ".join(self._ref(*ref) for ref in group_by)
+        if having:
+            sql += "\nHAVING " + " AND ".join(having)
+        if order:
+            sql += "\nORDER BY " + ", ".join(order)
+        if limit is not None:
+            sql += f"\nLIMIT {limit}"
+        return sql
+
+    def _order_target(self, item: dict, aggregations: list, group_by) -> str:
+        """ORDER BY item: an aggregate alias, or a column (which must be grouped when grouping)."""
+        column = item.get("column")
+        for alias, _, source in aggregations:
+            if column == alias:
+                return alias
+        if group_by is None:
+            return self._ref(self._owner(item.get("table"), column), column)
+        # "order by sale_price" next to SUM(sale_price) means the aggregate
+        for alias, _, source in aggregations:
+            if source and source[1] == column and item.get("table") in (None, source[0]):
+                return alias
+        ref = (self._owner(item.get("table"), column), column)
+        if ref not in group_by:
+            raise CompileError(f"ORDER BY '{column}' is neither grouped nor aggregated.")
+        return self._ref(*ref)
+
+
+def compile_intent(intent: dict, index) -> str:
+    """BigQuery SQL for an intent (INTENT_EXTRACTION_PROMPT format); raises CompileError."""
+    if not isinstance(intent, dict):
+        raise CompileError("Intent is not an object.")
+    return _Compiler(intent, index).compile()
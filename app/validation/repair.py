@@ -0,0 +1,159 @@
+"""
+repair.py - Local fixes for mechanical mistakes in generated SQL, applied
+before the LLM is asked for another attempt. NO LLM used here.
+  - table names in the wrong case or without the project/dataset path
+  - qualifiers naming an aliased table, or an unknown alias, when exactly
+    one table in scope has the column
+  - columns qualified with the wrong table when exactly one other table has them
+  - SELECT columns missing from GROUP BY
+  - categorical literals in the wrong case ('complete' -> 'Complete')
+Anything ambiguous is left alone for the validator to report.
+"""
+from app.bigquery_client import DATASET
+from app.schemas.schema_index import get_schema_index
+from app.services.sql_compiler import KNOWN_VALUES
+from app.validation.sql_parser import (
+    SQLSyntaxError, TableRef, parse_sql, iter_selects, iter_scoped_expressions, qualified_refs,
+    expression_tokens, identifier_name,
+)
+from app.validation.validator import SQL_KEYWORDS, missing_group_by
+
+
+def _apply(sql: str, edits: dict) -> str:
+    """Apply {start: (end, text)} replacements (non-overlapping) to sql."""
+    parts = []
+    last = 0
+    for start in sorted(edits):
+        end, text = edits[start]
+        parts.append(sql[last:start])
+        parts.append(text)
+        last = end
+    parts.append(sql[last:])
+    return "".join(parts)
+
+
+def _name(item: TableRef) -> str:
+    """How the SQL refers to a table: its alias, else the table name."""
+    return item.alias or item.name
+
+
+def _fix_tables(sql: str, query, index, edits: dict, fixes: list):
+    for select in iter_selects(query):
+        for item in select.from_items:
+            if not isinstance(item, TableRef) or item.path_span is None or item.name not in index.valid_tables:
+                continue
+            expected = f"{DATASET}.{item.name}"
+            written = ".".join(item.path)
+            # Only complete a path to our dataset: `Orders`, thelook_ecommerce.orders, ...
+            if written == expected or not expected.lower().endswith(written.lower()):
+                continue
+            start, end = item.path_span
+            edits[start] = (end, f"`{expected}`")
+            fixes.append(f"table {sql[start:end]} -> `{expected}`")
+
+
+def _tables_with(scope, column: str, index) -> list:
+    return [
+        item for item in scope.from_items
+        if isinstance(item, TableRef) and item.name in index.valid_tables
+        and column in index.valid_columns[item.name]
+    ]
+
+
+def _fix_references(query, index, edits: dict, fixes: list):
+    for scope, expr in iter_scoped_expressions(query):
+        if scope is None:
+            continue
+        for qual, col in qualified_refs(expr):
+            qualifier = identifier_name(qual)
+            column = identifier_name(col)
+            item = scope.resolve(qualifier)
+            if item is None:
+                if qualifier in SQL_KEYWORDS:
+                    continue
+                # `orders.status` although orders is aliased, or an alias that was never declared
+                named = [i for i in scope.from_items if isinstance(i, TableRef) and i.name == qualifier]
+                owners = named or _tables_with(scope, column, index)
+            elif isinstance(item, TableRef) and item.name in index.valid_tables \
+                    and column not in index.valid_columns[item.name]:
+                owners = _tables_with(scope, column, index)
+            else:
+                continue
+            if len(owners) != 1 or column not in index.valid_columns.get(owners[0].name, ()):
+                continue
+            edits[qual.pos] = (qual.end, _name(owners[0]))
+            fixes.append(f"{qual.value}.{col.value} -> {_name(owners[0])}.{col.value}")
+
+
+def _literal_column(toks: list, i: int):
+    """Column a string literal at toks[i] is compared with (`col = 'x'`, `col IN ('x', ...)`), else None."""
+    j = i - 1
+    if j >= 1 and toks[j].kind == "op" and toks[j].value in ("=", "!=", "<>"):
+        target = toks[j - 1]
+    else:
+        while j >= 0 and (toks[j].kind == "string" or toks[j].is_punct(",")):
+            j -= 1
+        if j < 2 or not toks[j].is_punct("(") or not toks[j - 1].is_kw("IN"):
+            return None
+        target = toks[j - 2]
+        if target.is_kw("NOT"):
+            target = toks[j - 3] if j >= 3 else None
+    if target is None or target.kind not in ("ident", "qident"):
+        return None
+    return identifier_name(target)
+
+
+def _fix_values(query, edits: dict, fixes: list):
+    for _, expr in iter_scoped_expressions(query):
+        toks = expression_tokens(expr)
+        for i, tok in enumerate(toks):
+            if tok.kind != "string" or tok.value[0] not in "'\"" or tok.value[:3] in ("'''", '"""'):
+                continue
+            column = _literal_column(toks, i)
+            value = tok.value[1:-1]
+            stored = KNOWN_VALUES.get(column, {}).get(value.lower())
+            if stored is None or stored == value or "\\" in value:
+                continue
+            edits[tok.pos] = (tok.end, f"'{stored}'")
+            fixes.append(f"{tok.value} -> '{stored}'")
+
+
+def _fix_group_by(query, edits: dict, fixes: list):
+    for select in iter_selects(query):
+        if not select.group_by:
+            continue
+        last = select.group_by[-1][-1] if select.group_by[-1] else None
+        missing = list(dict.fromkeys(f"{qual.value}.{col.value}" for qual, col in missing_group_by(select)))
+        if not missing or last is None or not hasattr(last, "end"):
+            continue
+        edits[last.end] = (last.end, "".join(f", {ref}" for ref in missing))
+        fixes.extend(f"GROUP BY + {ref}" for ref in missing)
+
+
+def repair_sql(sql: str, index=None) -> tuple:
+    """
+    Returns (sql, fixes): the repaired statement and one line per fix applied.
+    fixes is empty, and sql returned unchanged, when there was nothing to repair
+    or the SQL does not parse.
+    """
+    index = index or get_schema_index()
+    original = sql
+    sql = sql.strip().rstrip(";").strip()
+    fixes = []
+    try:
+        query = parse_sql(sql)
+        edits = {}
+        _fix_tables(sql, query, index, edits, fixes)
+        _fix_references(query, index, edits, fixes)
+        _fix_values(query, edits, fixes)
+        if edits:
+            sql = _apply(sql, edits)
+            query = parse_sql(sql)
+        # GROUP BY is checked against the corrected qualifiers
+        edits = {}
+        _fix_group_by(query, edits, fixes)
+        if edits:
+            sql = _apply(sql, edits)
+    except SQLSyntaxError:
+        return original, []
+    return (sql, list(dict.fromkeys(fixes))) if fixes else (original, [])
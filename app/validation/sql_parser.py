@@ -0,0 +1,693 @@
+"""
+sql_parser.py - Single-pass tokenizer and lightweight AST for BigQuery SELECT statements.
+Understands CTEs, subqueries, set operations, JOINs and per-scope aliases.
+It is not a full SQL grammar: expressions are kept as token lists, only the
+structure the validator needs (scopes, tables, clauses) is parsed.
+"""
+import re
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<string>[rRbB]{0,2}(?:'''.*?'''|\"\"\".*?\"\"\"|'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"))
+  | (?P<qident>`[^`]*`)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<param>@@?[A-Za-z_][A-Za-z0-9_]*|\?)
+  | (?P<op><>|!=|>=|<=|\|\||<<|>>|=>|[-+*/%=<>~&|^!])
+  | (?P<punct>[(),.;\[\]{}:])
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+SET_OPERATORS = {"UNION", "INTERSECT", "EXCEPT"}
+JOIN_WORDS = {"JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL"}
+# Keywords that end an expression at parenthesis depth 0
+CLAUSE_WORDS = {"FROM", "WHERE", "GROUP", "HAVING", "QUALIFY", "WINDOW", "ORDER", "LIMIT", "OFFSET"}
+# Words that can never be a table or column alias
+RESERVED = CLAUSE_WORDS | SET_OPERATORS | JOIN_WORDS | {
+    "OUTER", "ON", "USING", "AS", "SELECT", "AND", "OR", "NOT", "IN", "IS", "LIKE",
+    "BETWEEN", "CASE", "WHEN", "THEN", "ELSE", "END", "NULL", "TRUE", "FALSE", "WITH",
+    "BY", "ASC", "DESC", "DISTINCT", "ALL", "OVER", "PARTITION", "TABLESAMPLE", "FOR",
+    "INTERVAL", "EXISTS", "LATERAL", "UNNEST", "NULLS", "FIRST", "LAST",
+}
+AGGREGATE_FUNCTIONS = {
+    "COUNT", "SUM", "AVG", "MAX", "MIN", "COUNTIF", "ARRAY_AGG", "STRING_AGG",
+    "APPROX_COUNT_DISTINCT", "APPROX_QUANTILES", "APPROX_TOP_COUNT", "ANY_VALUE",
+    "LOGICAL_AND", "LOGICAL_OR", "BIT_AND", "BIT_OR", "BIT_XOR", "STDDEV",
+    "STDDEV_POP", "STDDEV_SAMP", "VARIANCE", "VAR_POP", "VAR_SAMP", "CORR",
+    "COVAR_POP", "COVAR_SAMP", "ARRAY_CONCAT_AGG",
+}
+
+
+class SQLSyntaxError(ValueError):
+    pass
+
+
+class Token:
+    __slots__ = ("kind", "value", "upper", "pos", "end")
+
+    def __init__(self, kind: str, value: str, pos: int, end: int):
+        self.kind = kind
+        self.value = value
+        self.upper = value.upper() if kind == "ident" else value
+        self.pos = pos
+        self.end = end
+
+    def is_kw(self, *words) -> bool:
+        return self.kind == "ident" and self.upper in words
+
+    def is_punct(self, ch: str) -> bool:
+        return self.kind == "punct" and self.value == ch
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.value!r})"
+
+
+def tokenize(sql: str) -> list:
+    """Split SQL into tokens in one regex pass, dropping whitespace and comments."""
+    tokens = []
+    for m in _TOKEN_RE.finditer(sql):
+        kind = m.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        tokens.append(Token(kind, m.group(), m.start(), m.end()))
+    return tokens
+
+
+def canonical_sql(sql: str) -> str:
+    """
+    Whitespace-, comment-, keyword-case- and table-alias-insensitive form of a
+    statement, used as a cache key. String literals and backticked names are kept
+    exactly; column aliases keep their spelling because they name the result
+    columns. SQL that does not parse keeps the spelling of every identifier.
+    """
+    tokens = tokenize(sql)
+    while tokens and tokens[-1].is_punct(";"):
+        tokens.pop()
+    try:
+        query = parse_sql(sql)
+    except SQLSyntaxError:
+        return " ".join(tok.value for tok in tokens)
+    renames = _table_alias_renames(query, tokens)
+    for select in iter_selects(query):
+        for item in select.items:
+            alias = _alias_token(item)
+            if alias is not None:
+                renames[alias.pos] = alias.value
+    return " ".join(text for text in (renames.get(tok.pos, tok.upper) for tok in tokens) if text)
+
+
+def identifier_name(token: Token) -> str:
+    """Lowercased name of an identifier; for `a.b.c` the last path part."""
+    if token.kind == "qident":
+        return token.value.strip("`").split(".")[-1].lower()
+    return token.value.lower()
+
+
+# --- AST ---
+
+class TableRef:
+    """A base table in FROM/JOIN."""
+    def __init__(self, name: str, path: list, alias: str = None):
+        self.name = name
+        self.path = path
+        self.alias = alias
+        self.alias_token = None
+        self.path_span = None      # (start, end) offsets of the table path in the SQL
+
+
+class DerivedRef:
+    """A subquery or CTE used in FROM/JOIN; its columns are not schema columns."""
+    def __init__(self, query, alias: str = None, cte_name: str = None):
+        self.query = query
+        self.alias = alias
+        self.cte_name = cte_name
+        self.alias_token = None
+
+
+class UnnestRef:
+    def __init__(self, alias: str = None):
+        self.alias = alias
+        self.alias_token = None
+
+
+class Select:
+    """One SELECT block. Expressions are lists of Tokens and nested Query nodes."""
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.items = []
+        self.from_items = []
+        self.aliases = {}          # lowercased alias / table name -> from item
+        self.join_conditions = []
+        self.other_exprs = []      # UNNEST arguments, USING lists
+        self.where = None
+        self.group_by = None
+        self.having = None
+        self.qualify = None
+
+    def add_from_item(self, item):
+        self.from_items.append(item)
+        if item.alias:
+            self.aliases[item.alias] = item
+        elif isinstance(item, TableRef):
+            self.aliases.setdefault(item.name, item)
+        elif isinstance(item, DerivedRef) and item.cte_name:
+            self.aliases.setdefault(item.cte_name, item)
+
+    def resolve(self, qualifier: str):
+        """Find the from item a qualifier refers to, looking outwards through enclosing scopes."""
+        scope = self
+        while scope is not None:
+            item = scope.aliases.get(qualifier)
+            if item is not None:
+                return item
+            scope = scope.parent
+        return None
+
+    def expressions(self) -> list:
+        exprs = list(self.items) + list(self.join_conditions) + list(self.other_exprs)
+        exprs += list(self.group_by or [])
+        exprs += [e for e in (self.where, self.having, self.qualify) if e is not None]
+        return exprs
+
+
+class Query:
+    """WITH ... SELECT ... [UNION ...] [ORDER BY ...] [LIMIT ...]"""
+    def __init__(self):
+        self.ctes = {}
+        self.branches = []         # Select or parenthesized Query
+        self.order_by = []
+        self.limit = None
+
+    @property
+    def scope(self):
+        """The Select whose aliases ORDER BY resolves against."""
+        branch = self.branches[0] if self.branches else None
+        while isinstance(branch, Query):
+            branch = branch.branches[0] if branch.branches else None
+        return branch
+
+
+# --- Parser ---
+
+class _Parser:
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.i = 0
+
+    def peek(self, offset: int = 0):
+        j = self.i + offset
+        return self.tokens[j] if j < len(self.tokens) else None
+
+    def next(self) -> Token:
+        tok = self.peek()
+        if tok is None:
+            raise SQLSyntaxError("Unexpected end of SQL.")
+        self.i += 1
+        return tok
+
+    def at_kw(self, *words) -> bool:
+        tok = self.peek()
+        return tok is not None and tok.is_kw(*words)
+
+    def at_punct(self, ch: str) -> bool:
+        tok = self.peek()
+        return tok is not None and tok.is_punct(ch)
+
+    def expect_kw(self, word: str):
+        tok = self.next()
+        if not tok.is_kw(word):
+            raise SQLSyntaxError(f"Expected {word}, found '{tok.value}'.")
+
+    def expect_punct(self, ch: str):
+        tok = self.next()
+        if not tok.is_punct(ch):
+            raise SQLSyntaxError(f"Expected '{ch}', found '{tok.value}'.")
+
+    def at_query_start(self, offset: int = 0) -> bool:
+        """True if the tokens at offset begin a (possibly parenthesized) query."""
+        tok = self.peek(offset)
+        while tok is not None and tok.is_punct("("):
+            offset += 1
+            tok = self.peek(offset)
+        return tok is not None and tok.is_kw("SELECT", "WITH")
+
+    def at_set_operator(self) -> bool:
+        tok = self.peek()
+        if tok is None or not tok.is_kw(*SET_OPERATORS):
+            return False
+        # BigQuery: "SELECT * EXCEPT (col)" is not a set operation
+        follow = self.peek(1)
+        return tok.upper == "UNION" or (follow is not None and follow.is_kw("ALL", "DISTINCT"))
+
+    def at_expression_end(self, depth: int, stop_at_comma: bool, stop_words: set) -> bool:
+        tok = self.peek()
+        if tok is None or tok.is_punct(";"):
+            return True
+        if depth > 0:
+            return False
+        if tok.is_punct(")") or tok.is_punct("]"):
+            return True
+        if stop_at_comma and tok.is_punct(","):
+            return True
+        if tok.kind == "ident" and (tok.upper in CLAUSE_WORDS or tok.upper in stop_words):
+            return True
+        return self.at_set_operator()
+
+    # -- queries --
+
+    def parse_query(self, parent, ctes: dict) -> Query:
+        query = Query()
+        visible = dict(ctes)
+        if self.at_kw("WITH"):
+            self.next()
+            if self.at_kw("RECURSIVE"):
+                self.next()
+            while True:
+                name = identifier_name(self.next())
+                if self.at_punct("("):
+                    self.skip_parens()
+                self.expect_kw("AS")
+                self.expect_punct("(")
+                visible[name] = None       # visible to itself (recursive CTEs)
+                cte = self.parse_query(parent, visible)
+                self.expect_punct(")")
+                visible[name] = cte
+                query.ctes[name] = cte
+                if self.at_punct(","):
+                    self.next()
+                    continue
+                break
+
+        query.branches.append(self.parse_query_term(parent, visible))
+        while self.at_set_operator():
+            self.next()
+            if self.at_kw("ALL", "DISTINCT"):
+                self.next()
+            query.branches.append(self.parse_query_term(parent, visible))
+
+        if self.at_kw("ORDER"):
+            self.next()
+            self.expect_kw("BY")
+            query.order_by = self.parse_expression_list(query.scope or parent, visible)
+        if self.at_kw("LIMIT"):
+            self.next()
+            query.limit = self.parse_expression(parent, visible, stop_at_comma=True)
+            if self.at_punct(","):
+                self.next()
+                self.parse_expression(parent, visible)
+        if self.at_kw("OFFSET"):
+            self.next()
+            self.parse_expression(parent, visible)
+        return query
+
+    def parse_query_term(self, parent, ctes: dict):
+        if self.at_punct("("):
+            self.next()
+            query = self.parse_query(parent, ctes)
+            self.expect_punct(")")
+            return query
+        return self.parse_select(parent, ctes)
+
+    def parse_select(self, parent, ctes: dict) -> Select:
+        select = Select(parent)
+        self.expect_kw("SELECT")
+        if self.at_kw("DISTINCT", "ALL"):
+            self.next()
+        if self.at_kw("AS") and self.peek(1) is not None and self.peek(1).is_kw("STRUCT", "VALUE"):
+            self.next()
+            self.next()
+
+        select.items = self.parse_expression_list(select, ctes)
+        if self.at_kw("FROM"):
+            self.next()
+            self.parse_from(select, ctes)
+        if self.at_kw("WHERE"):
+            self.next()
+            select.where = self.parse_expression(select, ctes)
+        if self.at_kw("GROUP"):
+            self.next()
+            self.expect_kw("BY")
+            select.group_by = self.parse_expression_list(select, ctes)
+        if self.at_kw("HAVING"):
+            self.next()
+            select.having = self.parse_expression(select, ctes)
+        if self.at_kw("QUALIFY"):
+            self.next()
+            select.qualify = self.parse_expression(select, ctes)
+        if self.at_kw("WINDOW"):
+            self.next()
+            self.parse_expression_list(select, ctes)
+        return select
+
+    # -- FROM clause --
+
+    def parse_from(self, select: Select, ctes: dict):
+        while True:
+            self.parse_from_item(select, ctes)
+            if self.at_kw("ON"):
+                self.next()
+                select.join_conditions.append(
+                    self.parse_expression(select, ctes, stop_at_comma=True, stop_words=JOIN_WORDS)
+                )
+            elif self.at_kw("USING"):
+                self.next()
+                self.expect_punct("(")
+                select.other_exprs.append(self.parse_expression(select, ctes))
+                self.expect_punct(")")
+
+            if self.at_punct(","):
+                self.next()
+                continue
+            if self.at_kw(*JOIN_WORDS):
+                while not self.at_kw("JOIN"):
+                    if not self.at_kw(*JOIN_WORDS, "OUTER"):
+                        raise SQLSyntaxError(f"Expected JOIN, found '{self.peek().value if self.peek() else 'end of SQL'}'.")
+                    self.next()
+                self.next()
+                continue
+            break
+
+    def parse_from_item(self, select: Select, ctes: dict):
+        tok = self.peek()
+        if tok is None:
+            raise SQLSyntaxError("Expected a table after FROM/JOIN.")
+
+        if tok.is_punct("("):
+            if self.at_query_start(1):
+                self.next()
+                query = self.parse_query(select.parent, ctes)
+                self.expect_punct(")")
+                item = DerivedRef(query)
+            else:
+                # Parenthesized join: ( a JOIN b ON ... )
+                self.next()
+                self.parse_from(select, ctes)
+                self.expect_punct(")")
+                return
+        elif tok.is_kw("UNNEST"):
+            self.next()
+            self.expect_punct("(")
+            select.other_exprs.append(self.parse_expression(select, ctes))
+            self.expect_punct(")")
+            item = UnnestRef()
+        else:
+            if tok.is_kw("LATERAL"):
+                self.next()
+            start = self.peek()
+            path = self.parse_path()
+            name = path[-1].lower()
+            if len(path) == 1 and name in ctes:
+                item = DerivedRef(ctes[name], cte_name=name)
+            else:
+                item = TableRef(name, path)
+                item.path_span = (start.pos, self.tokens[self.i - 1].end)
+
+        if self.at_kw("FOR"):
+            # FOR SYSTEM_TIME AS OF <expr>
+            self.next()
+            self.next()
+            self.expect_kw("AS")
+            self.expect_kw("OF")
+            select.other_exprs.append(self.parse_expression(select, ctes, stop_at_comma=True, stop_words=JOIN_WORDS | {"ON", "USING", "AS", "TABLESAMPLE"}))
+        item.alias = self.parse_alias()
+        if item.alias:
+            item.alias_token = self.tokens[self.i - 1]
+        if self.at_kw("TABLESAMPLE"):
+            self.next()
+            self.next()
+            self.skip_parens()
+        if isinstance(item, UnnestRef) and self.at_kw("WITH"):
+            # UNNEST(...) AS x WITH OFFSET [AS] pos
+            self.next()
+            self.expect_kw("OFFSET")
+            offset_alias = self.parse_alias()
+            if offset_alias:
+                select.aliases[offset_alias] = UnnestRef(offset_alias)
+        select.add_from_item(item)
+
+    def parse_path(self) -> list:
+        """Table path: ident(.ident)*, backticked parts, or unquoted hyphenated project ids."""
+        parts = []
+        while True:
+            tok = self.next()
+            if tok.kind == "qident":
+                parts.extend(tok.value.strip("`").split("."))
+            elif tok.kind == "ident":
+                part = tok.value
+                # bigquery-public-data.dataset.table is legal without backticks
+                while self.peek() is not None and self.peek().value == "-" and self.peek().pos == tok.end:
+                    nxt = self.peek(1)
+                    if nxt is None or nxt.kind not in ("ident", "number") or nxt.pos != self.peek().end:
+                        break
+                    self.next()
+                    tok = self.next()
+                    part += "-" + tok.value
+                parts.append(part)
+            else:
+                raise SQLSyntaxError(f"Expected a table name, found '{tok.value}'.")
+            if self.at_punct("."):
+                self.next()
+                continue
+            return parts
+
+    def parse_alias(self):
+        if self.at_kw("AS"):
+            self.next()
+            return identifier_name(self.next())
+        tok = self.peek()
+        if tok is not None and (tok.kind == "qident" or (tok.kind == "ident" and tok.upper not in RESERVED)):
+            self.next()
+            return identifier_name(tok)
+        return None
+
+    # -- expressions --
+
+    def skip_parens(self):
+        self.expect_punct("(")
+        depth = 1
+        while depth:
+            tok = self.next()
+            if tok.is_punct("("):
+                depth += 1
+            elif tok.is_punct(")"):
+                depth -= 1
+
+    def parse_expression(self, scope, ctes: dict, stop_at_comma: bool = False, stop_words: set = frozenset()) -> list:
+        """
+        Collect tokens up to the end of the expression. Subqueries found inside
+        are parsed recursively and appear in the list as Query nodes.
+        """
+        expr = []
+        depth = 0
+        while not self.at_expression_end(depth, stop_at_comma, stop_words):
+            tok = self.peek()
+            if tok.is_punct("(") and self.at_query_start(1):
+                self.next()
+                expr.append(self.parse_query(scope, ctes))
+                self.expect_punct(")")
+                continue
+            self.next()
+            if tok.is_punct("(") or tok.is_punct("["):
+                depth += 1
+            elif tok.is_punct(")") or tok.is_punct("]"):
+                depth -= 1
+            expr.append(tok)
+        return expr
+
+    def parse_expression_list(self, scope, ctes: dict) -> list:
+        exprs = [self.parse_expression(scope, ctes, stop_at_comma=True)]
+        while self.at_punct(","):
+            self.next()
+            exprs.append(self.parse_expression(scope, ctes, stop_at_comma=True))
+        return exprs
+
+
+def parse_sql(sql: str) -> Query:
+    """Parse a single SELECT statement (optionally with WITH / set operations)."""
+    tokens = tokenize(sql)
+    _check_balanced(tokens)
+    parser = _Parser(tokens)
+    if not parser.at_query_start():
+        raise SQLSyntaxError("SQL does not start with SELECT or WITH.")
+    query = parser.parse_query(None, {})
+    while parser.at_punct(";"):
+        parser.next()
+    if parser.peek() is not None:
+        raise SQLSyntaxError(f"Unexpected '{parser.peek().value}' after the end of the query.")
+    return query
+
+
+def _check_balanced(tokens: list):
+    depth = 0
+    for tok in tokens:
+        if tok.is_punct("("):
+            depth += 1
+        elif tok.is_punct(")"):
+            depth -= 1
+            if depth < 0:
+                raise SQLSyntaxError("Unbalanced parentheses: unexpected ')'.")
+    if depth:
+        raise SQLSyntaxError("Unbalanced parentheses: missing ')'.")
+
+
+# --- Traversal helpers ---
+
+def iter_nodes(query: Query):
+    """Yield every Query and Select node: CTEs, set-operation branches, subqueries."""
+    stack = [query]
+    while stack:
+        node = stack.pop()
+        yield node
+        if isinstance(node, Query):
+            stack.extend(node.ctes.values())
+            stack.extend(node.branches)
+            for expr in node.order_by + ([node.limit] if node.limit else []):
+                stack.extend(x for x in expr if isinstance(x, Query))
+        else:
+            for item in node.from_items:
+                if isinstance(item, DerivedRef) and item.cte_name is None:
+                    stack.append(item.query)
+            for expr in node.expressions():
+                stack.extend(x for x in expr if isinstance(x, Query))
+
+
+def iter_selects(query: Query):
+    return (node for node in iter_nodes(query) if isinstance(node, Select))
+
+
+def iter_scoped_expressions(query: Query):
+    """Yield (scope, expression) for every expression, with the Select it resolves names in."""
+    for node in iter_nodes(query):
+        if isinstance(node, Select):
+            for expr in node.expressions():
+                yield node, expr
+        else:
+            for expr in node.order_by:
+                yield node.scope, expr
+
+
+def _table_alias_renames(query: Query, tokens: list) -> dict:
+    """
+    Token position -> placeholder for every table / subquery alias and the
+    qualifiers that refer to it, numbered by order of declaration ("" drops the
+    optional AS).
+    """
+    items = [
+        item for select in iter_selects(query) for item in select.from_items
+        if isinstance(item, (TableRef, DerivedRef)) and item.alias_token is not None
+    ]
+    index = {tok.pos: i for i, tok in enumerate(tokens)}
+    names = {}
+    renames = {}
+    for n, item in enumerate(sorted(items, key=lambda item: item.alias_token.pos), 1):
+        pos = item.alias_token.pos
+        names[id(item)] = renames[pos] = f"$T{n}"
+        i = index.get(pos, 0)
+        if i and tokens[i - 1].is_kw("AS"):
+            renames[tokens[i - 1].pos] = ""
+
+    for scope, expr in iter_scoped_expressions(query):
+        if scope is None:
+            continue
+        toks = expression_tokens(expr)
+        for i, tok in enumerate(toks[:-1]):
+            if tok.kind not in ("ident", "qident") or not toks[i + 1].is_punct("."):
+                continue
+            if i > 0 and toks[i - 1].is_punct("."):
+                continue
+            name = names.get(id(scope.resolve(identifier_name(tok))))
+            if name:
+                renames[tok.pos] = name
+    return renames
+
+
+def expression_tokens(expr: list) -> list:
+    """Tokens of an expression at this scope (nested subqueries excluded)."""
+    return [x for x in expr if isinstance(x, Token)]
+
+
+def qualified_refs(expr: list):
+    """
+    Yield (qualifier_token, column_token) for each `qualifier.column` reference.
+    Skips function calls like SAFE.DIVIDE(...) and the tail of longer paths.
+    """
+    toks = expression_tokens(expr)
+    n = len(toks)
+    for i in range(n - 2):
+        qual, dot, col = toks[i], toks[i + 1], toks[i + 2]
+        if qual.kind not in ("ident", "qident") or not dot.is_punct(".") or col.kind not in ("ident", "qident"):
+            continue
+        if i > 0 and toks[i - 1].is_punct("."):
+            continue
+        if i + 3 < n and toks[i + 3].is_punct("("):
+            continue
+        yield qual, col
+
+
+def strip_aggregates(expr: list) -> list:
+    """Drop aggregate calls and OVER (...) window specs from an expression."""
+    toks = expression_tokens(expr)
+    out = []
+    i = 0
+    n = len(toks)
+    while i < n:
+        tok = toks[i]
+        is_call = i + 1 < n and toks[i + 1].is_punct("(")
+        if (tok.kind == "ident" and tok.upper in AGGREGATE_FUNCTIONS and is_call) or tok.is_kw("OVER"):
+            i += 1
+            if i < n and toks[i].is_punct("("):
+                i = _skip_group(toks, i)
+            elif tok.is_kw("OVER") and i < n:
+                i += 1            # OVER named_window
+            continue
+        out.append(tok)
+        i += 1
+    return out
+
+
+def _skip_group(toks: list, i: int) -> int:
+    """Given toks[i] == '(', return the index after the matching ')'."""
+    depth = 0
+    while i < len(toks):
+        if toks[i].is_punct("("):
+            depth += 1
+        elif toks[i].is_punct(")"):
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def split_alias(expr: list):
+    """Split a SELECT item into (expression, alias)."""
+    alias = _alias_token(expr)
+    if alias is None:
+        return expr, None
+    return expr[:-2] if expr[-2].is_kw("AS") else expr[:-1], identifier_name(alias)
+
+
+def _alias_token(expr: list):
+    """The token naming a SELECT item (after AS, or an implicit alias), or None."""
+    if len(expr) >= 2 and isinstance(expr[-1], Token) and isinstance(expr[-2], Token):
+        last, prev = expr[-1], expr[-2]
+        if prev.is_kw("AS") and last.kind in ("ident", "qident"):
+            return last
+        if (last.kind == "qident" or (last.kind == "ident" and last.upper not in RESERVED)) \
+                and not prev.is_punct(".") and prev.kind != "op" and not prev.is_punct("(") \
+                and not prev.is_kw(*RESERVED - {"END"}):
+            return last
+    return None
+
+
+def normalize_expression(expr: list) -> str:
+    """Case- and whitespace-insensitive text of an expression, for equality checks."""
+    parts = []
+    for x in expr:
+        if isinstance(x, Token):
+            parts.append(x.value.lower() if x.kind in ("ident", "qident") else x.value)
+        else:
+            parts.append("(subquery)")
+    return " ".join(parts)
+
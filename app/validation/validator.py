@@ -1,9 +1,14 @@
 """
-validator.py - Validates generated SQL against the schema using regex and Python logic.
+validator.py - Validates generated SQL against the schema using a SQL tokenizer/AST.
 NO LLM used here. Pure rule-based validation.
 """
 import re
-from app.schemas.schema import VALID_TABLES, VALID_COLUMNS
+from app.schemas.schema_index import get_schema_index
+from app.validation.sql_parser import (
+    SQLSyntaxError, TableRef, parse_sql, tokenize, iter_selects, iter_scoped_expressions,
+    qualified_refs, strip_aggregates, split_alias, normalize_expression, expression_tokens,
+    identifier_name,
+)
 
 # SQL keywords and functions that look like table aliases but aren't
 SQL_KEYWORDS = {
@@ -48,57 +53,80 @@ class ValidationResult:
         return status
 
 
-def _extract_tables_from_sql(sql: str):
-    """
-    Extract table names and aliases from FROM and JOIN clauses.
-    Returns (set of real table names, dict of alias -> real table name).
-    """
-    sql = re.sub(
-            r'`[^`]*\.([a-zA-Z_][a-zA-Z0-9_]*)`',
-            r'\1',
-            sql
-    )
-    sql_no_parens = re.sub(r'\([^)]*\)', ' ', sql)
-    pattern = r'\b(?:FROM|JOIN)\s+([a-zA-Z_][a-zA-Z0-9_]*)(?:\s+(?:AS\s+)?([a-zA-Z_][a-zA-Z0-9_]*))?'
-    matches = re.findall(pattern, sql_no_parens, re.IGNORECASE)
-
-    tables = set()
-    alias_map = {}
-
-    for table_name, alias in matches:
-        table_lower = table_name.lower()
-        if table_lower in SQL_KEYWORDS:
-            continue
-        tables.add(table_lower)
-        if alias and alias.lower() not in SQL_KEYWORDS:
-            alias_map[alias.lower()] = table_lower
-
-    return tables, alias_map
-
-
-def _extract_column_references(sql: str, alias_map: dict):
-    """
-    Extract table.column references from SQL.
-    Resolves aliases to real table names.
-    Skips SQL function keywords.
-    """
-    pattern = r'\b([a-zA-Z_][a-zA-Z0-9_]*)\.([a-zA-Z_][a-zA-Z0-9_]*)\b'
-    matches = re.findall(pattern, sql)
+def _resolve_table(scope, qualifier: str) -> str:
+    """Real table name for a qualifier (alias, table name or CTE/subquery alias)."""
+    item = scope.resolve(qualifier) if scope is not None else None
+    if isinstance(item, TableRef):
+        return item.name
+    return qualifier
 
-    resolved = []
-    for tbl_or_alias, col in matches:
-        tbl_lower = tbl_or_alias.lower()
-        col_lower = col.lower()
 
+def _check_column_ref(scope, qual, col, index, errors: list):
+    """Validate one qualifier.column reference against the schema."""
+    qualifier = identifier_name(qual)
+    column = identifier_name(col)
+    item = scope.resolve(qualifier) if scope is not None else None
+    if item is None:
         # Skip SQL keywords that look like table references
-        if tbl_lower in SQL_KEYWORDS:
+        if qualifier in SQL_KEYWORDS:
+            return
+        real_table = qualifier
+    elif isinstance(item, TableRef):
+        real_table = item.name
+    else:
+        # Subquery, CTE or UNNEST alias — its columns are not schema columns
+        return
+
+    if real_table not in index.valid_tables:
+        errors.append(f"Unknown table '{real_table}' in column reference '{real_table}.{column}'.")
+    elif column not in index.valid_columns[real_table]:
+        errors.append(f"Column '{column}' does not exist in table '{real_table}'.")
+
+
+def _check_group_by(select, errors: list):
+    """Every non-aggregated column in SELECT must be covered by GROUP BY."""
+    for qual, col in missing_group_by(select):
+        errors.append(
+            f"Column '{qual.value}.{col.value}' in SELECT must appear in GROUP BY or inside an aggregate function."
+        )
+
+
+def missing_group_by(select) -> list:
+    """(qualifier, column) tokens of SELECT columns that are neither grouped nor aggregated."""
+    group_by = select.group_by
+    first = expression_tokens(group_by[0]) if group_by else []
+    if first and first[0].is_kw("ALL"):
+        return []
+
+    grouped_refs = set()
+    grouped_names = set()
+    grouped_positions = set()
+    grouped_exprs = set()
+    for expr in group_by:
+        toks = expression_tokens(expr)
+        grouped_exprs.add(normalize_expression(expr))
+        if len(toks) == 1 and toks[0].kind == "number" and toks[0].value.isdigit():
+            grouped_positions.add(int(toks[0].value))
+        for qual, col in qualified_refs(expr):
+            grouped_refs.add((_resolve_table(select, identifier_name(qual)), identifier_name(col)))
+        grouped_names.update(identifier_name(t) for t in toks if t.kind in ("ident", "qident"))
+
+    missing = []
+    for position, item in enumerate(select.items, start=1):
+        expr, alias = split_alias(item)
+        if position in grouped_positions or normalize_expression(expr) in grouped_exprs:
             continue
-
-        # Resolve alias to real table name
-        real_table = alias_map.get(tbl_lower, tbl_lower)
-        resolved.append((real_table, col_lower))
-
-    return resolved
+        if alias and alias in grouped_names:
+            continue
+        for qual, col in qualified_refs(strip_aggregates(expr)):
+            qualifier = identifier_name(qual)
+            column = identifier_name(col)
+            if qualifier in SQL_KEYWORDS and select.resolve(qualifier) is None:
+                continue
+            if (_resolve_table(select, qualifier), column) in grouped_refs or column in grouped_names:
+                continue
+            missing.append((qual, col))
+    return missing
 
 
 def validate_sql(sql: str, intent: dict) -> ValidationResult:
@@ -106,28 +134,45 @@ def validate_sql(sql: str, intent: dict) -> ValidationResult:
     Validate the generated SQL query against the schema.
     Checks:
       1. All tables referenced exist in schema
-      2. All table.column references are valid
+      2. All table.column references are valid (aliases resolved per scope)
       3. Tables in intent are actually used in query
       4. Basic SQL structure
       5. GROUP BY completeness
+    The SQL is tokenized and parsed once; every check walks the same AST.
     """
     errors = []
+    index = get_schema_index()
     sql_clean = sql.strip().rstrip(";")
 
-    # --- Step 1: Extract tables and aliases ---
-    tables_used, alias_map = _extract_tables_from_sql(sql_clean)
+    try:
+        query = parse_sql(sql_clean)
+    except SQLSyntaxError as e:
+        tokens = tokenize(sql_clean)
+        if not any(t.is_kw("SELECT") for t in tokens):
+            errors.append("SQL does not contain a SELECT statement.")
+        else:
+            errors.append(f"SQL could not be parsed: {e}")
+        if not any(t.is_kw("FROM") for t in tokens):
+            errors.append("SQL does not contain a FROM clause.")
+        return ValidationResult(is_valid=False, errors=errors)
+
+    selects = list(iter_selects(query))
+
+    # --- Step 1: Tables exist ---
+    tables_used = []
+    for select in selects:
+        for item in select.from_items:
+            if isinstance(item, TableRef) and item.name not in tables_used:
+                tables_used.append(item.name)
 
     for tbl in tables_used:
-        if tbl not in VALID_TABLES:
+        if tbl not in index.valid_tables:
             errors.append(f"Table '{tbl}' does not exist in schema.")
 
     # --- Step 2: Validate table.column references ---
-    col_refs = _extract_column_references(sql_clean, alias_map)
-    for tbl, col in col_refs:
-        if tbl not in VALID_TABLES:
-            errors.append(f"Unknown table '{tbl}' in column reference '{tbl}.{col}'.")
-        elif col not in VALID_COLUMNS.get(tbl, set()):
-            errors.append(f"Column '{col}' does not exist in table '{tbl}'.")
+    for scope, expr in iter_scoped_expressions(query):
+        for qual, col in qualified_refs(expr):
+            _check_column_ref(scope, qual, col, index, errors)
 
     # --- Step 3: Check intent tables are present ---
     intent_tables = set(t.lower() for t in intent.get("target_tables", []))
@@ -136,48 +181,39 @@ def validate_sql(sql: str, intent: dict) -> ValidationResult:
             errors.append(f"Intent specified table '{tbl}' but it is missing from the SQL.")
 
     # --- Step 4: Basic SQL structure check ---
-    if not re.search(r'\bSELECT\b', sql_clean, re.IGNORECASE):
-        errors.append("SQL does not contain a SELECT statement.")
-    if not re.search(r'\bFROM\b', sql_clean, re.IGNORECASE):
+    if not any(select.from_items for select in selects):
         errors.append("SQL does not contain a FROM clause.")
 
     # --- Step 5: GROUP BY completeness check ---
-    select_match = re.search(r'SELECT\s+(.*?)\s+FROM', sql_clean, re.IGNORECASE | re.DOTALL)
-    if select_match:
-        select_part = select_match.group(1)
-        groupby_match = re.search(r'GROUP\s+BY\s+(.*?)(?:ORDER|LIMIT|HAVING|$)', sql_clean, re.IGNORECASE | re.DOTALL)
-        if groupby_match:
-            groupby_cols = groupby_match.group(1).strip()
-            # Remove aggregate functions from SELECT before checking
-            select_no_agg = re.sub(
-                r'\b(COUNT|SUM|AVG|MAX|MIN)\s*\(.*?\)', '', select_part, flags=re.IGNORECASE
-            )
-            select_cols = re.findall(r'\b([a-zA-Z_]+)\.([a-zA-Z_]+)\b', select_no_agg)
-            groupby_col_refs = re.findall(r'\b([a-zA-Z_]+)\.([a-zA-Z_]+)\b', groupby_cols)
-            groupby_plain = re.findall(r'\b([a-zA-Z_]+)\b', groupby_cols)
-
-            for tbl, col in select_cols:
-                if tbl.lower() in SQL_KEYWORDS:
-                    continue
-                # Resolve alias for comparison
-                real_tbl = alias_map.get(tbl.lower(), tbl.lower())
-                real_grp = [(alias_map.get(t.lower(), t.lower()), c.lower()) for t, c in groupby_col_refs]
-                in_groupby = (real_tbl, col.lower()) in real_grp or col.lower() in groupby_plain
-                if not in_groupby:
-                    errors.append(
-                        f"Column '{tbl}.{col}' in SELECT must appear in GROUP BY or inside an aggregate function."
-                    )
+    for select in selects:
+        if select.group_by is not None:
+            _check_group_by(select, errors)
 
+    errors = list(dict.fromkeys(errors))
     return ValidationResult(is_valid=len(errors) == 0, errors=errors)
 
 
 def build_retry_hint(validation_result: ValidationResult, intent: dict) -> str:
-    """Build a hint string to feed back to LLM when validation fails."""
+    """
+    Build a hint string to feed back to LLM when validation fails.
+    Only the intent's tables and tables named in the errors get their columns
+    listed; the whole schema is listed when none of them is known.
+    """
+    index = get_schema_index()
     hint_lines = ["The previously generated SQL failed validation. Please fix these issues:"]
     for err in validation_result.errors:
         hint_lines.append(f"  - {err}")
+
+    named = set(re.findall(r"'([^'.]+)'", " ".join(validation_result.errors)))
+    tables = sorted(
+        t for t in {*(str(t).lower() for t in intent.get("target_tables") or []), *named}
+        if t in index.valid_tables
+    )
+    if not tables:
+        hint_lines.append(index.retry_hint_schema)
+        return "\n".join(hint_lines)
     hint_lines.append("\nOnly use tables and columns that exist in the provided schema.")
-    hint_lines.append(f"Valid tables: {', '.join(sorted(VALID_TABLES))}")
-    for tbl in VALID_TABLES:
-        hint_lines.append(f"  {tbl}: {', '.join(sorted(VALID_COLUMNS[tbl]))}")
-    return "\n".join(hint_lines)
\ No newline at end of file
+    hint_lines.append(f"Valid tables: {index.table_list_text}")
+    for table in tables:
+        hint_lines.append(f"  {table}: {', '.join(sorted(index.valid_columns[table]))}")
+    return "\n".join(hint_lines)
@@ -0,0 +1,97 @@
+"""
+local_engine.py - Local SQL engine (SQLite, or DuckDB when installed) loaded with
+synthetic data, standing in for BigQuery during benchmarks.
+"""
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from app.schemas.schema import TABLES
+from benchmarks.synthetic_data import generate_rows, table_sizes
+
+try:
+    import duckdb
+except ImportError:   # duckdb is optional; SQLite ships with Python
+    duckdb = None
+
+ENGINES = ("sqlite", "duckdb")
+
+SQLITE_TYPES = {"INT": "INTEGER", "DECIMAL": "REAL", "FLOAT": "REAL"}
+DUCKDB_TYPES = {"INT": "BIGINT", "DECIMAL": "DOUBLE", "FLOAT": "DOUBLE"}
+
+# `project.dataset.table` → table
+_QUALIFIED_TABLE_RE = re.compile(r"`(?:[\w-]+\.)*(\w+)`")
+
+
+def to_local_sql(sql: str) -> str:
+    """Strip BigQuery dataset paths so the query runs against the local tables."""
+    return _QUALIFIED_TABLE_RE.sub(r"\1", sql)
+
+
+class LocalEngine:
+    """Thread-safe query runner over a freshly generated database."""
+
+    def __init__(self, engine: str = "sqlite", scale: float = 1.0, seed: int = 0):
+        if engine not in ENGINES:
+            raise ValueError(f"engine must be one of {', '.join(ENGINES)}")
+        if engine == "duckdb" and duckdb is None:
+            raise RuntimeError("engine 'duckdb' requires the duckdb package (pip install duckdb).")
+        self.engine = engine
+        self.seed = seed
+        self.sizes = table_sizes(scale)
+        self._local = threading.local()
+        if engine == "sqlite":
+            fd, self.path = tempfile.mkstemp(suffix=".sqlite3", prefix="nl2sql_bench_")
+            os.close(fd)
+            self._load(sqlite3.connect(self.path), SQLITE_TYPES)
+        else:
+            self.path = None
+            self._duck = duckdb.connect(":memory:")
+            self._load(self._duck, DUCKDB_TYPES)
+
+    def _load(self, conn, type_map: dict):
+        """Create every schema table and fill it with synthetic rows."""
+        for table, info in TABLES.items():
+            columns = info["columns"]
+            ddl = ", ".join(f"{col} {type_map.get(meta['type'], meta['type'])}" for col, meta in columns.items())
+            conn.execute(f"CREATE TABLE {table} ({ddl})")
+            marks = ", ".join(["?"] * len(columns))
+            conn.executemany(f"INSERT INTO {table} VALUES ({marks})", list(generate_rows(table, self.sizes, self.seed)))
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.engine == "sqlite":
+                conn = sqlite3.connect(self.path)
+            else:
+                conn = self._duck.cursor()
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql: str) -> dict:
+        """Run SQL and return the same result dict shape as execute_query / execute_bigquery."""
+        try:
+            cursor = self._connection().execute(to_local_sql(sql))
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return {
+                "success": True,
+                "columns": columns,
+                "rows": rows,
+                "row_count": len(rows),
+                "error": None
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "columns": [],
+                "rows": [],
+                "row_count": 0,
+                "error": str(e)
+            }
+
+    def close(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
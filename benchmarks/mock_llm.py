@@ -0,0 +1,100 @@
+"""
+mock_llm.py - Deterministic stand-in for Groq that replays recorded responses.
+Install with app.llm.gemini_client.set_llm_transport(MockLLM(...)).
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+
+FIXTURES_PATH = "benchmarks/fixtures/recorded_responses.json"
+
+_QUESTION_RE = re.compile(r"=== (?:USER|ORIGINAL) QUESTION ===\n(.*?)\n", re.S)
+_RETRY_MARKER = "=== PREVIOUS ATTEMPT FAILED ==="
+_TRAILER = "This query reads the requested table, applies the filters and orders the result. "
+_CHUNK_CHARS = 16       # streamed per delta (~4 tokens)
+
+
+def load_fixtures(path: str = FIXTURES_PATH) -> list:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["cases"]
+
+
+class MockLLM:
+    """
+    Answers intent, SQL and combined prompts from recorded cases, matched on the
+    question embedded in the prompt. Each call sleeps latency_ms ± jitter_ms,
+    drawn from a seeded RNG so runs are repeatable, plus token_ms per generated
+    token (~4 characters). trailer_tokens of explanation follow every answer,
+    as chatty models write them; streamed calls can stop reading before them.
+    """
+
+    def __init__(self, cases: list, latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 0,
+                 token_ms: float = 0.0, trailer_tokens: int = 0):
+        self.cases = {case["question"]: case for case in cases}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.trailer = (_TRAILER * (trailer_tokens * 4 // len(_TRAILER) + 1))[:trailer_tokens * 4]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _delay(self) -> float:
+        with self._lock:
+            self.calls += 1
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(self.latency_ms + jitter, 0.0) / 1000
+
+    def respond(self, prompt: str) -> str:
+        match = _QUESTION_RE.search(prompt)
+        case = self.cases.get(match.group(1).strip()) if match else None
+        if case is None:
+            raise KeyError(f"No recorded response for prompt question: {match.group(1) if match else '?'}")
+
+        if '"sql": "..." or null' in prompt:            # combined prompt
+            return json.dumps({"intent": case["intent"], "sql": case["sql"]})
+        if "=== INTENT JSON ===" in prompt:              # SQL generation prompt
+            if _RETRY_MARKER not in prompt and case.get("sql_first_attempt"):
+                return case["sql_first_attempt"]
+            return case["sql"] or ""
+        return json.dumps(case["intent"])                # intent extraction prompt
+
+    def _answer(self, prompt: str) -> str:
+        text = self.respond(prompt)
+        if not self.trailer:
+            return text
+        if text and not text.startswith("{"):
+            text += ";"         # a statement followed by prose is terminated
+        return f"{text}\n\n{self.trailer}"
+
+    def _generation_time(self, text: str) -> float:
+        return len(text) / 4 * self.token_ms / 1000
+
+    def complete(self, prompt: str) -> str:
+        text = self._answer(prompt)
+        time.sleep(self._delay() + self._generation_time(text))
+        return text
+
+    async def acomplete(self, prompt: str) -> str:
+        text = self._answer(prompt)
+        await asyncio.sleep(self._delay() + self._generation_time(text))
+        return text
+
+    def stream(self, prompt: str):
+        text = self._answer(prompt)
+        time.sleep(self._delay())
+        for i in range(0, len(text), _CHUNK_CHARS):
+            chunk = text[i:i + _CHUNK_CHARS]
+            time.sleep(self._generation_time(chunk))
+            yield chunk
+
+    async def astream(self, prompt: str):
+        text = self._answer(prompt)
+        await asyncio.sleep(self._delay())
+        for i in range(0, len(text), _CHUNK_CHARS):
+            chunk = text[i:i + _CHUNK_CHARS]
+            await asyncio.sleep(self._generation_time(chunk))
+            yield chunk
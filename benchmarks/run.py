@@ -0,0 +1,266 @@
+"""
+run.py - Offline throughput / latency benchmark for the NL2SQL pipeline.
+Groq is replaced by MockLLM (recorded responses, configurable latency) and
+BigQuery by a local SQLite/DuckDB database filled with synthetic data.
+
+Run from the repository root:
+    python -m benchmarks.run --requests 500 --concurrency 32 --llm-latency-ms 300
+    python -m benchmarks.run --json bench.json                  # save a report
+    python -m benchmarks.run --baseline bench.json              # fail on regressions
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:   # not available on Windows
+    resource = None
+
+STAGES = ("schema", "intent", "sql", "validation", "pipeline", "execute", "total")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the NL2SQL pipeline offline.")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests run first")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mode", default=None, help="two_stage | combined (default: PIPELINE_MODE)")
+    parser.add_argument("--llm-latency-ms", type=float, default=250.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--llm-token-ms", type=float, default=0.0, help="mock generation time per output token")
+    parser.add_argument("--llm-trailer-tokens", type=int, default=0,
+                        help="tokens of explanation the mock writes after each answer")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream completions and stop at the end of the answer (LLM_STREAMING_ENABLED)")
+    parser.add_argument("--engine", default="sqlite", help="sqlite | duckdb")
+    parser.add_argument("--scale", type=float, default=1.0, help="synthetic data size multiplier")
+    parser.add_argument("--fixtures", default="benchmarks/fixtures/recorded_responses.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--with-cache", action="store_true",
+                        help="keep the question cache and single-flight coalescing enabled")
+    parser.add_argument("--no-fast-path", action="store_true", help="send every question through the LLM stages")
+    parser.add_argument("--no-compiler", action="store_true", help="generate SQL with the LLM instead of compiling the intent")
+    parser.add_argument("--candidates", type=int, default=None, help="parallel SQL candidates per LLM round (SQL_CANDIDATES)")
+    parser.add_argument("--hedge-ms", type=float, default=None,
+                        help="hedge LLM calls still unanswered after this many ms (LLM_HEDGE_MODEL, fixed delay)")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own log output")
+    parser.add_argument("--trace-memory", action="store_true", help="report Python heap peak (slower)")
+    parser.add_argument("--json", dest="json_path", help="write the report to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json report")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed relative p95 / throughput regression vs the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="ignore p95 increases smaller than this (sub-millisecond stages are noisy)")
+    return parser.parse_args(argv)
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(-(-pct * len(sorted_values) // 100)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def _run_one(question: str, mode, engine, samples: dict, outcomes: dict):
+    from app.services.NL2sql import process_question_async
+
+    started = time.perf_counter()
+    marks = []
+    result = await process_question_async(
+        question, on_event=lambda event, data: marks.append((event, time.perf_counter())), mode=mode
+    )
+    pipeline_done = time.perf_counter()
+
+    previous = started
+    for event, at in marks:
+        samples[event].append(at - previous)
+        previous = at
+    samples["pipeline"].append(pipeline_done - started)
+
+    if not (result["success"] and result["sql"]):
+        outcomes["irrelevant" if result["intent"] and not result["intent"].get("is_relevant") else "failed"] += 1
+        samples["total"].append(pipeline_done - started)
+        return
+
+    db_result = await asyncio.to_thread(engine.execute, result["sql"])
+    finished = time.perf_counter()
+    samples["execute"].append(finished - pipeline_done)
+    samples["total"].append(finished - started)
+    outcomes["ok" if db_result["success"] else "execute_error"] += 1
+    if result["attempts"] > 1:
+        outcomes["retried"] += 1
+
+
+async def _drive(questions: list, count: int, concurrency: int, mode, engine, samples, outcomes):
+    queue = asyncio.Queue()
+    for i in range(count):
+        queue.put_nowait(questions[i % len(questions)])
+
+    async def worker():
+        while not queue.empty():
+            question = queue.get_nowait()
+            await _run_one(question, mode, engine, samples, outcomes)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def _summarize(samples: dict) -> dict:
+    stages = {}
+    for stage in STAGES:
+        values = sorted(samples.get(stage, []))
+        if not values:
+            continue
+        stages[stage] = {
+            "count": len(values),
+            "p50_ms": round(1000 * percentile(values, 50), 2),
+            "p95_ms": round(1000 * percentile(values, 95), 2),
+            "p99_ms": round(1000 * percentile(values, 99), 2),
+            "max_ms": round(1000 * values[-1], 2),
+        }
+    return stages
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def print_report(report: dict):
+    print("\n" + "=" * 72)
+    print(f" NL2SQL benchmark — mode={report['config']['mode']}  engine={report['config']['engine']}  "
+          f"concurrency={report['config']['concurrency']}  llm={report['config']['llm_latency_ms']}ms")
+    print("=" * 72)
+    print(f" {'stage':<12}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}{'max ms':>12}")
+    for stage, s in report["stages"].items():
+        print(f" {stage:<12}{s['count']:>8}{s['p50_ms']:>12}{s['p95_ms']:>12}{s['p99_ms']:>12}{s['max_ms']:>12}")
+    print("-" * 72)
+    print(f" requests: {report['requests']}   wall: {report['wall_seconds']}s   "
+          f"throughput: {report['requests_per_second']} req/s")
+    print(f" outcomes: {report['outcomes']}   llm calls: {report['llm_calls']}")
+    memory = report["memory"]
+    print(f" memory: max RSS {memory['max_rss_mb']} MB"
+          + (f", Python heap peak {memory['heap_peak_mb']} MB" if memory.get("heap_peak_mb") is not None else ""))
+    print("=" * 72)
+
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float, min_delta_ms: float = 1.0) -> list:
+    """Human-readable regressions (empty list = within tolerance)."""
+    problems = []
+    for stage, current in report["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before or current["p95_ms"] - before["p95_ms"] < min_delta_ms:
+            continue
+        if current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            problems.append(f"{stage} p95 {before['p95_ms']}ms → {current['p95_ms']}ms")
+    before_rps = baseline.get("requests_per_second", 0)
+    if before_rps and report["requests_per_second"] < before_rps * (1 - tolerance):
+        problems.append(f"throughput {before_rps} → {report['requests_per_second']} req/s")
+    return problems
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    # Settings are read from the environment when app modules are first imported
+    if not args.with_cache:
+        # The fixture questions repeat, so both would hide the pipeline's own cost
+        os.environ["QUESTION_CACHE_ENABLED"] = "false"
+        os.environ["SINGLE_FLIGHT_ENABLED"] = "false"
+    # Dry runs need BigQuery; the local engine has nothing to estimate against
+    os.environ["COST_GATE_ENABLED"] = "false"
+    if args.no_fast_path:
+        os.environ["FAST_PATH_ENABLED"] = "false"
+    if args.no_compiler:
+        os.environ["SQL_COMPILER_ENABLED"] = "false"
+    if args.candidates is not None:
+        os.environ["SQL_CANDIDATES"] = str(args.candidates)
+    if args.hedge_ms is not None:
+        # The mock answers every model; a fixed deadline keeps runs comparable
+        os.environ["LLM_HEDGE_MODEL"] = "benchmark-hedge"
+        os.environ["LLM_HEDGE_MIN_DELAY_SECONDS"] = os.environ["LLM_HEDGE_DEFAULT_DELAY_SECONDS"] = str(args.hedge_ms / 1000)
+        os.environ["LLM_HEDGE_MIN_SAMPLES"] = str(10 ** 9)
+    if args.stream:
+        os.environ["LLM_STREAMING_ENABLED"] = "true"
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+    from app.llm.gemini_client import set_llm_transport
+    from app.configuration.config import PIPELINE_MODE
+    from benchmarks.mock_llm import MockLLM, load_fixtures
+    from benchmarks.local_engine import LocalEngine
+
+    cases = load_fixtures(args.fixtures)
+    questions = [case["question"] for case in cases]
+    llm = MockLLM(cases, args.llm_latency_ms, args.llm_jitter_ms, args.seed,
+                  args.llm_token_ms, args.llm_trailer_tokens)
+    set_llm_transport(llm)
+
+    print(f" Loading synthetic data into {args.engine} (scale {args.scale})...")
+    engine = LocalEngine(args.engine, args.scale, args.seed)
+    try:
+        # The pipeline logs every stage with print(); keep it out of the measurements
+        with open(os.devnull, "w") as devnull:
+            with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull):
+                asyncio.run(_drive(questions, args.warmup, args.concurrency, args.mode, engine,
+                                   defaultdict(list), defaultdict(int)))
+
+                samples, outcomes = defaultdict(list), defaultdict(int)
+                calls_before = llm.calls
+                if args.trace_memory:
+                    tracemalloc.start()
+                started = time.perf_counter()
+                asyncio.run(_drive(questions, args.requests, args.concurrency, args.mode, engine, samples, outcomes))
+                wall = time.perf_counter() - started
+                heap_peak = None
+                if args.trace_memory:
+                    heap_peak = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+                    tracemalloc.stop()
+    finally:
+        set_llm_transport(None)
+        engine.close()
+
+    report = {
+        "config": {
+            "mode": args.mode or PIPELINE_MODE, "engine": args.engine, "concurrency": args.concurrency,
+            "llm_latency_ms": args.llm_latency_ms, "llm_jitter_ms": args.llm_jitter_ms, "scale": args.scale,
+            "llm_token_ms": args.llm_token_ms, "llm_trailer_tokens": args.llm_trailer_tokens, "stream": args.stream,
+        },
+        "requests": args.requests,
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(args.requests / wall, 2) if wall else 0.0,
+        "outcomes": dict(outcomes),
+        "llm_calls": llm.calls - calls_before,
+        "stages": _summarize(samples),
+        "memory": {"max_rss_mb": _max_rss_mb(), "heap_peak_mb": heap_peak},
+    }
+    print_report(report)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f" Report written to {args.json_path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare_to_baseline(report, json.load(f), args.max_regression, args.min_delta_ms)
+        if problems:
+            print(" REGRESSIONS vs baseline:")
+            for problem in problems:
+                print(f"   - {problem}")
+            return 1
+        print(" Within tolerance of baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
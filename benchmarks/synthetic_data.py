@@ -0,0 +1,59 @@
+"""
+synthetic_data.py - thelook-shaped rows generated from app/schemas/schema.py.
+Primary keys are sequential, foreign keys point at existing rows, and a few
+well-known columns get realistic values so filters in the recorded SQL match.
+"""
+import datetime
+import random
+from app.schemas.schema import TABLES
+
+# Rows per table at scale 1.0; tables not listed get DEFAULT_ROWS
+BASE_ROWS = {"users": 2000, "products": 1000, "orders": 5000, "order_items": 12000}
+DEFAULT_ROWS = 1000
+
+KNOWN_VALUES = {
+    "status": ["Processing", "Complete", "Cancelled", "Returned", "Shipped"],
+    "gender": ["M", "F"],
+    "country": ["United States", "China", "Brasil", "South Korea", "France", "Spain", "Germany", "Japan"],
+    "city": ["New York", "Shanghai", "Sao Paulo", "Seoul", "Paris", "Madrid", "Berlin", "Tokyo"],
+    "category": ["Jeans", "Tops & Tees", "Sweaters", "Shorts", "Swim", "Outerwear & Coats", "Accessories"],
+    "brand": ["Allegra K", "Calvin Klein", "Carhartt", "Levi's", "Nike", "Columbia", "Hanes"],
+    "department": ["Men", "Women"],
+}
+
+_EPOCH = datetime.datetime(2022, 1, 1)
+_SPAN_SECONDS = 3 * 365 * 24 * 3600
+
+
+def table_sizes(scale: float) -> dict:
+    return {table: max(int(BASE_ROWS.get(table, DEFAULT_ROWS) * scale), 1) for table in TABLES}
+
+
+def _value(col: str, meta: dict, row_id: int, sizes: dict, rng: random.Random):
+    if meta.get("primary_key"):
+        return row_id
+    fk = meta.get("foreign_key")
+    if fk:
+        return rng.randint(1, sizes.get(fk.split(".", 1)[0], DEFAULT_ROWS))
+    if col in KNOWN_VALUES:
+        return rng.choice(KNOWN_VALUES[col])
+
+    col_type = meta["type"]
+    if col_type == "INT":
+        return rng.randint(18, 70) if col == "age" else rng.randint(1, 4)
+    if col_type == "DECIMAL":
+        return round(rng.uniform(1, 300), 2)
+    if col_type == "TIMESTAMP":
+        ts = _EPOCH + datetime.timedelta(seconds=rng.randrange(_SPAN_SECONDS))
+        return ts.strftime("%Y-%m-%d %H:%M:%S")
+    if col_type == "DATE":
+        return (_EPOCH + datetime.timedelta(days=rng.randrange(3 * 365))).isoformat()[:10]
+    return f"{col}_{row_id}"
+
+
+def generate_rows(table: str, sizes: dict, seed: int = 0):
+    """Yield one tuple per row, columns in schema order."""
+    rng = random.Random(f"{seed}:{table}")
+    columns = TABLES[table]["columns"]
+    for row_id in range(1, sizes[table] + 1):
+        yield tuple(_value(col, meta, row_id, sizes, rng) for col, meta in columns.items())
@@ -2,26 +2,17 @@
 bq_connection.py
 Connects to BigQuery and fetches all tables from thelook_ecommerce dataset.
 """
-from google.cloud import bigquery
-from google.oauth2 import service_account
-import os
-from dotenv import load_dotenv
+from app.bigquery_client import client_manager, PROJECT_ID
 
-load_dotenv()
-
-KEY_FILE   = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "bigquery-key.json")
-PROJECT_ID = os.getenv("BIGQUERY_PROJECT_ID", "")
 DATASET    = "bigquery-public-data.thelook_ecommerce"
 
 
 def get_bigquery_connection():
-    """Connect to BigQuery and return client."""
-    credentials = service_account.Credentials.from_service_account_file(
-        KEY_FILE,
-        scopes=["https://www.googleapis.com/auth/bigquery"]
-    )
-    client = bigquery.Client(credentials=credentials, project=PROJECT_ID)
-    print(f"Connected to BigQuery | Project: {PROJECT_ID}")
+    """Return the shared BigQuery client (credentials are loaded once per process)."""
+    first_use = not client_manager.stats()["connected"]
+    client = client_manager.get_client()
+    if first_use:
+        print(f"Connected to BigQuery | Project: {PROJECT_ID}")
     return client
 
 
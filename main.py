@@ -3,8 +3,11 @@ main.py - Entry point for the NL2SQL system.
 Run: python main.py
 """
 import json
+import logging
 from app.services.NL2sql import process_question
-from app.configuration.config import GROQ_API_KEY
+from app.configuration.config import GROQ_API_KEY, LOG_LEVEL
+
+logging.basicConfig(level=LOG_LEVEL, format="%(levelname)s %(name)s: %(message)s")
 
 
 def print_result(result: dict):
@@ -29,6 +32,9 @@ def print_result(result: dict):
 
     print(f"\nSTATUS: {result['message']}")
     print(f"   Attempts: {result['attempts']}")
+    if result.get("timings"):
+        stages = ", ".join(f"{stage} {ms}ms" for stage, ms in result["timings"]["stages_ms"].items())
+        print(f"   Timings: {result['timings']['total_ms']}ms total ({stages})")
     print("="*60)
 
 
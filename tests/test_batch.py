@@ -0,0 +1,101 @@
+"""
+test_batch.py - /ask/batch: deduplication, ordering, limits and NDJSON streaming.
+"""
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.endpoints import api
+
+
+@pytest.fixture
+def answered(monkeypatch):
+    """Stub _answer: one-letter questions finish last, so completion order differs from request order."""
+    calls = []
+
+    async def _answer(question, result_format, mode=None, page_size=None, on_event=None, bigquery_job_id=None):
+        calls.append(question)
+        await asyncio.sleep(0.05 if len(question.strip()) == 1 else 0)
+        if question == "boom":
+            raise RuntimeError("pipeline exploded")
+        return api.NL2SQLResponse(
+            question=question, intent=None, sql=f"-- {question}", validation=None, db_result=None,
+            success=True, message="", attempts=1,
+        )
+
+    monkeypatch.setattr(api, "_answer", _answer)
+    return calls
+
+
+client = TestClient(api.app)
+
+QUESTIONS = ["a", "orders by status", "A ", "users per country", "a"]
+
+
+def test_duplicates_are_answered_once_and_results_keep_request_order(answered):
+    response = client.post("/ask/batch", json={"questions": QUESTIONS})
+    assert response.status_code == 200
+    body = response.json()
+    assert sorted(answered) == ["a", "orders by status", "users per country"]
+    assert body["unique_questions"] == 3
+    assert [result["question"] for result in body["results"]] == QUESTIONS
+    assert [result["sql"] for result in body["results"]] == ["-- a", "-- orders by status", "-- a",
+                                                                "-- users per country", "-- a"]
+
+
+def test_stream_tags_each_line_with_its_index(answered):
+    response = client.post("/ask/batch?stream=true", json={"questions": QUESTIONS})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == [0, 1, 2, 3, 4]
+    assert all(line["question"] == QUESTIONS[line["index"]] for line in lines)
+    assert len(answered) == 3
+    # Lines arrive as questions finish, not in request order
+    assert sorted(line["index"] for line in lines[:2]) == [1, 3]
+    assert sorted(line["index"] for line in lines[2:]) == [0, 2, 4]
+
+
+def test_failed_question_does_not_fail_the_batch(answered):
+    body = client.post("/ask/batch", json={"questions": ["orders by status", "boom"]}).json()
+    assert [result["success"] for result in body["results"]] == [True, False]
+    assert body["results"][1]["message"] == "Pipeline failed: pipeline exploded"
+
+
+def test_empty_batch_is_rejected(answered):
+    response = client.post("/ask/batch", json={"questions": []})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "questions cannot be empty."
+
+
+def test_oversized_batch_is_rejected(answered, monkeypatch):
+    monkeypatch.setattr(api, "BATCH_MAX_QUESTIONS", 2)
+    response = client.post("/ask/batch", json={"questions": ["a", "b", "c"]})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "A batch holds at most 2 questions."
+    assert answered == []
+
+
+def test_blank_question_is_rejected(answered):
+    assert client.post("/ask/batch", json={"questions": ["a", "  "]}).status_code == 400
+
+
+def test_concurrency_is_bounded(answered, monkeypatch):
+    monkeypatch.setattr(api, "BATCH_CONCURRENCY", 2)
+    running, peak = 0, 0
+
+    async def _answer(question, *args, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return api.NL2SQLResponse(question=question, intent=None, sql=None, validation=None, db_result=None,
+                                  success=True, message="", attempts=1)
+
+    monkeypatch.setattr(api, "_answer", _answer)
+
+    async def main():
+        return [item async for item in api._answer_batch([f"q{i}" for i in range(6)], "rows")]
+
+    assert len(asyncio.run(main())) == 6
+    assert peak == 2
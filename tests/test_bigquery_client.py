@@ -0,0 +1,180 @@
+"""
+test_bigquery_client.py - BigQueryClientManager with mocked credentials, client and timers.
+"""
+import datetime
+import threading
+import pytest
+from app import bigquery_client
+from app.bigquery_client import BigQueryClientManager
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class FakeCredentials:
+    """Service-account credentials whose refresh() issues numbered one-hour tokens."""
+
+    issued = 0
+
+    def __init__(self):
+        self.token = None
+        self.expiry = None
+        self.fail = False
+
+    @property
+    def valid(self) -> bool:
+        return self.token is not None and self.expiry > _now()
+
+    def with_scopes(self, scopes):
+        copy = FakeCredentials()
+        copy.fail = self.fail
+        return copy
+
+    def refresh(self, request):
+        if self.fail:
+            raise RuntimeError("token endpoint down")
+        FakeCredentials.issued += 1
+        self.token = f"token-{FakeCredentials.issued}"
+        self.expiry = _now() + HOUR
+
+
+class FakeClient:
+    def __init__(self, credentials, project, _http):
+        self.credentials = credentials
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, credentials):
+        self.credentials = credentials
+
+    def mount(self, prefix, adapter):
+        pass
+
+
+class FakeTimer:
+    """Records its delay instead of starting a thread."""
+
+    def __init__(self, delay, function):
+        self.delay = delay
+        self.function = function
+        self.cancelled = False
+        self.daemon = False
+        FakeTimer.created.append(self)
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        self.cancelled = True
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    FakeTimer.created = []
+    loaded = []
+
+    def from_service_account_file(path, scopes):
+        loaded.append(path)
+        return FakeCredentials()
+
+    monkeypatch.setattr(bigquery_client.service_account.Credentials, "from_service_account_file",
+                        from_service_account_file)
+    monkeypatch.setattr(bigquery_client, "AuthorizedSession", FakeSession)
+    monkeypatch.setattr(bigquery_client.bigquery, "Client", FakeClient)
+    monkeypatch.setattr(bigquery_client, "Request", lambda: None)
+    monkeypatch.setattr(bigquery_client.threading, "Timer", FakeTimer)
+    manager = BigQueryClientManager("key.json", "project", pool_size=4, refresh_margin=300)
+    manager.loaded = loaded
+    return manager
+
+
+def test_client_is_built_once(manager):
+    clients = set()
+
+    def use():
+        for _ in range(50):
+            clients.add(id(manager.get_client()))
+
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(clients) == 1
+    assert manager.loaded == ["key.json"]
+    stats = manager.stats()
+    assert (stats["credential_loads"], stats["token_refreshes"], stats["acquisitions"]) == (1, 1, 200)
+
+
+def test_refresh_is_scheduled_before_expiry(manager):
+    manager.get_client()
+    timer = FakeTimer.created[-1]
+    assert 3600 - 300 - 5 < timer.delay <= 3600 - 300
+    assert timer.daemon
+
+
+def test_background_refresh_swaps_the_token_in_place(manager):
+    client = manager.get_client()
+    credentials = client.credentials
+    first = credentials.token
+    FakeTimer.created[-1].function()
+    assert credentials.token != first and credentials.valid
+    assert manager.get_client() is client
+    assert manager.stats()["token_refreshes"] == 2
+    assert len(FakeTimer.created) == 2 and FakeTimer.created[0].cancelled
+
+
+def test_invalid_token_is_refreshed_inline(manager):
+    client = manager.get_client()
+    client.credentials.expiry = _now() - HOUR        # e.g. the process was suspended past expiry
+    stale = client.credentials.token
+    assert manager.get_client() is client
+    assert client.credentials.token != stale and client.credentials.valid
+    assert manager.stats()["token_refreshes"] == 2
+
+
+def test_failed_background_refresh_retries_later(manager):
+    client = manager.get_client()
+    client.credentials.fail = True
+    FakeTimer.created[-1].function()
+    assert FakeTimer.created[-1].delay == 30.0
+    assert manager.stats()["token_refreshes"] == 1
+
+
+def test_close_cancels_the_refresh_and_drops_the_client(manager):
+    client = manager.get_client()
+    timer = FakeTimer.created[-1]
+    manager.close()
+    assert timer.cancelled and client.closed
+    assert manager.stats()["connected"] is False
+    assert manager.get_client() is not client
+    assert manager.stats()["credential_loads"] == 2
+
+
+def test_stale_refresh_does_not_touch_a_rebuilt_client(manager):
+    old = manager.get_client().credentials
+    manager.close()
+    rebuilt = manager.get_client()
+    token, timers = rebuilt.credentials.token, len(FakeTimer.created)
+
+    manager._refresh(old)                            # a refresh that started before close()
+    assert rebuilt.credentials.token == token
+    assert len(FakeTimer.created) == timers
+    assert manager.stats()["token_refreshes"] == 2   # the two builds only
+    assert manager._credentials is rebuilt.credentials
+
+
+def test_background_refresh_after_close_is_a_no_op(manager):
+    manager.get_client()
+    refresh = FakeTimer.created[-1].function
+    manager.close()
+    refresh()
+    assert manager.stats()["connected"] is False
+    assert manager.stats()["token_refreshes"] == 1
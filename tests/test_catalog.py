@@ -0,0 +1,178 @@
+"""
+test_catalog.py - Schema catalog: annotation fallbacks, incremental refresh and snapshots.
+"""
+import json
+import pytest
+from app.schemas import catalog as catalog_module
+from app.schemas.catalog import SchemaCatalog, annotate
+
+
+def _column(type_="STRING", description=None, primary_key=False, foreign_key=None):
+    return {"type": type_, "description": description, "primary_key": primary_key, "foreign_key": foreign_key}
+
+
+def _entry(columns: dict, description=None, partitioning=None, clustering=()):
+    return {"description": description, "columns": columns, "partitioning": partitioning,
+            "clustering": list(clustering)}
+
+
+class FakeSource:
+    name = "fake"
+    dataset = "project.dataset"
+
+    def __init__(self, tables: dict):
+        self.tables = tables               # table -> (version, entry)
+        self.described = []
+
+    def table_versions(self) -> dict:
+        return {table: version for table, (version, _) in self.tables.items()}
+
+    def describe(self, tables: list) -> dict:
+        self.described.append(list(tables))
+        return {table: self.tables[table][1] for table in tables}
+
+
+@pytest.fixture
+def swaps(monkeypatch):
+    """Record schema swaps instead of replacing the process-wide index."""
+    swapped = []
+    monkeypatch.setattr(catalog_module, "reload_schema_index", swapped.append)
+    return swapped
+
+
+def test_catalog_metadata_wins_over_annotations():
+    tables = annotate({"orders": _entry(
+        {"order_id": _column("INT64", "Order key", primary_key=True)}, description="Catalog orders",
+    )})
+    assert tables["orders"]["description"] == "Catalog orders"
+    assert tables["orders"]["columns"]["order_id"] == {
+        "type": "INT64", "description": "Order key", "primary_key": True, "foreign_key": None,
+    }
+
+
+def test_missing_metadata_falls_back_to_schema_py():
+    annotations = {"orders": {"description": "Hand-written orders", "columns": {
+        "order_id": {"description": "Hand-written key", "primary_key": True},
+        "user_id": {"description": "Buyer", "foreign_key": "users.id"},
+    }}}
+    tables = annotate({
+        "orders": _entry({"order_id": _column("INT64"), "user_id": _column("INT64")}),
+        "users": _entry({"id": _column("INT64")}),
+    }, annotations)
+    orders = tables["orders"]
+    assert orders["description"] == "Hand-written orders"
+    assert orders["columns"]["order_id"]["description"] == "Hand-written key"
+    assert orders["columns"]["order_id"]["primary_key"] is True
+    assert orders["columns"]["user_id"]["foreign_key"] == "users.id"
+
+
+def test_missing_annotations_fall_back_to_naming():
+    tables = annotate({
+        "order_items": _entry({"id": _column("INT64"), "order_id": _column("INT64"),
+                               "category_id": _column("INT64"), "unit_price": _column("FLOAT64")}),
+        "orders": _entry({"order_id": _column("INT64", primary_key=True)}),
+        "categories": _entry({"id": _column("INT64")}),
+    }, annotations={})
+    items = tables["order_items"]
+    assert items["description"] == "order items"
+    assert items["columns"]["unit_price"]["description"] == "unit price"
+    assert items["columns"]["id"]["primary_key"] is True
+    assert items["columns"]["order_id"]["foreign_key"] == "orders.order_id"
+    assert items["columns"]["category_id"]["foreign_key"] == "categories.id"
+    assert items["columns"]["unit_price"]["foreign_key"] is None
+
+
+def test_references_outside_the_catalog_are_dropped():
+    tables = annotate({"orders": _entry({"user_id": _column("INT64", foreign_key="users.id")})}, annotations={})
+    assert tables["orders"]["columns"]["user_id"]["foreign_key"] is None
+
+
+def test_partitioning_and_clustering_are_kept():
+    tables = annotate({"events": _entry({"created_at": _column("TIMESTAMP"), "kind": _column()},
+                                        partitioning="created_at", clustering=["kind"])}, annotations={})
+    assert tables["events"]["partitioned_by"] == "created_at"
+    assert tables["events"]["clustered_by"] == ["kind"]
+
+
+def _source():
+    return FakeSource({
+        "orders": (1, _entry({"order_id": _column("INT64"), "user_id": _column("INT64")})),
+        "users": (1, _entry({"id": _column("INT64"), "email": _column()})),
+    })
+
+
+def test_refresh_describes_only_changed_tables(tmp_path, swaps):
+    source = _source()
+    catalog = SchemaCatalog(source, str(tmp_path / "catalog.json"), refresh_seconds=0)
+    assert catalog.refresh() == {"changed": ["orders", "users"], "removed": []}
+    assert catalog.refresh() == {"changed": [], "removed": []}
+
+    source.tables["users"] = (2, _entry({"id": _column("INT64"), "email": _column(), "age": _column("INT64")}))
+    assert catalog.refresh() == {"changed": ["users"], "removed": []}
+    assert source.described == [["orders", "users"], ["users"]]
+    assert "age" in catalog.tables["users"]["columns"]
+    assert len(swaps) == 2
+    assert catalog.stats()["tables_described"] == 3
+
+
+def test_removed_tables_are_dropped(tmp_path, swaps):
+    source = _source()
+    catalog = SchemaCatalog(source, str(tmp_path / "catalog.json"), refresh_seconds=0)
+    catalog.refresh()
+    del source.tables["users"]
+    assert catalog.refresh() == {"changed": [], "removed": ["users"]}
+    assert list(catalog.tables) == ["orders"]
+
+
+def test_include_limits_the_tables(tmp_path, swaps):
+    source = _source()
+    catalog = SchemaCatalog(source, str(tmp_path / "catalog.json"), refresh_seconds=0, include=["users"])
+    assert catalog.refresh()["changed"] == ["users"]
+
+
+def test_failed_refresh_keeps_the_schema(tmp_path, swaps):
+    source = _source()
+    catalog = SchemaCatalog(source, str(tmp_path / "catalog.json"), refresh_seconds=0)
+    catalog.refresh()
+    source.table_versions = lambda: (_ for _ in ()).throw(RuntimeError("warehouse down"))
+    with pytest.raises(RuntimeError):
+        catalog.refresh()
+    assert sorted(catalog.tables) == ["orders", "users"]
+    assert catalog.stats()["last_error"] == "warehouse down"
+
+
+def test_snapshot_round_trip(tmp_path, swaps):
+    path = str(tmp_path / "nested" / "catalog.json")
+    SchemaCatalog(_source(), path, refresh_seconds=0).refresh()
+
+    source = _source()
+    restarted = SchemaCatalog(source, path, refresh_seconds=0)
+    assert restarted.load_snapshot()
+    assert sorted(restarted.tables) == ["orders", "users"]
+    assert restarted.versions == {"orders": 1, "users": 1}
+    # Unchanged versions: the first refresh after a restart describes nothing
+    assert restarted.refresh() == {"changed": [], "removed": []}
+    assert source.described == []
+
+
+def test_snapshot_of_another_source_is_ignored(tmp_path, swaps):
+    path = str(tmp_path / "catalog.json")
+    SchemaCatalog(_source(), path, refresh_seconds=0).refresh()
+    other = _source()
+    other.dataset = "other.dataset"
+    assert not SchemaCatalog(other, path, refresh_seconds=0).load_snapshot()
+
+
+def test_unreadable_snapshot_is_ignored(tmp_path, swaps):
+    path = tmp_path / "catalog.json"
+    path.write_text("{not json")
+    assert not SchemaCatalog(_source(), str(path), refresh_seconds=0).load_snapshot()
+    assert not SchemaCatalog(_source(), str(tmp_path / "missing.json"), refresh_seconds=0).load_snapshot()
+
+
+def test_snapshot_is_written_atomically(tmp_path, swaps):
+    path = tmp_path / "catalog.json"
+    SchemaCatalog(_source(), str(path), refresh_seconds=0).refresh()
+    snapshot = json.loads(path.read_text())
+    assert snapshot["key"] == {"source": "fake", "location": "project.dataset"}
+    assert [p.name for p in tmp_path.iterdir()] == ["catalog.json"]
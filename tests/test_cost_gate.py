@@ -0,0 +1,103 @@
+"""
+test_cost_gate.py - Dry-run cost gate decisions, rewrites and estimate caching.
+"""
+import pytest
+from app.cache.backends import MemoryCacheBackend
+from app.execution import cost_gate
+from app.execution.cost_gate import CostEstimator, build_cost_hint, check_cost
+
+ORDERS = "`bigquery-public-data.thelook_ecommerce.orders`"
+LIMIT = 1000
+GB = 1024 ** 3
+
+
+@pytest.fixture
+def dry_runs(monkeypatch):
+    """Stubbed dry run: SELECT * scans 5 GB, explicit columns 100 MB; every call is recorded."""
+    calls = []
+
+    def dry_run_bytes(sql):
+        calls.append(sql)
+        if "broken" in sql:
+            raise RuntimeError("dry run failed")
+        return 5 * GB if "*" in sql else 100 * 1024 ** 2
+
+    monkeypatch.setattr(cost_gate, "dry_run_bytes", dry_run_bytes)
+    monkeypatch.setattr(cost_gate, "estimator", CostEstimator(MemoryCacheBackend(100), ttl=60))
+    monkeypatch.setattr(cost_gate, "COST_GATE_MAX_BYTES", GB)
+    monkeypatch.setattr(cost_gate, "COST_GATE_ACTION", "rewrite")
+    monkeypatch.setattr(cost_gate, "COST_GATE_ROW_LIMIT", LIMIT)
+    return calls
+
+
+INTENT = {"selected_columns": {"orders": ["order_id", "status"]}}
+
+
+def test_under_the_limit_is_ok(dry_runs):
+    decision = check_cost(f"SELECT o.status FROM {ORDERS} o")
+    assert decision.action == "ok" and decision.allowed
+    assert decision.estimated_bytes == 100 * 1024 ** 2
+
+
+def test_select_star_is_rewritten_to_the_intent_columns(dry_runs):
+    decision = check_cost(f"SELECT * FROM {ORDERS} WHERE status = 'Complete'", INTENT)
+    assert decision.action == "rewritten" and decision.allowed
+    assert decision.sql == f"SELECT order_id, status FROM {ORDERS} WHERE status = 'Complete'\nLIMIT {LIMIT}"
+    assert decision.original_bytes == 5 * GB
+    assert decision.estimated_bytes == 100 * 1024 ** 2
+    assert decision.rewrites == ["replaced SELECT * with the intent's columns", f"added LIMIT {LIMIT}"]
+
+
+def test_qualified_star_keeps_its_alias(dry_runs):
+    decision = check_cost(f"SELECT o.* FROM {ORDERS} o LIMIT 5", INTENT)
+    assert decision.sql == f"SELECT o.order_id, o.status FROM {ORDERS} o LIMIT 5"
+    assert decision.rewrites == ["replaced SELECT * with the intent's columns"]
+
+
+def test_over_the_limit_without_a_rewrite_is_rejected(dry_runs):
+    decision = check_cost(f"SELECT * FROM {ORDERS}", {})
+    assert decision.action == "rejected" and not decision.allowed
+    assert decision.sql == f"SELECT * FROM {ORDERS}"
+
+
+def test_reject_action_never_rewrites(dry_runs, monkeypatch):
+    monkeypatch.setattr(cost_gate, "COST_GATE_ACTION", "reject")
+    assert check_cost(f"SELECT * FROM {ORDERS}", INTENT).action == "rejected"
+
+
+def test_rewrite_still_over_the_limit_is_rejected(dry_runs, monkeypatch):
+    monkeypatch.setattr(cost_gate, "COST_GATE_MAX_BYTES", 1024)
+    decision = check_cost(f"SELECT * FROM {ORDERS}", INTENT)
+    assert decision.action == "rejected"
+    assert decision.sql == f"SELECT * FROM {ORDERS}"
+
+
+def test_failed_dry_run_is_unknown_and_allowed(dry_runs):
+    decision = check_cost(f"SELECT o.broken FROM {ORDERS} o")
+    assert decision.action == "unknown" and decision.allowed
+    assert decision.estimated_bytes is None
+
+
+def test_estimates_are_cached_per_canonical_sql(dry_runs):
+    check_cost(f"SELECT o.status FROM {ORDERS} o")
+    check_cost(f"select   o.status\nfrom {ORDERS} o;")
+    check_cost(f"SELECT x.status FROM {ORDERS} x")
+    assert len(dry_runs) == 1
+    assert cost_gate.estimator.stats() == {"entries": 1, "dry_runs": 1, "cache_hits": 2}
+
+
+def test_failed_dry_runs_are_not_cached(dry_runs):
+    check_cost(f"SELECT o.broken FROM {ORDERS} o")
+    check_cost(f"SELECT o.broken FROM {ORDERS} o")
+    assert len(dry_runs) == 2
+
+
+def test_bare_table_names_are_qualified_before_the_dry_run(dry_runs):
+    check_cost("SELECT status FROM orders WHERE status = 'Complete'")
+    assert dry_runs == [f"SELECT status FROM {ORDERS} WHERE status = 'Complete'"]
+
+
+def test_cost_hint_names_the_estimate_and_the_limit(dry_runs):
+    hint = build_cost_hint(check_cost(f"SELECT * FROM {ORDERS}", {}))
+    assert "5.0 GB, above the 1.0 GB limit" in hint
+    assert "Never use SELECT *" in hint
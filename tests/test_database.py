@@ -0,0 +1,158 @@
+"""
+test_database.py - Server-side cursor reads: streamed batches and open page cursors.
+"""
+from collections import namedtuple
+import pytest
+from app.execution import database
+from app.execution.pagination import decode_page_token
+
+Column = namedtuple("Column", "name")
+
+ROWS = [(i, f"name{i}") for i in range(5)]
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.position = 0
+        self.itersize = None
+        self.closed = False
+
+    def execute(self, sql):
+        self.conn.executed.append(sql)
+        self.description = [Column("id"), Column("name")]
+
+    def scroll(self, offset):
+        self.conn.scrolled.append(offset)
+        self.position += offset
+
+    def fetchmany(self, size):
+        self.conn.fetches.append(size)
+        rows = ROWS[self.position:self.position + size]
+        self.position += len(rows)
+        return rows
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self):
+        self.executed, self.scrolled, self.fetches = [], [], []
+
+    def cursor(self, name=None):
+        assert name, "results are read through named cursors"
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    def __init__(self):
+        self.conn = FakeConnection()
+        self.out = 0
+
+    def getconn(self):
+        self.out += 1
+        return self.conn
+
+    def putconn(self, conn, close=False):
+        self.out -= 1
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(database, "get_pool", lambda: pool)
+    monkeypatch.setattr(database, "_is_healthy", lambda conn: True)
+    monkeypatch.setattr(database, "_open_pages", database._OpenPages(max_open=2, idle_seconds=60))
+    return pool
+
+
+def _state(offset=0, **extra):
+    return {"engine": "postgres", "sql": "SELECT id, name FROM users", "format": "rows",
+            "page_size": 2, "offset": offset, **extra}
+
+
+def test_stream_query_reads_one_cursor_in_batches(pool):
+    pages = list(database.stream_query("SELECT id, name FROM users", batch_size=2))
+    assert [len(rows) for _, rows in pages] == [2, 2, 1]
+    assert pages[0] == (["id", "name"], [{"id": 0, "name": "name0"}, {"id": 1, "name": "name1"}])
+    assert pool.conn.executed == ["SELECT id, name FROM users"]
+    assert pool.out == 0
+
+
+def test_stream_query_reports_columns_of_an_empty_result(pool, monkeypatch):
+    monkeypatch.setattr(FakeCursor, "fetchmany", lambda self, size: [])
+    assert list(database.stream_query("SELECT id, name FROM users WHERE false")) == [(["id", "name"], [])]
+
+
+def test_closing_the_stream_early_returns_the_connection(pool):
+    pages = database.stream_query("SELECT id, name FROM users", batch_size=2)
+    next(pages)
+    assert pool.out == 1
+    pages.close()
+    assert pool.out == 0
+
+
+def test_execute_query_collects_the_batches(pool, monkeypatch):
+    monkeypatch.setattr(database, "DB_STREAM_BATCH_SIZE", 2)
+    result = database.execute_query("SELECT id, name FROM users")
+    assert result["success"] and result["row_count"] == 5
+    assert pool.conn.fetches == [2, 2, 2]
+
+
+def test_pages_in_order_continue_the_open_cursor(pool):
+    first = database.execute_query("SELECT id, name FROM users", page_size=2)
+    assert [row["id"] for row in first["rows"]] == [0, 1]
+    assert pool.out == 1                         # parked for the next page
+
+    second = database.fetch_postgres_page(decode_page_token(first["next_page_token"]))
+    third = database.fetch_postgres_page(decode_page_token(second["next_page_token"]))
+    assert [row["id"] for row in second["rows"]] == [2, 3]
+    assert [row["id"] for row in third["rows"]] == [4]
+    assert third["next_page_token"] is None
+    assert pool.conn.executed == ["SELECT id, name FROM users"]
+    assert pool.conn.scrolled == []
+    assert pool.out == 0 and len(database._open_pages) == 0
+
+
+def test_token_without_an_open_cursor_re_runs_and_skips(pool):
+    page = database.fetch_postgres_page(_state(offset=2, cursor="gone"))
+    assert [row["id"] for row in page["rows"]] == [2, 3]
+    assert pool.conn.scrolled == [2]
+
+
+def test_replayed_token_does_not_take_a_moved_cursor(pool):
+    first = database.execute_query("SELECT id, name FROM users", page_size=2)
+    token = decode_page_token(first["next_page_token"])
+    database.fetch_postgres_page(token)
+    again = database.fetch_postgres_page(token)  # cursor has moved past offset 2
+    assert [row["id"] for row in again["rows"]] == [2, 3]
+    assert len(pool.conn.executed) == 2
+
+
+def test_open_cursors_are_capped(pool):
+    for _ in range(3):
+        database.execute_query("SELECT id, name FROM users", page_size=2)
+    assert len(database._open_pages) == 2
+    assert pool.out == 2
+    database._open_pages.close_all()
+    assert pool.out == 0
+
+
+def test_idle_cursors_are_closed(pool):
+    database._open_pages.idle_seconds = -1
+    database.execute_query("SELECT id, name FROM users", page_size=2)
+    database._open_pages.claim("unknown", 0)
+    assert len(database._open_pages) == 0 and pool.out == 0
@@ -0,0 +1,55 @@
+"""
+test_fast_path.py - Questions the rule-based parser answers, and the ones it
+must hand to the LLM.
+"""
+import pytest
+from app.schemas.schema_index import get_schema_index
+from app.services.fast_path import parse_question
+
+
+@pytest.fixture(scope="module")
+def index():
+    return get_schema_index()
+
+
+def test_count_with_known_value(index):
+    intent, sql = parse_question("how many users from brazil", index)
+    assert intent["target_tables"] == ["users"]
+    assert "u.country = 'Brasil'" in sql
+    assert "COUNT(u.id)" in sql
+
+
+def test_group_by(index):
+    intent, sql = parse_question("count orders by status", index)
+    assert intent["group_by"] == [{"table": "orders", "column": "status"}]
+    assert "GROUP BY o.status" in sql
+
+
+def test_status_value_is_normalized(index):
+    _, sql = parse_question("orders where status is shipped", index)
+    assert "o.status = 'Shipped'" in sql
+
+
+@pytest.mark.parametrize("question", [
+    "list orders where created_at is yesterday",   # temporal column, not an ISO date
+    "orders where status is pending",              # not one of the known status values
+    "users where country is narnia",               # not one of the known countries
+    "users where age is old",                      # numeric column, no number
+    "top 10 products",                             # top by what?
+    "what is the meaning of life",
+])
+def test_not_understood_is_a_miss(index, question):
+    assert parse_question(question, index) is None
+
+
+def test_compile_error_is_a_miss(index, monkeypatch):
+    """A parse the compiler rejects falls back to the LLM instead of raising."""
+    from app.services import fast_path
+    from app.services.sql_compiler import CompileError
+
+    def reject(intent, index):
+        raise CompileError("Unsupported TIMESTAMP value 'yesterday'.")
+
+    monkeypatch.setattr(fast_path, "compile_intent", reject)
+    assert parse_question("count orders by status", index) is None
+    assert parse_question("list orders where created_at is yesterday", index) is None
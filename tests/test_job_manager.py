@@ -0,0 +1,81 @@
+"""
+test_job_manager.py - Background jobs and their event streams.
+"""
+import asyncio
+from app.cache.backends import MemoryCacheBackend
+from app.jobs.job_manager import JobManager
+
+
+def _manager():
+    return JobManager(MemoryCacheBackend(100), ttl=60, max_active=4, concurrency=2, poll_seconds=0.01)
+
+
+def test_event_published_during_replay_is_not_lost():
+    async def main():
+        manager = _manager()
+        replaying, resumed = asyncio.Event(), asyncio.Event()
+
+        async def runner(on_event, bigquery_job_id):
+            on_event("intent", {"n": 1})
+            on_event("sql", {"n": 2})
+            await replaying.wait()
+            on_event("validation", {"n": 3})     # while the subscriber is still replaying
+            await resumed.wait()
+            return {"success": True}
+
+        job = manager.submit({"question": "q"}, runner)
+        await asyncio.sleep(0.01)
+
+        received = []
+        async for event, data in manager.events(job["id"]):
+            received.append(event)
+            if event == "intent":
+                replaying.set()
+                await asyncio.sleep(0.01)
+            elif event == "validation":
+                resumed.set()
+        return received
+
+    received = asyncio.run(asyncio.wait_for(main(), timeout=5))
+    assert received == ["intent", "sql", "validation", "job"]
+
+
+def test_finish_during_replay_ends_the_stream():
+    async def main():
+        manager = _manager()
+        replaying = asyncio.Event()
+
+        async def runner(on_event, bigquery_job_id):
+            on_event("intent", {})
+            await replaying.wait()
+            return {"success": True}
+
+        job = manager.submit({"question": "q"}, runner)
+        await asyncio.sleep(0.01)
+
+        received = []
+        async for event, data in manager.events(job["id"]):
+            received.append((event, data))
+            if event == "intent":
+                replaying.set()
+                await asyncio.sleep(0.01)        # the job finishes before the replay ends
+        return received
+
+    received = asyncio.run(asyncio.wait_for(main(), timeout=5))
+    assert [event for event, _ in received] == ["intent", "job"]
+    assert received[-1][1]["status"] == "done"
+
+
+def test_finished_job_replays_from_the_store():
+    async def main():
+        manager = _manager()
+
+        async def runner(on_event, bigquery_job_id):
+            on_event("intent", {})
+            return {"success": True}
+
+        job = manager.submit({"question": "q"}, runner)
+        await asyncio.sleep(0.01)
+        return [event async for event, _ in manager.events(job["id"])]
+
+    assert asyncio.run(main()) == ["intent", "job"]
@@ -0,0 +1,155 @@
+"""
+test_metrics.py - Prometheus text rendering, stage timers, request timings and GET /metrics.
+"""
+import asyncio
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from app.endpoints import api
+from app.monitoring import metrics
+from app.monitoring.metrics import Counter, Histogram, current_timings, stage_timer, track_request
+
+
+def test_unlabelled_counter_renders_zero_before_use():
+    counter = Counter("demo_total", "Demo counter.")
+    assert counter.render() == ["# HELP demo_total Demo counter.", "# TYPE demo_total counter", "demo_total 0"]
+    counter.inc()
+    counter.inc(2.5)
+    assert counter.render()[-1] == "demo_total 3.5"
+
+
+def test_labelled_counter_renders_sorted_series_with_escaped_values():
+    counter = Counter("demo_total", "Demo counter.", ("stage", "kind"))
+    assert counter.render() == ["# HELP demo_total Demo counter.", "# TYPE demo_total counter"]
+    counter.inc(stage="sql", kind="prompt")
+    counter.inc(3, stage="intent", kind='say "hi"\n')
+    assert counter.value(stage="sql", kind="prompt") == 1
+    assert counter.value(stage="sql", kind="completion") == 0
+    assert counter.render()[2:] == [
+        'demo_total{stage="intent",kind="say \\"hi\\"\\n"} 3',
+        'demo_total{stage="sql",kind="prompt"} 1',
+    ]
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("demo_seconds", "Demo histogram.", ("stage",), buckets=(1.0, 0.1))
+    for value in (0.05, 0.1, 0.5, 7.0):
+        histogram.observe(value, stage="sql")
+    assert histogram.render() == [
+        "# HELP demo_seconds Demo histogram.",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{stage="sql",le="0.1"} 2',
+        'demo_seconds_bucket{stage="sql",le="1"} 3',
+        'demo_seconds_bucket{stage="sql",le="+Inf"} 4',
+        'demo_seconds_sum{stage="sql"} 7.65',
+        'demo_seconds_count{stage="sql"} 4',
+    ]
+
+
+def test_render_metrics_covers_the_registry():
+    text = metrics.render_metrics()
+    assert text.endswith("\n")
+    for metric in metrics.REGISTRY:
+        assert f"# TYPE {metric.name} " in text
+    assert "\nnl2sql_sql_retries_total " in text
+
+
+def _stage_count(stage: str) -> int:
+    series = metrics.STAGE_SECONDS._series.get((stage,))
+    return series[-1] if series else 0
+
+
+def test_stage_timer_records_the_stage_and_the_request():
+    before = _stage_count("test_stage")
+    with track_request() as timings:
+        with stage_timer("test_stage"):
+            pass
+        with stage_timer("test_stage"):
+            pass
+    assert _stage_count("test_stage") == before + 2
+    assert list(timings.stages) == ["test_stage"]
+    assert "test_stage" in timings.summary()["stages_ms"]
+
+
+def test_stage_timer_records_on_error():
+    before = _stage_count("test_failing_stage")
+    try:
+        with stage_timer("test_failing_stage"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert _stage_count("test_failing_stage") == before + 1
+
+
+def test_nested_track_request_shares_the_outer_timings():
+    assert current_timings() is None
+    with track_request() as outer:
+        with track_request() as inner:
+            assert inner is outer and current_timings() is outer
+    assert current_timings() is None
+
+
+def test_requests_do_not_share_timings():
+    async def request(stage):
+        with track_request() as timings:
+            with stage_timer(stage):
+                await asyncio.sleep(0.01)
+            return timings
+
+    async def main():
+        return await asyncio.gather(request("test_a"), request("test_b"))
+
+    first, second = asyncio.run(main())
+    assert list(first.stages) == ["test_a"] and list(second.stages) == ["test_b"]
+
+
+def test_llm_usage_is_attributed_to_the_current_stage():
+    calls = metrics.LLM_CALLS.value(stage="test_llm")
+    prompt = metrics.LLM_TOKENS.value(stage="test_llm", kind="prompt")
+    other = metrics.LLM_CALLS.value(stage="other")
+    with track_request() as timings:
+        with stage_timer("test_llm"):
+            metrics.record_llm_usage(SimpleNamespace(prompt_tokens=120, completion_tokens=30))
+        metrics.record_llm_usage(None)
+    assert metrics.LLM_CALLS.value(stage="test_llm") == calls + 1
+    assert metrics.LLM_TOKENS.value(stage="test_llm", kind="prompt") == prompt + 120
+    assert metrics.LLM_CALLS.value(stage="other") == other + 1
+    assert (timings.llm_calls, timings.prompt_tokens, timings.completion_tokens) == (2, 120, 30)
+
+
+def test_counters_update_outside_a_request():
+    retries = metrics.RETRIES.value()
+    misses = metrics.CACHE_LOOKUPS.value(cache="test", result="miss")
+    metrics.record_retry()
+    metrics.record_cache_lookup("test", "miss")
+    assert metrics.RETRIES.value() == retries + 1
+    assert metrics.CACHE_LOOKUPS.value(cache="test", result="miss") == misses + 1
+
+
+def test_cache_hits_and_retries_mark_the_request():
+    with track_request() as timings:
+        metrics.record_cache_lookup("test", "miss")
+        assert not timings.cache_hit
+        metrics.record_cache_lookup("test", "near_hit")
+        metrics.record_retry()
+    assert timings.cache_hit and timings.retries == 1
+
+
+def test_bigquery_job_stats_are_recorded():
+    processed = metrics.BQ_BYTES.value()
+    cached = metrics.BQ_JOBS.value(cache_hit="true")
+    job = SimpleNamespace(total_bytes_processed=2048, slot_millis=15, cache_hit=True)
+    with track_request() as timings:
+        metrics.record_bigquery_job(job)
+        metrics.record_bigquery_job(SimpleNamespace(total_bytes_processed=None, slot_millis=None, cache_hit=None))
+    assert metrics.BQ_BYTES.value() == processed + 2048
+    assert metrics.BQ_JOBS.value(cache_hit="true") == cached + 1
+    assert timings.summary()["bigquery"] == {"estimated_bytes": None, "bytes_processed": 2048, "slot_millis": 15}
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    metrics.record_retry()
+    response = TestClient(api.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE nl2sql_stage_duration_seconds histogram" in response.text
+    assert f"nl2sql_sql_retries_total {metrics.RETRIES.value():g}" in response.text.splitlines()
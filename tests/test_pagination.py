@@ -0,0 +1,35 @@
+"""
+test_pagination.py - Signed, expiring continuation tokens.
+"""
+import pytest
+from app.execution.pagination import (
+    ExpiredPageToken, InvalidPageToken, decode_page_token, encode_page_token, with_next_page,
+)
+
+STATE = {"engine": "bigquery", "table": "p.d.t", "format": "rows", "page_size": 2, "offset": 0}
+
+
+def test_round_trip():
+    assert decode_page_token(encode_page_token(STATE)) == STATE
+
+
+def test_tampered_token_is_rejected():
+    body, _, signature = encode_page_token(STATE).partition(".")
+    forged = encode_page_token({**STATE, "table": "other.d.t"}).partition(".")[0]
+    for token in (f"{forged}.{signature}", f"{body}.{signature[:-2]}xx", body, "", "not.a.token"):
+        with pytest.raises(InvalidPageToken):
+            decode_page_token(token)
+
+
+def test_expired_token():
+    with pytest.raises(ExpiredPageToken):
+        decode_page_token(encode_page_token(STATE, ttl=-1))
+
+
+def test_next_page_token_advances_the_offset():
+    page = {"success": True, "rows": [{"a": 1}, {"a": 2}], "row_count": 2}
+    result = with_next_page(page, STATE, has_more=True, total_rows=5)
+    assert result["total_rows"] == 5
+    assert decode_page_token(result["next_page_token"])["offset"] == 2
+    last = with_next_page({"success": True, "rows": [], "row_count": 0}, STATE, has_more=False)
+    assert last["next_page_token"] is None
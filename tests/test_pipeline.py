@@ -0,0 +1,150 @@
+"""
+test_pipeline.py - NL2sql pipeline against a stubbed LLM: two-stage and combined
+flows, the validation retry loop and the synchronous wrapper.
+"""
+import asyncio
+import json
+import pytest
+from app.llm.gemini_client import set_llm_transport
+from app.services import NL2sql
+
+ORDERS = "`bigquery-public-data.thelook_ecommerce.orders`"
+INTENT = {"is_relevant": True, "target_tables": ["orders"], "selected_columns": {"orders": ["status"]},
+          "query_intent_summary": "orders per status"}
+GOOD_SQL = f"SELECT o.status, COUNT(*) AS n FROM {ORDERS} o GROUP BY o.status"
+BAD_SQL = f"SELECT o.nope FROM {ORDERS} o"
+
+
+class FakeLLM:
+    """Answers each prompt kind from a queue of responses and records the prompts."""
+
+    def __init__(self, intent=INTENT, sql=(GOOD_SQL,), combined=()):
+        self.responses = {"intent": [json.dumps(intent)], "sql": list(sql), "combined": list(combined)}
+        self.prompts = []
+
+    @staticmethod
+    def kind(prompt: str) -> str:
+        if '"sql": "..." or null' in prompt:
+            return "combined"
+        if "=== INTENT JSON ===" in prompt:
+            return "sql"
+        return "intent"
+
+    def complete(self, prompt: str) -> str:
+        kind = self.kind(prompt)
+        self.prompts.append((kind, prompt))
+        queue = self.responses[kind]
+        return queue.pop(0) if len(queue) > 1 else queue[0]
+
+    async def acomplete(self, prompt: str) -> str:
+        return self.complete(prompt)
+
+    @property
+    def kinds(self) -> list:
+        return [kind for kind, _ in self.prompts]
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Install a FakeLLM with every LLM-free shortcut (fast path, compiler, caches, cost gate) off."""
+    for name, value in {
+        "FAST_PATH_ENABLED": False, "SQL_COMPILER_ENABLED": False, "COST_GATE_ENABLED": False,
+        "SINGLE_FLIGHT_ENABLED": False, "SQL_CANDIDATES": 1, "MAX_RETRIES": 3, "question_cache": None,
+    }.items():
+        monkeypatch.setattr(NL2sql, name, value)
+
+    def install(fake: FakeLLM) -> FakeLLM:
+        set_llm_transport(fake)
+        return fake
+
+    yield install
+    set_llm_transport(None)
+
+
+def _ask(question: str = "how many orders per status", mode: str = "two_stage") -> dict:
+    return asyncio.run(NL2sql.process_question_async(question, mode=mode))
+
+
+def test_two_stage_answers_with_two_calls(llm):
+    fake = llm(FakeLLM())
+    result = _ask()
+    assert result["success"] and result["sql"] == GOOD_SQL
+    assert result["intent"] == INTENT
+    assert (result["attempts"], result["llm_calls"]) == (1, 2)
+    assert fake.kinds == ["intent", "sql"]
+    assert result["validation"] == {"is_valid": True, "errors": []}
+
+
+def test_invalid_sql_is_retried_with_the_errors(llm):
+    fake = llm(FakeLLM(sql=(BAD_SQL, GOOD_SQL)))
+    result = _ask()
+    assert result["success"] and result["sql"] == GOOD_SQL
+    assert (result["attempts"], result["llm_calls"]) == (2, 3)
+    first, retry = [prompt for kind, prompt in fake.prompts if kind == "sql"]
+    assert "PREVIOUS ATTEMPT FAILED" not in first
+    assert "=== PREVIOUS ATTEMPT FAILED ===" in retry
+    assert "Column 'nope' does not exist in table 'orders'." in retry
+
+
+def test_retries_stop_after_max_retries(llm):
+    fake = llm(FakeLLM(sql=(BAD_SQL,)))
+    result = _ask()
+    assert not result["success"]
+    assert result["message"] == "SQL validation failed after 3 attempts."
+    assert fake.kinds == ["intent", "sql", "sql", "sql"]
+    assert result["validation"]["is_valid"] is False
+
+
+def test_irrelevant_question_stops_after_the_intent(llm):
+    fake = llm(FakeLLM(intent={"is_relevant": False, "irrelevance_reason": "Weather is not in the data."}))
+    result = _ask("will it rain tomorrow")
+    assert not result["success"] and result["sql"] is None
+    assert "Weather is not in the data." in result["message"]
+    assert fake.kinds == ["intent"]
+
+
+def test_combined_answers_with_one_call(llm):
+    fake = llm(FakeLLM(combined=(json.dumps({"intent": INTENT, "sql": GOOD_SQL}),)))
+    result = _ask(mode="combined")
+    assert result["success"] and result["sql"] == GOOD_SQL
+    assert (result["mode"], result["fallback"], result["llm_calls"]) == ("combined", False, 1)
+    assert fake.kinds == ["combined"]
+
+
+def test_combined_falls_back_to_two_stages_with_the_hint(llm):
+    fake = llm(FakeLLM(combined=(json.dumps({"intent": INTENT, "sql": BAD_SQL}),)))
+    result = _ask(mode="combined")
+    assert result["success"] and result["fallback"]
+    assert fake.kinds == ["combined", "intent", "sql"]
+    assert "Column 'nope' does not exist" in fake.prompts[-1][1]
+
+
+def test_unusable_combined_response_falls_back(llm):
+    fake = llm(FakeLLM(combined=("not json at all",)))
+    result = _ask(mode="combined")
+    assert result["success"] and result["fallback"]
+    assert fake.kinds == ["combined", "intent", "sql"]
+
+
+def test_events_follow_the_stages(llm):
+    llm(FakeLLM(sql=(BAD_SQL, GOOD_SQL)))
+    events = []
+    asyncio.run(NL2sql.process_question_async(
+        "how many orders per status", on_event=lambda event, data: events.append(event), mode="two_stage",
+    ))
+    assert events == ["schema", "intent", "sql", "validation", "sql", "validation"]
+
+
+def test_unknown_mode_is_rejected(llm):
+    llm(FakeLLM())
+    with pytest.raises(ValueError, match="Unknown pipeline mode"):
+        _ask(mode="three_stage")
+
+
+def test_sync_wrapper_runs_the_async_pipeline(llm):
+    fake = llm(FakeLLM())
+    result = NL2sql.process_question("how many orders per status", mode="two_stage")
+    assert result["success"] and result["sql"] == GOOD_SQL
+    assert fake.kinds == ["intent", "sql"]
+    assert result["timings"]["llm_calls"] == 2
+    assert {"intent_extraction", "sql_generation"} <= set(result["timings"]["stages_ms"])
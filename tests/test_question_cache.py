@@ -0,0 +1,49 @@
+"""
+test_question_cache.py - Exact and near-duplicate hits, and that the
+near-duplicate index follows the backend's evictions and expiry.
+"""
+import time
+from app.cache.backends import MemoryCacheBackend
+from app.cache.question_cache import QuestionCache
+
+
+def _result(sql: str) -> dict:
+    return {"success": True, "sql": sql, "question": None}
+
+
+def test_exact_and_near_duplicate_hits():
+    cache = QuestionCache(MemoryCacheBackend(10), ttl=60, similarity=0.6)
+    cache.put("How many orders were shipped?", _result("SELECT 1"))
+    assert cache.get("how many orders were shipped")["sql"] == "SELECT 1"
+    assert cache.get("show me how many orders shipped")["sql"] == "SELECT 1"
+    assert cache.stats()["near_duplicate_hits"] == 1
+
+
+def test_numbers_must_match():
+    cache = QuestionCache(MemoryCacheBackend(10), ttl=60, similarity=0.5)
+    cache.put("top 5 products by price", _result("SELECT 5"))
+    assert cache.get("top 10 products by price") is None
+
+
+def test_failed_results_are_not_stored():
+    cache = QuestionCache(MemoryCacheBackend(10), ttl=60)
+    cache.put("how many users", {"success": False})
+    assert cache.get("how many users") is None
+
+
+def test_index_is_capped_at_backend_size():
+    cache = QuestionCache(MemoryCacheBackend(3), ttl=60, similarity=0.6)
+    for n in range(20):
+        cache.put(f"orders of customer number {n}", _result(f"SELECT {n}"))
+    assert len(cache.backend) == 3
+    assert cache.stats()["indexed_questions"] == 3
+    assert sum(len(keys) for keys in cache._postings.values()) <= 3 * 5
+
+
+def test_evicted_and_expired_entries_leave_the_index():
+    cache = QuestionCache(MemoryCacheBackend(10), ttl=0.05, similarity=0.6)
+    cache.put("how many orders were shipped", _result("SELECT 1"))
+    time.sleep(0.1)
+    assert cache.get("show me how many orders shipped") is None
+    assert cache.stats()["indexed_questions"] == 0
+    assert cache._postings == {}
@@ -0,0 +1,37 @@
+"""
+test_repair.py - Mechanical fixes repair_sql applies, and what it leaves alone.
+"""
+from app.validation.repair import repair_sql
+
+ORDERS = "`bigquery-public-data.thelook_ecommerce.orders`"
+
+
+def test_bare_table_name_gets_full_path():
+    sql, fixes = repair_sql("SELECT status, COUNT(*) FROM orders GROUP BY status")
+    assert sql == f"SELECT status, COUNT(*) FROM {ORDERS} GROUP BY status"
+    assert len(fixes) == 1
+
+
+def test_known_value_case():
+    sql, _ = repair_sql(f"SELECT o.status FROM {ORDERS} o WHERE o.status = 'complete'")
+    assert sql.endswith("o.status = 'Complete'")
+
+
+def test_missing_group_by_column():
+    sql, _ = repair_sql(f"SELECT o.status, o.user_id, COUNT(*) AS n FROM {ORDERS} o GROUP BY o.status")
+    assert sql.endswith("GROUP BY o.status, o.user_id")
+
+
+def test_unknown_qualifier():
+    sql, _ = repair_sql(f"SELECT u.status FROM {ORDERS} o")
+    assert sql == f"SELECT o.status FROM {ORDERS} o"
+
+
+def test_nothing_to_repair():
+    original = f"SELECT o.status FROM {ORDERS} o WHERE o.status = 'Complete';"
+    assert repair_sql(original) == (original, [])
+
+
+def test_unknown_table_and_unparsable_sql_are_left_alone():
+    assert repair_sql("SELECT 1 FROM nonsense") == ("SELECT 1 FROM nonsense", [])
+    assert repair_sql("SELECT FROM (") == ("SELECT FROM (", [])
@@ -0,0 +1,138 @@
+"""
+test_result_cache.py - Executed-result cache: keys, expiry, size bounds and stores.
+"""
+import pytest
+from app.cache import result_cache as result_cache_module
+from app.cache.result_cache import DiskResultStore, MemoryResultStore, ResultCache
+
+SQL = "SELECT o.status FROM orders o"
+DATASET = "project.dataset"
+
+
+def _result(rows: int = 2, **extra) -> dict:
+    return {"success": True, "columns": ["status"], "rows": [{"status": f"s{i}"} for i in range(rows)],
+            "row_count": rows, "error": None, **extra}
+
+
+@pytest.fixture(params=["memory", "disk"])
+def store(request, tmp_path):
+    if request.param == "disk":
+        return DiskResultStore(str(tmp_path / "results.db"), max_bytes=1 << 20)
+    return MemoryResultStore(max_bytes=1 << 20)
+
+
+def test_round_trip(store):
+    cache = ResultCache(store, ttl=60, max_entry_bytes=1 << 20, compress=True)
+    cache.put(SQL, DATASET, "rows", _result())
+    assert cache.get(SQL, DATASET) == _result()
+    assert cache.stats()["compressed"] is True
+
+
+def test_uncompressed_payloads_are_json(store):
+    cache = ResultCache(store, ttl=60, max_entry_bytes=1 << 20, compress=False)
+    cache.put(SQL, DATASET, "rows", _result())
+    key = cache._key(SQL, DATASET, "rows")
+    assert store.get(key).startswith(b'{"success":true')
+    assert cache.get(SQL, DATASET) == _result()
+
+
+def test_compression_shrinks_the_stored_payload(store):
+    big = _result(rows=200)
+    ResultCache(store, ttl=60, max_entry_bytes=1 << 20, compress=False).put(SQL, "plain", "rows", big)
+    compressed = ResultCache(store, ttl=60, max_entry_bytes=1 << 20, compress=True)
+    compressed.put(SQL, "packed", "rows", big)
+    plain_size = len(store.get(compressed._key(SQL, "plain", "rows")))
+    assert len(store.get(compressed._key(SQL, "packed", "rows"))) < plain_size / 4
+    assert compressed.get(SQL, "packed") == big
+
+
+def test_canonically_equal_sql_shares_an_entry(store):
+    cache = ResultCache(store, ttl=60, max_entry_bytes=1 << 20)
+    cache.put(SQL, DATASET, "rows", _result())
+    assert cache.get("select  x.status\nFROM orders AS x;", DATASET) == _result()
+
+
+def test_keys_differ_by_dataset_format_and_page_size(store):
+    cache = ResultCache(store, ttl=60, max_entry_bytes=1 << 20)
+    cache.put(SQL, DATASET, "rows", _result())
+    assert cache.get(SQL, "other.dataset") is None
+    assert cache.get(SQL, DATASET, "columnar") is None
+    assert cache.get(SQL, DATASET, "rows", page_size=100) is None
+
+    cache.put(SQL, DATASET, "rows", _result(rows=1), page_size=1)
+    assert cache.get(SQL, DATASET, "rows", page_size=1)["row_count"] == 1
+    assert cache.get(SQL, DATASET)["row_count"] == 2
+
+
+def test_entries_expire(store):
+    cache = ResultCache(store, ttl=60, max_entry_bytes=1 << 20)
+    cache.put(SQL, DATASET, "rows", _result(), ttl=-1)
+    assert cache.get(SQL, DATASET) is None
+
+
+def test_first_page_expires_with_its_continuation_token(store, monkeypatch):
+    monkeypatch.setattr(result_cache_module, "RESULT_TOKEN_TTL_SECONDS", -1)
+    cache = ResultCache(store, ttl=60, max_entry_bytes=1 << 20)
+    cache.put(SQL, DATASET, "rows", _result(next_page_token="token"), page_size=2)
+    cache.put(SQL, DATASET, "rows", _result(next_page_token=None), page_size=5)
+    assert cache.get(SQL, DATASET, page_size=2) is None
+    assert cache.get(SQL, DATASET, page_size=5) is not None
+
+
+def test_failed_results_are_not_cached(store):
+    cache = ResultCache(store, ttl=60, max_entry_bytes=1 << 20)
+    cache.put(SQL, DATASET, "rows", {"success": False, "error": "boom"})
+    assert cache.get(SQL, DATASET) is None
+
+    calls = []
+
+    def executor(sql, result_format):
+        calls.append(sql)
+        return {"success": False, "error": "boom"}
+
+    cache.execute(executor, SQL, DATASET)
+    cache.execute(executor, SQL, DATASET)
+    assert len(calls) == 2
+
+
+def test_oversized_entries_are_skipped(store):
+    cache = ResultCache(store, ttl=60, max_entry_bytes=64, compress=False)
+    cache.put(SQL, DATASET, "rows", _result(rows=50))
+    assert cache.get(SQL, DATASET) is None
+    assert cache.stats()["skipped_too_large"] == 1
+
+
+def test_least_recently_used_entries_are_evicted_by_size(store):
+    cache = ResultCache(store, ttl=60, max_entry_bytes=1 << 20, compress=False)
+    size = len(result_cache_module.json.dumps(_result(), separators=(",", ":")))
+    store.max_bytes = size * 2
+    cache.put("SELECT 1", DATASET, "rows", _result())
+    cache.put("SELECT 2", DATASET, "rows", _result())
+    assert cache.get("SELECT 1", DATASET) is not None        # now the most recently used
+    cache.put("SELECT 3", DATASET, "rows", _result())
+    assert cache.get("SELECT 2", DATASET) is None
+    assert cache.get("SELECT 1", DATASET) is not None
+    assert cache.get("SELECT 3", DATASET) is not None
+    assert store.total_bytes <= store.max_bytes
+
+
+def test_execute_serves_hits_and_passes_page_size(store):
+    cache = ResultCache(store, ttl=60, max_entry_bytes=1 << 20)
+    calls = []
+
+    def executor(sql, result_format, page_size=None):
+        calls.append(page_size)
+        return _result(rows=page_size or 3)
+
+    assert cache.execute(executor, SQL, DATASET, "rows", 2) == (_result(rows=2), False)
+    assert cache.execute(executor, SQL, DATASET, "rows", 2) == (_result(rows=2), True)
+    assert cache.execute(executor, SQL, DATASET) == (_result(rows=3), False)
+    assert calls == [2, None]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_disk_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "results.db")
+    ResultCache(DiskResultStore(path, 1 << 20), ttl=60, max_entry_bytes=1 << 20).put(SQL, DATASET, "rows", _result())
+    reopened = ResultCache(DiskResultStore(path, 1 << 20), ttl=60, max_entry_bytes=1 << 20)
+    assert reopened.get(SQL, DATASET) == _result()
@@ -0,0 +1,151 @@
+"""
+test_router.py - Per-stage routing, hedged calls and fallback between providers.
+"""
+import asyncio
+import pytest
+from app.llm import providers
+from app.llm.providers import Completion
+from app.llm.router import LLMRouter
+
+
+class FakeProvider:
+    """Answers "<model>" after delays[model] seconds, or raises failures[model]."""
+
+    def __init__(self, delays: dict = None, failures: dict = None):
+        self.delays = delays or {}
+        self.failures = failures or {}
+        self.calls = []
+        self.cancelled = []
+
+    def complete(self, model, prompt, temperature):
+        self.calls.append(model)
+        if model in self.failures:
+            raise self.failures[model]
+        return Completion(model, None)
+
+    async def acomplete(self, model, prompt, temperature):
+        self.calls.append(model)
+        try:
+            await asyncio.sleep(self.delays.get(model, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        if model in self.failures:
+            raise self.failures[model]
+        return Completion(model, None)
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    monkeypatch.setattr(providers, "_providers", dict(providers._providers))
+    provider = FakeProvider()
+    providers.register_provider("fake", provider)
+    return provider
+
+
+def _router(**options) -> LLMRouter:
+    options = {"min_delay": 0.05, "default_delay": 0.05, "min_samples": 1, **options}
+    return LLMRouter({"intent": "fake:small", "sql": "fake:large"}, default="fake:default", **options)
+
+
+def test_each_stage_uses_its_route(fake):
+    router = _router()
+    assert router.complete("p", stage="intent") == "small"
+    assert router.complete("p", stage="sql") == "large"
+    assert router.complete("p", stage="combined") == "default"
+    assert asyncio.run(router.acomplete("p", stage="sql")) == "large"
+    assert fake.calls == ["small", "large", "default", "large"]
+
+
+def test_routes_can_name_other_providers(fake):
+    other = FakeProvider()
+    providers.register_provider("other", other)
+    router = LLMRouter({"intent": "other:tiny"}, default="fake:default")
+    assert router.complete("p", stage="intent") == "tiny"
+    assert router.complete("p", stage="sql") == "default"
+    assert other.calls == ["tiny"] and fake.calls == ["default"]
+
+
+def test_unknown_provider_is_an_error(fake):
+    with pytest.raises(ValueError, match="Unknown LLM provider 'nope'"):
+        LLMRouter({}, default="nope:model").complete("p")
+
+
+def test_no_hedge_before_the_delay(fake):
+    router = _router(hedge="fake:backup")
+    assert asyncio.run(router.acomplete("p", stage="sql")) == "large"
+    assert fake.calls == ["large"]
+    assert router.hedged == 0
+
+
+def test_hedge_fires_after_the_delay_and_first_answer_wins(fake):
+    fake.delays = {"large": 1.0, "backup": 0.0}
+    router = _router(hedge="fake:backup")
+    assert asyncio.run(router.acomplete("p", stage="sql")) == "backup"
+    assert fake.calls == ["large", "backup"]
+    assert fake.cancelled == ["large"]                 # the slower request is cancelled
+    assert (router.hedged, router.hedge_wins) == (1, 1)
+
+
+def test_primary_can_still_win_after_hedging(fake):
+    fake.delays = {"large": 0.08, "backup": 1.0}
+    router = _router(hedge="fake:backup")
+    assert asyncio.run(router.acomplete("p", stage="sql")) == "large"
+    assert fake.cancelled == ["backup"]
+    assert (router.hedged, router.hedge_wins) == (1, 0)
+
+
+def test_hedge_delay_follows_observed_latency(fake):
+    router = _router(hedge="fake:backup", min_delay=0.01, default_delay=5.0, percentile=50)
+    assert router.hedge_delay("sql", "fake:large") == 5.0
+    for seconds in (0.2, 0.3, 0.4):
+        router.latency.observe(("sql", "fake:large"), seconds)
+    assert router.hedge_delay("sql", "fake:large") == 0.3
+
+
+def test_primary_failing_before_the_delay_falls_back_to_the_hedge(fake):
+    fake.failures = {"large": RuntimeError("primary down")}
+    router = _router(hedge="fake:backup", min_delay=5.0, default_delay=5.0)
+    assert asyncio.run(asyncio.wait_for(router.acomplete("p", stage="sql"), timeout=1)) == "backup"
+    assert fake.calls == ["large", "backup"]
+    assert (router.hedged, router.hedge_wins) == (1, 1)
+
+
+def test_primary_failing_after_hedging_leaves_the_hedge(fake):
+    fake.delays = {"large": 0.05, "backup": 0.1}
+    fake.failures = {"large": RuntimeError("primary down")}
+    router = _router(hedge="fake:backup", min_delay=0.01, default_delay=0.01)
+    assert asyncio.run(router.acomplete("p", stage="sql")) == "backup"
+    assert fake.calls == ["large", "backup"]
+
+
+def test_without_a_hedge_model_failures_propagate(fake):
+    fake.failures = {"large": RuntimeError("primary down")}
+    with pytest.raises(RuntimeError, match="primary down"):
+        asyncio.run(_router().acomplete("p", stage="sql"))
+
+
+def test_failed_hedge_waits_for_the_primary(fake):
+    fake.delays = {"large": 0.1, "backup": 0.0}
+    fake.failures = {"backup": RuntimeError("hedge down")}
+    router = _router(hedge="fake:backup", min_delay=0.01, default_delay=0.01)
+    assert asyncio.run(router.acomplete("p", stage="sql")) == "large"
+
+
+def test_both_failing_raises(fake):
+    fake.delays = {"large": 0.05}
+    fake.failures = {"large": RuntimeError("primary down"), "backup": RuntimeError("hedge down")}
+    router = _router(hedge="fake:backup", min_delay=0.01, default_delay=0.01)
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.acomplete("p", stage="sql"))
+
+
+def test_override_replaces_every_provider(fake):
+    router = _router()
+    stub = FakeProvider()
+    router.override = stub
+    assert router.complete("p", stage="intent") == "small"
+    assert stub.calls == ["small"] and fake.calls == []
@@ -0,0 +1,97 @@
+"""
+test_scheduler.py - Rate-limit budget, retries and slot accounting of the LLM scheduler.
+"""
+import asyncio
+import pytest
+from app.llm import scheduler
+from app.llm.scheduler import LLMScheduler, RateLimits, TokenBucket, llm_priority, PRIORITY_BATCH
+
+
+class Throttled(Exception):
+    status_code = 429
+
+    class response:
+        headers = {"retry-after-ms": "1"}
+
+
+class Completion:
+    usage = None
+
+
+def test_token_bucket_waits_for_budget():
+    bucket = TokenBucket(60)                 # one per second
+    bucket.take(60)
+    assert bucket.wait_time(1, bucket._updated) == pytest.approx(1.0)
+    assert TokenBucket(0).wait_time(10 ** 6, 0) == 0.0
+
+
+def test_throttled_call_is_retried_and_halves_the_limit(monkeypatch):
+    monkeypatch.setattr(scheduler, "_backoff", lambda attempt, retry_after: 0.0)
+    sched = LLMScheduler(RateLimits(0, 0), max_concurrency=8, min_concurrency=1)
+    attempts = []
+
+    async def send():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise Throttled()
+        return Completion()
+
+    assert isinstance(asyncio.run(sched.run(send, "prompt")), Completion)
+    assert len(attempts) == 2
+    assert sched.limit < 8
+    assert sched.in_flight == 0
+
+
+def test_non_retryable_error_is_raised():
+    sched = LLMScheduler(RateLimits(0, 0), 4, 1)
+
+    async def send():
+        raise KeyError("bad request")
+
+    with pytest.raises(KeyError):
+        asyncio.run(sched.run(send, "prompt"))
+    assert sched.in_flight == 0
+
+
+def test_cancelled_call_releases_its_slot():
+    sched = LLMScheduler(RateLimits(0, 0), 1, 1)
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def fast():
+        return Completion()
+
+    async def main():
+        task = asyncio.ensure_future(sched.run(slow, "p"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return await asyncio.wait_for(sched.run(fast, "p"), 1)
+
+    assert isinstance(asyncio.run(main()), Completion)
+    assert sched.in_flight == 0
+
+
+def test_interactive_calls_are_served_before_batch():
+    sched = LLMScheduler(RateLimits(0, 0), 1, 1)
+    order = []
+
+    def sender(name):
+        async def send():
+            order.append(name)
+            await asyncio.sleep(0.001)
+            return Completion()
+        return send
+
+    async def main():
+        first = asyncio.ensure_future(sched.run(sender("first"), "p"))
+        await asyncio.sleep(0)
+        with llm_priority(PRIORITY_BATCH):
+            batch = asyncio.ensure_future(sched.run(sender("batch"), "p"))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(sched.run(sender("interactive"), "p"))
+        await asyncio.gather(first, batch, interactive)
+
+    asyncio.run(main())
+    assert order == ["first", "interactive", "batch"]
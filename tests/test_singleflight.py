@@ -0,0 +1,66 @@
+"""
+test_singleflight.py - Concurrent calls with one key share one computation.
+"""
+import asyncio
+import pytest
+from app.cache.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight("test")
+    runs = []
+
+    async def compute(emit):
+        runs.append(1)
+        emit("stage", 1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        seen = []
+        results = await asyncio.gather(*(
+            flight.do("key", compute, lambda event, data: seen.append(event)) for _ in range(5)
+        ))
+        return results, seen
+
+    results, seen = asyncio.run(main())
+    assert runs == [1]
+    assert [value for value, _ in results] == ["value"] * 5
+    assert [shared for _, shared in results].count(False) == 1
+    assert seen == ["stage"] * 5          # late joiners replay the events
+
+
+def test_exception_reaches_every_waiter_and_is_not_kept():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fail(emit):
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        with pytest.raises(ValueError):
+            await flight.do("key", fail)
+
+    asyncio.run(main())
+    assert calls == [1, 1]
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    flight = SingleFlight("test")
+
+    async def compute(emit):
+        await asyncio.sleep(0.02)
+        return 42
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", compute))
+        second = asyncio.ensure_future(flight.do("key", compute))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == (42, True)
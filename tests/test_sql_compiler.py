@@ -0,0 +1,173 @@
+"""
+test_sql_compiler.py - Intent JSON compiled to BigQuery SQL, and the LLM fallback.
+"""
+import asyncio
+import pytest
+from app.schemas.schema_index import get_schema_index
+from app.services import NL2sql
+from app.services.sql_compiler import CompileError, compile_intent
+from app.validation.validator import validate_sql
+
+PATH = "`bigquery-public-data.thelook_ecommerce"
+
+
+def _compile(intent: dict) -> str:
+    sql = compile_intent(intent, get_schema_index())
+    assert validate_sql(sql, intent).is_valid
+    return sql
+
+
+def test_join_follows_the_foreign_key_path():
+    # users and products are only linked through order_items
+    sql = _compile({
+        "target_tables": ["users", "products"],
+        "selected_columns": {"users": ["country"], "products": ["category"]},
+    })
+    assert sql.splitlines()[1:] == [
+        f"FROM {PATH}.users` u",
+        f"JOIN {PATH}.order_items` oi ON u.id = oi.user_id",
+        f"JOIN {PATH}.products` p ON oi.product_id = p.id",
+    ]
+
+
+def test_fact_table_is_the_base_of_the_join():
+    sql = _compile({
+        "target_tables": ["products", "order_items"],
+        "selected_columns": {"products": ["category"]},
+        "aggregations": [{"function": "SUM", "table": "order_items", "column": "sale_price", "alias": "revenue"}],
+        "group_by": [{"table": "products", "column": "category"}],
+    })
+    assert f"FROM {PATH}.order_items` oi\nJOIN {PATH}.products` p ON oi.product_id = p.id" in sql
+
+
+def test_left_join_type_is_kept():
+    sql = _compile({
+        "target_tables": ["users", "orders"],
+        "selected_columns": {"users": ["email"], "orders": ["status"]},
+        "joins": [{"left_table": "users", "right_table": "orders", "join_type": "LEFT JOIN"}],
+    })
+    assert f"RIGHT JOIN {PATH}.users` u ON o.user_id = u.id" in sql
+
+
+def test_group_by_covers_the_selected_columns():
+    sql = _compile({
+        "target_tables": ["orders", "users"],
+        "selected_columns": {"users": ["country", "gender"]},
+        "aggregations": [{"function": "COUNT", "column": "*", "alias": "orders"}],
+        "group_by": [{"table": "users", "column": "country"}],
+    })
+    assert sql.startswith("SELECT u.country, u.gender, COUNT(*) AS orders\n")
+    assert "\nGROUP BY u.country, u.gender" in sql
+
+
+def test_aggregate_inputs_are_not_grouped():
+    sql = _compile({
+        "target_tables": ["order_items"],
+        "selected_columns": {"order_items": ["status", "sale_price"]},
+        "aggregations": [{"function": "AVG", "column": "sale_price"}],
+        "group_by": [{"column": "status"}],
+    })
+    assert "\nGROUP BY oi.status" in sql and sql.endswith("GROUP BY oi.status")
+    assert "AVG(oi.sale_price) AS avg_sale_price" in sql
+
+
+def test_aggregate_condition_becomes_having():
+    sql = _compile({
+        "target_tables": ["orders"],
+        "selected_columns": {"orders": ["user_id"]},
+        "aggregations": [{"function": "COUNT", "column": "*", "alias": "order_count"}],
+        "group_by": [{"column": "user_id"}],
+        "conditions": [{"column": "order_count", "operator": ">", "value": "5"},
+                       {"column": "status", "operator": "=", "value": "Complete"}],
+        "order_by": [{"column": "order_count", "direction": "desc"}],
+        "limit": 10,
+    })
+    assert sql.splitlines()[2:] == [
+        "WHERE o.status = 'Complete'",
+        "GROUP BY o.user_id",
+        "HAVING COUNT(*) > 5",
+        "ORDER BY order_count DESC",
+        "LIMIT 10",
+    ]
+
+
+def test_literals_are_quoted_and_escaped():
+    sql = _compile({
+        "target_tables": ["users"],
+        "selected_columns": {"users": ["email"]},
+        "conditions": [{"column": "last_name", "operator": "=", "value": "O'Brien\\"},
+                       {"column": "age", "operator": ">=", "value": "30"},
+                       {"column": "first_name", "operator": "LIKE", "value": "A%"}],
+    })
+    assert sql.endswith("WHERE u.last_name = 'O\\'Brien\\\\' AND u.age >= 30 AND u.first_name LIKE 'A%'")
+
+
+def test_temporal_literals():
+    sql = _compile({
+        "target_tables": ["orders"],
+        "selected_columns": {"orders": ["order_id"]},
+        "conditions": [{"column": "created_at", "operator": ">=", "value": "2024-01-01"},
+                       {"column": "created_at", "operator": "<", "value": "DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY)"}],
+    })
+    assert ("WHERE o.created_at >= TIMESTAMP '2024-01-01' "
+            "AND o.created_at < CAST(DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY) AS TIMESTAMP)") in sql
+
+
+def test_known_values_are_spelled_as_stored():
+    sql = _compile({
+        "target_tables": ["users"],
+        "selected_columns": {"users": ["email"]},
+        "conditions": [{"column": "country", "operator": "IN", "value": ["usa", "brazil"]},
+                       {"column": "gender", "operator": "=", "value": "female"}],
+    })
+    assert sql.endswith("WHERE u.country IN ('United States', 'Brasil') AND u.gender = 'F'")
+    # LIKE patterns are left as written
+    sql = _compile({
+        "target_tables": ["orders"],
+        "selected_columns": {"orders": ["order_id"]},
+        "conditions": [{"column": "status", "operator": "LIKE", "value": "complete%"}],
+    })
+    assert sql.endswith("WHERE o.status LIKE 'complete%'")
+
+
+@pytest.mark.parametrize("intent", [
+    {"target_tables": ["orders"], "aggregations": [{"function": "MEDIAN", "column": "num_of_item"}]},
+    {"target_tables": ["nope"]},
+    {"target_tables": ["orders"], "selected_columns": {"orders": ["nope"]}},
+    {"target_tables": ["users"], "conditions": [{"column": "age", "operator": ">", "value": "old"}]},
+    {"target_tables": ["orders", "order_items"], "selected_columns": {"orders": ["status"]},
+     "conditions": [{"column": "status", "operator": "=", "value": "Complete"}]},
+    {"target_tables": ["orders"], "order_by": [{"column": "status", "direction": "sideways"}]},
+])
+def test_what_cannot_be_rendered_raises(intent):
+    with pytest.raises(CompileError):
+        compile_intent(intent, get_schema_index())
+
+
+def test_compile_error_falls_back_to_the_llm(monkeypatch):
+    intent = {"is_relevant": True, "target_tables": ["orders"],
+              "aggregations": [{"function": "MEDIAN", "column": "num_of_item"}]}
+    llm_sql = f"SELECT APPROX_QUANTILES(o.num_of_item, 2)[OFFSET(1)] AS median FROM {PATH}.orders` o"
+    prompts = []
+
+    async def extract_intent_async(question, schema_text):
+        return intent
+
+    async def generate_sql_async(question, intent, schema_text, retry_hint="", temperature=0.1):
+        prompts.append(retry_hint)
+        return llm_sql
+
+    monkeypatch.setattr(NL2sql, "extract_intent_async", extract_intent_async)
+    monkeypatch.setattr(NL2sql, "generate_sql_async", generate_sql_async)
+    monkeypatch.setattr(NL2sql, "SQL_COMPILER_ENABLED", True)
+    monkeypatch.setattr(NL2sql, "SQL_CANDIDATES", 1)
+    monkeypatch.setattr(NL2sql, "COST_GATE_ENABLED", False)
+
+    index = get_schema_index()
+    result = {"attempts": 0, "llm_calls": 0, "intent": None, "sql": None, "validation": None,
+              "success": False, "message": "", "compiled": False, "repairs": [], "cost": None}
+    asyncio.run(NL2sql._run_two_stage("median items per order", index, index.schema_text, result, None))
+    assert result["success"] and not result["compiled"]
+    assert result["sql"] == llm_sql
+    assert prompts == [""]
+    assert result["llm_calls"] == 2
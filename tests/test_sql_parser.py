@@ -0,0 +1,35 @@
+"""
+test_sql_parser.py - canonical_sql, the cache key for generated SQL.
+"""
+from app.validation.sql_parser import canonical_sql
+
+TABLE = "`bigquery-public-data.thelook_ecommerce.orders`"
+
+
+def test_formatting_and_keyword_case_are_ignored():
+    a = f"SELECT o.status, COUNT(*) AS n FROM {TABLE} o GROUP BY o.status;"
+    b = f"select  o.status,\n  count(*) as n -- per status\nfrom {TABLE} o group by o.status"
+    assert canonical_sql(a) == canonical_sql(b)
+
+
+def test_table_alias_names_are_ignored():
+    a = f"SELECT o.status FROM {TABLE} o WHERE o.order_id > 5"
+    b = f"SELECT ord.status FROM {TABLE} AS ord WHERE ord.order_id > 5"
+    assert canonical_sql(a) == canonical_sql(b)
+
+
+def test_column_alias_spelling_is_kept():
+    explicit = [canonical_sql(f"SELECT COUNT(*) AS {alias} FROM {TABLE}") for alias in ("cnt", "CNT")]
+    implicit = [canonical_sql(f"SELECT COUNT(*) {alias} FROM {TABLE}") for alias in ("cnt", "CNT")]
+    assert explicit[0] != explicit[1]
+    assert implicit[0] != implicit[1]
+
+
+def test_literals_are_kept():
+    a = f"SELECT * FROM {TABLE} WHERE status = 'Shipped'"
+    b = f"SELECT * FROM {TABLE} WHERE status = 'shipped'"
+    assert canonical_sql(a) != canonical_sql(b)
+
+
+def test_unparsable_sql_keeps_identifier_spelling():
+    assert canonical_sql("SELEC cnt FROM t") != canonical_sql("SELEC CNT FROM t")
@@ -0,0 +1,67 @@
+"""
+test_stream_answer.py - /ask/stream events and its result cache entries.
+"""
+import asyncio
+import json
+import pytest
+from app.endpoints import api
+from app.cache.result_cache import MemoryResultStore, ResultCache
+
+SQL = "SELECT id FROM users"
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    queries = []
+
+    async def process_question_async(question, on_event=None, mode=None):
+        on_event("sql", {"sql": SQL})
+        return {"question": question, "intent": {}, "sql": SQL, "validation": {}, "success": True,
+                "message": "", "attempts": 1}
+
+    def iter_bigquery_pages(sql):
+        queries.append(sql)
+        yield ["id"], [{"id": 1}, {"id": 2}]
+        yield ["id"], [{"id": 3}]
+
+    cache = ResultCache(MemoryResultStore(1 << 20), ttl=60, max_entry_bytes=1 << 20, compress=False)
+    monkeypatch.setattr(api, "process_question_async", process_question_async)
+    monkeypatch.setattr(api, "iter_bigquery_pages", iter_bigquery_pages)
+    monkeypatch.setattr(api, "result_cache", cache)
+
+    def run():
+        async def collect():
+            return [json.loads(line) async for line in api._stream_answer("q", "ndjson")]
+        return asyncio.run(collect())
+
+    run.queries = queries
+    run.cache = cache
+    return run
+
+
+def test_events_then_rows_page_by_page(stream):
+    events = stream()
+    assert [event["event"] for event in events] == ["sql", "result", "columns", "rows", "rows", "done"]
+    assert events[-1]["data"] == {"row_count": 3, "result_cache_hit": False}
+
+
+def test_streamed_result_is_cached_and_replayed(stream):
+    stream()
+    again = stream()
+    assert len(stream.queries) == 1
+    assert again[-1]["data"] == {"row_count": 3, "result_cache_hit": True}
+    assert [row["id"] for event in again if event["event"] == "rows" for row in event["data"]] == [1, 2, 3]
+    assert stream.cache.stats()["hits"] == 1 and stream.cache.stats()["misses"] == 1
+
+
+def test_whole_result_entry_is_shared_with_ask(stream):
+    stream()
+    cached = stream.cache.get(api._engine_sql(SQL), api.RESULT_DATASET, "rows", page_size=None)
+    assert cached["row_count"] == 3 and cached["columns"] == ["id"]
+
+
+def test_results_over_the_entry_limit_are_not_kept(stream):
+    stream.cache.max_entry_bytes = 10
+    stream()
+    stream()
+    assert len(stream.queries) == 2
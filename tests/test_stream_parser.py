@@ -0,0 +1,58 @@
+"""
+test_stream_parser.py - Where the incremental scanners end an answer, whatever
+the chunking of the stream.
+"""
+import json
+import pytest
+from app.llm.stream_parser import JsonObjectScanner, SqlStatementScanner, scan_text
+
+CHUNK_SIZES = (1, 2, 3, 7, 1000)
+
+
+def _feed(scanner, text: str, size: int) -> bool:
+    for i in range(0, len(text), size):
+        if scanner.feed(text[i:i + size]):
+            return True
+    return False
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_json_object_ignores_fences_and_trailing_text(size):
+    obj = {"is_relevant": True, "a": "x, } ] \" {", "b": [1, {"c": 2}], "d": None}
+    text = "```json\n" + json.dumps(obj) + "\n```\nThis is the intent. {not json}"
+    scanner = JsonObjectScanner()
+    assert _feed(scanner, text, size)
+    assert json.loads(scanner.result()) == obj
+    assert scanner.fields == obj
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_json_stop_when_ends_after_a_member(size):
+    text = json.dumps({"is_relevant": False, "irrelevance_reason": "weather, not sales", "target_tables": []})
+    scanner = JsonObjectScanner(lambda f: f.get("is_relevant") is False and "irrelevance_reason" in f)
+    assert _feed(scanner, text, size)
+    assert scanner.stopped_early
+    assert json.loads(scanner.result()) == {"is_relevant": False, "irrelevance_reason": "weather, not sales"}
+
+
+def test_incomplete_json_returns_all_text():
+    scanner = JsonObjectScanner()
+    assert not scanner.feed('{"a": 1')
+    assert scanner.result() == '{"a": 1'
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+@pytest.mark.parametrize("text, statement", [
+    ("SELECT 1;\n\nThis query", "SELECT 1;"),
+    ("```sql\nSELECT 'a;b' AS x -- c;d\nFROM `p.d.t`; SELECT 2", "SELECT 'a;b' AS x -- c;d\nFROM `p.d.t`;"),
+    ('```sql\nSELECT "x\\";" /* ; */ FROM t\n```\nExplanation; more', 'SELECT "x\\";" /* ; */ FROM t'),
+    ("SELECT 'it''s' ; x", "SELECT 'it''s' ;"),
+    ("SELECT a - b FROM t", "SELECT a - b FROM t"),
+    ("  SELECT 1 / 2 FROM t;", "SELECT 1 / 2 FROM t;"),
+    ("", ""),
+])
+def test_sql_statement_end(size, text, statement):
+    scanner = SqlStatementScanner()
+    _feed(scanner, text, size)
+    assert scanner.result() == statement
+    assert scan_text(SqlStatementScanner(), text) == statement
@@ -0,0 +1,111 @@
+"""
+test_validator.py - validate_sql: statement shape, schema references and scopes.
+"""
+import pytest
+from app.validation.validator import validate_sql
+
+ORDERS = "`bigquery-public-data.thelook_ecommerce.orders`"
+USERS = "`bigquery-public-data.thelook_ecommerce.users`"
+ITEMS = "`bigquery-public-data.thelook_ecommerce.order_items`"
+
+
+def _errors(sql: str, intent: dict = None) -> list:
+    result = validate_sql(sql, intent or {})
+    assert result.is_valid == (not result.errors)
+    return result.errors
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM orders",
+    "DROP TABLE orders",
+    "UPDATE orders SET status = 'x'",
+    "INSERT INTO orders VALUES (1)",
+    f"INSERT INTO orders SELECT * FROM {ORDERS}",
+    f"DELETE FROM {ORDERS} WHERE order_id IN (SELECT o.order_id FROM {ORDERS} o)",
+])
+def test_dml_and_ddl_are_rejected(sql):
+    assert _errors(sql)
+
+
+@pytest.mark.parametrize("second", ["DROP TABLE orders", f"SELECT 1 FROM {ORDERS}"])
+def test_multiple_statements_are_rejected(second):
+    errors = _errors(f"SELECT o.status FROM {ORDERS} o; {second}")
+    assert errors and "after the end of the query" in errors[0]
+
+
+def test_trailing_semicolon_is_accepted():
+    assert _errors(f"SELECT o.status FROM {ORDERS} o;") == []
+
+
+def test_unknown_table():
+    assert _errors("SELECT x FROM nope") == ["Table 'nope' does not exist in schema."]
+
+
+def test_unknown_column():
+    assert _errors(f"SELECT o.nope FROM {ORDERS} o") == ["Column 'nope' does not exist in table 'orders'."]
+    errors = _errors(f"SELECT o.status FROM {ORDERS} o JOIN {USERS} u ON u.id = o.user_id WHERE u.nope = 1")
+    assert errors == ["Column 'nope' does not exist in table 'users'."]
+
+
+def test_unknown_qualifier():
+    assert _errors(f"SELECT u.id FROM {ORDERS} o") == ["Unknown table 'u' in column reference 'u.id'."]
+
+
+def test_intent_table_missing_from_sql():
+    errors = _errors(f"SELECT o.status FROM {ORDERS} o", {"target_tables": ["users"]})
+    assert errors == ["Intent specified table 'users' but it is missing from the SQL."]
+
+
+def test_cte_columns_resolve_to_the_cte():
+    sql = (
+        f"WITH t AS (SELECT o.user_id, COUNT(*) AS n FROM {ORDERS} o GROUP BY o.user_id) "
+        f"SELECT t.n, u.email FROM t JOIN {USERS} u ON u.id = t.user_id"
+    )
+    assert _errors(sql) == []
+
+
+def test_subquery_alias_resolves_in_the_outer_scope():
+    assert _errors(f"SELECT s.n FROM (SELECT COUNT(*) AS n FROM {ORDERS}) s") == []
+
+
+def test_inner_aliases_are_not_visible_outside():
+    errors = _errors(f"SELECT o.status FROM (SELECT x.status FROM {ORDERS} x) s")
+    assert errors == ["Unknown table 'o' in column reference 'o.status'."]
+    errors = _errors(f"WITH t AS (SELECT o.user_id FROM {ORDERS} o) SELECT o.user_id FROM t")
+    assert errors == ["Unknown table 'o' in column reference 'o.user_id'."]
+
+
+def test_aliases_resolve_per_scope():
+    # The same alias names a different table inside the subquery
+    sql = (
+        f"SELECT o.status FROM {ORDERS} o "
+        f"WHERE o.user_id IN (SELECT o.user_id FROM {ITEMS} o WHERE o.sale_price > 10)"
+    )
+    assert _errors(sql) == []
+
+
+def test_table_name_as_qualifier():
+    assert _errors(f"SELECT orders.status FROM {ORDERS}") == []
+
+
+def test_missing_group_by_column():
+    errors = _errors(f"SELECT o.status, o.user_id, COUNT(*) FROM {ORDERS} o GROUP BY o.status")
+    assert errors == ["Column 'o.user_id' in SELECT must appear in GROUP BY or inside an aggregate function."]
+
+
+def test_bigquery_date_functions_are_accepted():
+    sql = (
+        "SELECT FORMAT_DATE('%Y-%m', DATE(o.created_at)) AS month, "
+        "DATE_TRUNC(DATE(o.created_at), MONTH) AS start, "
+        "TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), o.created_at, HOUR) AS age_hours "
+        f"FROM {ORDERS} o "
+        "WHERE o.created_at >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY) "
+        "AND EXTRACT(YEAR FROM o.created_at) = 2024"
+    )
+    assert _errors(sql) == []
+
+
+def test_backticked_paths_resolve_to_schema_tables():
+    sql = f"SELECT o.status, u.country FROM {ORDERS} AS o JOIN {USERS} AS u ON u.id = o.user_id"
+    assert _errors(sql) == []
+    assert _errors("SELECT x.a FROM `bigquery-public-data.thelook_ecommerce.nope` x")